@@ -0,0 +1,175 @@
+"""Asynchronous successive halving (ASHA) of experiments in dlexd
+
+Experiments with an 'asha' hyperparam are compared at rung epochs with the
+other experiments of their group: their sweep, or their definition if they
+aren't part of one. Rungs are at `min_epochs * reduction ** k` epochs (below
+`max_epochs`, if given). When an experiment reaches a rung, its loss (in
+dlexd, its mean loss over the epoch that brought it there) is recorded there,
+and it continues only if it is in the best `1 / reduction` of the losses
+recorded at that rung so far; otherwise it is stopped. The first `min_results`
+experiments to reach a rung always continue, as there is nothing to compare
+them with yet.
+
+A stopped experiment is either terminated, or paused: its runner
+checkpoints and exits, freeing its cores, and it is resumed from that
+checkpoint (see the 'checkpoint' hyperparam) if later results put it in the
+best `1 / reduction` of its rung. Every decision is logged in DLEXDB, which
+is also where the rungs are read back from when dlexd restarts.
+
+example:
+    {'asha': {'min_epochs': 1, 'reduction': 3, 'action': 'pause'}}
+"""
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple, Union # pylint: disable=unused-import
+
+
+class ASHAPolicy(object):
+    """The rungs of an experiment, and what happens to it when it loses
+
+    Args:
+        min_epochs: the epoch of the first rung
+        reduction: the ratio between rungs, and the inverse of the fraction
+            of experiments that continue at each rung
+        max_epochs: no rung is at or beyond this epoch
+        action: 'terminate' or 'pause' losing experiments
+        min_results: the number of results a rung needs before experiments
+            are stopped there (default: `reduction`)
+    """
+    def __init__(self, min_epochs=1, reduction=3, max_epochs=None, action='terminate', # pylint: disable=too-many-arguments
+                 min_results=None):
+        if min_epochs < 1 or reduction < 2:
+            raise ValueError('ASHA needs min_epochs >= 1 and reduction >= 2')
+        if action not in ['terminate', 'pause']:
+            raise ValueError('unknown ASHA action %s' % action)
+        self.min_epochs = min_epochs
+        self.reduction = reduction
+        self.max_epochs = max_epochs
+        self.action = action
+        self.min_results = min_results if min_results is not None else reduction
+
+    @classmethod
+    def from_hyperparams(cls, hyperparams):
+        # type: (Dict[str, Any]) -> Union[None, ASHAPolicy]
+        """Read the policy from the 'asha' hyperparam, or return None if the
+        experiment isn't early-stopped."""
+        if 'asha' not in hyperparams:
+            return None
+        return cls(**hyperparams['asha'])
+
+    def rung(self, epoch):
+        # type: (int) -> Union[None, int]
+        """The index of the rung at `epoch`, or None if there's none"""
+        if self.max_epochs is not None and epoch >= self.max_epochs:
+            return None
+        rung = 0
+        rung_epoch = self.min_epochs
+        while rung_epoch < epoch:
+            rung += 1
+            rung_epoch *= self.reduction
+        return rung if rung_epoch == epoch else None
+
+
+class ASHA(object):
+    """Records rung results and decides which experiments continue
+
+    Args:
+        ddb: the DLEXDB holding the experiments and the decision log
+        stop: called as stop(exp_id, paused) to stop an experiment
+        resume: called as resume(exp_id, priority) to queue a paused
+            experiment again
+        lock: held around every use of `ddb`, which may be shared
+        writer: if given, a metrics.MetricWriter that logs the decisions,
+            so that `epoch` doesn't wait on the disk
+    """
+    def __init__(self, ddb, stop, resume, lock, writer=None): # pylint: disable=too-many-arguments
+        self.ddb = ddb
+        self.stop = stop
+        self.resume = resume
+        self.lock = lock
+        self.writer = writer
+        # (group, rung) -> {exp_id: loss}
+        self.results = defaultdict(dict) # type: Dict[Tuple[str, int], Dict[int, float]]
+        # (group, rung) -> the experiments paused there
+        self.paused = defaultdict(set) # type: Dict[Tuple[str, int], set]
+        # exp_id -> (policy, group, priority), or None without a policy
+        self.experiments = {} # type: Dict[int, Any]
+        with self.lock:
+            decisions = self.ddb.get_asha_decisions()
+        for decision in decisions:
+            key = (decision['group'], decision['rung'])
+            if decision['decision'] in ['promote', 'terminate', 'pause']:
+                self.results[key][decision['exp_id']] = decision['loss']
+            if decision['decision'] == 'pause':
+                self.paused[key].add(decision['exp_id'])
+            elif decision['decision'] == 'resume':
+                self.paused[key].discard(decision['exp_id'])
+
+    def _experiment(self, exp_id):
+        if exp_id not in self.experiments:
+            with self.lock:
+                exp = self.ddb.get_experiment(exp_id)
+            policy = ASHAPolicy.from_hyperparams(exp['hyperparams']) if exp is not None else None
+            if policy is None:
+                self.experiments[exp_id] = None
+            else:
+                if exp['sweep_id'] is not None:
+                    group = 'sweep:%d' % exp['sweep_id']
+                else:
+                    group = 'definition:%d' % exp['def_id']
+                self.experiments[exp_id] = (policy, group, exp['priority'] or 0)
+        return self.experiments[exp_id]
+
+    def _log(self, exp_id, key, epoch, loss, decision): # pylint: disable=too-many-arguments
+        row = (exp_id, key[0], key[1], epoch, loss, decision, time.time())
+        if self.writer is not None:
+            self.writer.after_write(lambda ddb: ddb.insert_asha_decision(*row))
+            return
+        with self.lock:
+            self.ddb.insert_asha_decision(*row)
+
+    def _best(self, policy, results):
+        """The experiments in the best 1 / reduction of `results`"""
+        ranked = sorted(results, key=lambda exp_id: (results[exp_id], exp_id))
+        return set(ranked[:len(ranked) // policy.reduction])
+
+    def epoch(self, exp_id, epoch, loss):
+        # type: (int, int, Union[None, float]) -> List[Tuple[int, str]]
+        """Record that an experiment reached `epoch` with `loss`, and stop or
+        resume experiments accordingly
+
+        Returns:
+            The decisions made, as (exp_id, 'promote', 'terminate', 'pause'
+            or 'resume') tuples
+        """
+        experiment = self._experiment(exp_id)
+        if experiment is None or loss is None:
+            return []
+        (policy, group, _) = experiment
+        rung = policy.rung(epoch)
+        if rung is None:
+            return []
+        key = (group, rung)
+        if exp_id in self.results[key]:
+            # resumed from the checkpoint taken at this rung
+            return []
+        results = self.results[key]
+        results[exp_id] = loss
+        best = self._best(policy, results)
+        if len(results) <= policy.min_results or exp_id in best:
+            decision = 'promote'
+        else:
+            decision = policy.action
+        self._log(exp_id, key, epoch, loss, decision)
+        decisions = [(exp_id, decision)]
+        if decision != 'promote':
+            if decision == 'pause':
+                self.paused[key].add(exp_id)
+            self.stop(exp_id, decision == 'pause')
+        for paused_id in sorted(self.paused[key] & best):
+            self.paused[key].discard(paused_id)
+            self._log(paused_id, key, epoch, results[paused_id], 'resume')
+            decisions.append((paused_id, 'resume'))
+            # ahead of the experiments that haven't reached this rung
+            self.resume(paused_id, self._experiment(paused_id)[2] + 1)
+        return decisions
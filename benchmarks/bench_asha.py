@@ -0,0 +1,93 @@
+"""Simulation of a sweep with and without early stopping (see asha.py)
+
+Runs a sweep of configurations with random learning curves on a fixed
+number of cores, one epoch per time unit, first training every
+configuration for all its epochs, then with ASHA terminating or pausing the
+losing ones. Reports when a configuration within 1% of the best final loss
+finished training, and the core time spent.
+
+usage: python benchmarks/bench_asha.py [configurations] [cores] [epochs]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import asha # pylint: disable=wrong-import-position
+import db # pylint: disable=wrong-import-position
+
+
+def curves(configurations, seed=0):
+    """(final loss, decay rate, noise) of each configuration"""
+    rng = random.Random(seed)
+    return [(rng.uniform(0.1, 1.0), rng.uniform(0.5, 1.0), rng.uniform(0.0, 0.02))
+            for _ in range(configurations)]
+
+def loss(curve, epoch, rng):
+    (final, rate, noise) = curve
+    return final * (1 + 2.0 / (1 + rate * epoch)) + rng.gauss(0, noise)
+
+def simulate(configurations, cores, epochs, action=None): # pylint: disable=too-many-locals
+    """Returns (the time a good configuration finished, core time used)"""
+    rng = random.Random(1)
+    curve_of = {}
+    directory = tempfile.mkdtemp()
+    ddb = db.DLEXDB(os.path.join(directory, 'asha.db'))
+    ddb.insert_definition('sim', '/sim.py')
+    hyperparams = {} if action is None else {
+        'asha': {'min_epochs': 1, 'reduction': 3, 'max_epochs': epochs, 'action': action}}
+    (_, exp_ids) = ddb.create_sweep('sim', {}, [hyperparams] * configurations)
+    for exp_id, curve in zip(exp_ids, curves(configurations)):
+        curve_of[exp_id] = curve
+    target = min(curve[0] for curve in curve_of.values()) * 1.01
+
+    queue = list(exp_ids)
+    progress = dict.fromkeys(exp_ids, 0)
+    stopped = set()
+    def stop(exp_id, paused): # pylint: disable=unused-argument
+        stopped.add(exp_id)
+    def resume(exp_id, priority): # pylint: disable=unused-argument
+        queue.insert(0, exp_id)
+    policy = asha.ASHA(ddb, stop, resume, threading.Lock())
+
+    running = []
+    time = 0
+    core_time = 0
+    while queue != [] or running != []:
+        while len(running) < cores and queue != []:
+            running.append(queue.pop(0))
+        time += 1
+        core_time += len(running)
+        for exp_id in list(running):
+            progress[exp_id] += 1
+            policy.epoch(exp_id, progress[exp_id], loss(curve_of[exp_id], progress[exp_id], rng))
+            if exp_id in stopped:
+                stopped.discard(exp_id)
+                running.remove(exp_id)
+            elif progress[exp_id] == epochs:
+                running.remove(exp_id)
+                if curve_of[exp_id][0] <= target:
+                    ddb.close()
+                    shutil.rmtree(directory)
+                    return (time, core_time)
+    ddb.close()
+    shutil.rmtree(directory)
+    return (None, core_time)
+
+def main():
+    configurations = int(sys.argv[1]) if len(sys.argv) > 1 else 243
+    cores = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    epochs = int(sys.argv[3]) if len(sys.argv) > 3 else 27
+    print('%d configurations, %d cores, %d epochs' % (configurations, cores, epochs))
+    print('  %-20s %20s %15s' % ('policy', 'time to a good one', 'core time'))
+    for (name, action) in [('none', None), ('asha terminate', 'terminate'),
+                           ('asha pause', 'pause')]:
+        (time, core_time) = simulate(configurations, cores, epochs, action)
+        print('  %-20s %20s %15d' % (name, time, core_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark for the cold start of dlex commands
+
+Starts dlexd with a few definitions, experiments and sweeps, then runs each
+read-only dlex command in a fresh interpreter, as scripts polling `dlex
+status` do. Reports the wall time of each command, the time its imports take
+(from `python -X importtime`, which is run separately, as it slows imports
+down) and the modules whose imports take longest. `python -c pass` is the
+floor.
+
+usage: python benchmarks/bench_cli_startup.py [runs]
+"""
+import os
+import re
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import db # pylint: disable=wrong-import-position
+import unix_rpc # pylint: disable=wrong-import-position
+
+COMMANDS = [['list'], ['status'], ['sweep', 'list'], ['sweep', 'status', '1'],
+            ['datasets', 'list']]
+
+# import time: self [us] | cumulative | module, indented by nesting
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def imports(stderr):
+    """The (cumulative µs, module) of the top-level imports in -X importtime
+    output, slowest first"""
+    top_level = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is not None and match.group(3) == '':
+            top_level.append((int(match.group(2)), match.group(4)))
+    return sorted(top_level, reverse=True)
+
+
+def start(directory):
+    socket_path = os.path.join(directory, 'dlexd.sock')
+    ddb = db.DLEXDB(os.path.join(directory, 'test.db'))
+    for i in range(10):
+        ddb.insert_definition('def%d' % i, '/defs/def%d.py' % i)
+        ddb.insert_dataset('data%d' % i, '/data/data%d' % i)
+        ddb.create_sweep('def%d' % i, {}, [{'lr': j} for j in range(10)])
+    ddb.close()
+    dlexd = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'dlexd'), '-s', socket_path,
+         '-p', os.path.join(directory, 'dlexd.pid'), '--zygotes', '0'],
+        cwd=directory, stdout=subprocess.DEVNULL)
+    while True:
+        try:
+            unix_rpc.Client(socket_path).close()
+            return (dlexd, socket_path)
+        except OSError:
+            time.sleep(0.01)
+
+
+def bench(directory, socket_path, command, runs):
+    """Returns (the median wall time in ms, the median import time in ms,
+    the slowest imports of the last run)"""
+    if command is None:
+        argv = [sys.executable, '-c', 'pass']
+    else:
+        argv = [sys.executable, os.path.join(ROOT, 'dlex'), '-s', socket_path] + command
+    walls = []
+    import_times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(argv, cwd=directory, stdout=subprocess.DEVNULL, check=True)
+        walls.append((time.perf_counter() - start_time) * 1000)
+        profile = subprocess.run(
+            argv[:1] + ['-X', 'importtime'] + argv[1:], cwd=directory,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        top_level = imports(profile.stderr.decode())
+        import_times.append(sum(us for (us, _) in top_level) / 1000)
+    return (statistics.median(walls), statistics.median(import_times), top_level[:3])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    directory = tempfile.mkdtemp()
+    (dlexd, socket_path) = start(directory)
+    try:
+        print('%d runs, ms' % runs)
+        print('  %-22s %8s %8s  %s' % ('command', 'wall', 'imports', 'slowest imports'))
+        for command in [None] + COMMANDS:
+            (wall, import_time, slowest) = bench(directory, socket_path, command, runs)
+            print('  %-22s %8.1f %8.1f  %s' % (
+                'python -c pass' if command is None else ' '.join(command), wall,
+                import_time, ', '.join('%s %.1f' % (name, us / 1000) for (us, name) in slowest)))
+    finally:
+        dlexd.send_signal(signal.SIGTERM)
+        dlexd.wait()
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
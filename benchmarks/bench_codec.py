@@ -0,0 +1,100 @@
+"""Micro-benchmark for the unix_rpc codecs and frame receive path
+
+Compares the JSON and binary codecs on typical `set_loss` traffic and on a
+multi-megabyte status payload, and compares reading a large frame with the
+old grow-by-`+=` loop against `unix_rpc.FrameReader`.
+
+usage: python benchmarks/bench_codec.py
+"""
+import array
+import os
+import random
+import socket
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import codec # pylint: disable=wrong-import-position
+import unix_rpc # pylint: disable=wrong-import-position
+
+
+def set_loss_message():
+    return ['rpc', 1234, 'set_loss', [17, 0.6931471805599453], {}]
+
+def status_message(experiments=2000, history=200):
+    rand = random.Random(0)
+    return ['return', 7, [{
+        'id': exp_id,
+        'status': 'experiment running',
+        'epoch': rand.randint(0, 100),
+        'pid': rand.randint(1000, 60000),
+        'loss': array.array('d', (rand.random() for _ in range(history))),
+        'position': array.array('q', range(history)),
+    } for exp_id in range(experiments)]]
+
+def json_compatible(msg):
+    """Replace typed arrays by lists, which is what JSON would have to send"""
+    if isinstance(msg, list):
+        return [json_compatible(item) for item in msg]
+    elif isinstance(msg, dict):
+        return {key: json_compatible(value) for key, value in msg.items()}
+    elif isinstance(msg, array.array):
+        return msg.tolist()
+    return msg
+
+def bench_codecs(name, msg, number):
+    print('%s (%d iterations)' % (name, number))
+    print('  %-8s %12s %14s %14s' % ('codec', 'bytes/msg', 'encode us/msg', 'decode us/msg'))
+    for msg_codec, payload in [(codec.JSON, json_compatible(msg)), (codec.BINARY, msg)]:
+        encoded = msg_codec.encode(payload)
+        encode = timeit.timeit(lambda: msg_codec.encode(payload), number=number)
+        decode = timeit.timeit(lambda: msg_codec.decode(memoryview(encoded)), number=number)
+        print('  %-8s %12d %14.2f %14.2f' % (
+            type(msg_codec).__name__, len(encoded),
+            encode / number * 1e6, decode / number * 1e6))
+
+def legacy_recv(sock, length):
+    """The receive loop unix_rpc used before FrameReader (made to stop at the
+    frame boundary, so that consecutive frames can be read)"""
+    buff = sock.recv(min(1024, length))
+    while len(buff) < length:
+        buff += sock.recv(min(1024, length - len(buff)))
+    return buff
+
+def bench_recv(size, number):
+    print('receiving a %d byte frame (%d iterations)' % (size, number))
+    payload = b'x' * size
+    for name in ['legacy +=', 'FrameReader']:
+        if name == 'legacy +=':
+            # the legacy loop is quadratic, so give it fewer iterations
+            count = max(1, number // 5)
+        else:
+            count = number
+        left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        reader = unix_rpc.FrameReader(right)
+
+        def send():
+            for _ in range(count):
+                unix_rpc.msg_send(left, payload, codec.BINARY)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        if name == 'FrameReader':
+            elapsed = timeit.timeit(reader.read, number=count)
+        else:
+            frame_size = unix_rpc.HEADER.size + len(codec.BINARY.encode(payload))
+            elapsed = timeit.timeit(lambda: legacy_recv(right, frame_size), number=count)
+        sender.join()
+        left.close()
+        right.close()
+        print('  %-12s %10.2f ms/frame' % (name, elapsed / count * 1e3))
+
+def main():
+    bench_codecs('set_loss request', set_loss_message(), 100000)
+    bench_codecs('status reply', status_message(), 5)
+    bench_recv(2 * 1024 * 1024, 10)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark for DLEXDB open, insert and query latency
+
+Builds a database with many experiments, then times opening it, inserting
+experiments and the queries the CLI and dlexd make. Runs twice: once with the
+configuration DLEXDB used before schema versioning (rollback journal,
+synchronous=FULL, no foreign key indexes, and the four sqlite_master lookups
+on every open), and once with the current one.
+
+usage: python benchmarks/bench_db.py [experiments]
+"""
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db # pylint: disable=wrong-import-position
+
+DEFINITIONS = 100
+
+
+def legacy_open(path):
+    """What opening a DLEXDB cost before schema versioning"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    for table in ['definitions', 'experiments', 'checkpoints', 'datasets']:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        cursor.fetchall()
+    return conn
+
+def make_legacy(path):
+    """Turn a current database into one configured like before"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("DROP INDEX experiments_definition_id")
+    conn.execute("DROP INDEX checkpoints_experiment_id")
+    conn.commit()
+    conn.close()
+
+def populate(path, experiments):
+    ddb = db.DLEXDB(path)
+    for i in range(DEFINITIONS):
+        ddb.insert_definition('def%d' % i, '/defs/def%d.py' % i)
+    with ddb.conn:
+        ddb.conn.executemany(
+            "INSERT INTO experiments (definition_id, hyperparams) VALUES (?, ?)",
+            ((i % DEFINITIONS + 1, '{"lr": 0.1}') for i in range(experiments)))
+        ddb.conn.executemany(
+            "INSERT INTO checkpoints (experiment_id) VALUES (?)",
+            ((i + 1,) for i in range(experiments)))
+    ddb.close()
+
+def timed(function, number):
+    """Median wall time of `function` in milliseconds"""
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def bench(path, legacy, experiments):
+    if legacy:
+        open_db = lambda: legacy_open(path).close()
+    else:
+        open_db = lambda: db.DLEXDB(path).close()
+    ddb = db.DLEXDB(path)
+    conn = ddb.conn
+    if legacy:
+        conn.execute("PRAGMA synchronous=FULL")
+
+    results = {'open': timed(open_db, 50)}
+    results['create_experiment'] = timed(lambda: ddb.create_experiment('def7', {}), 200)
+    results['get_experiment'] = timed(
+        lambda: ddb.get_experiment(experiments // 2), 200)
+    results['experiments of a definition'] = timed(lambda: conn.execute(
+        "SELECT id FROM experiments WHERE definition_id=?", (7,)).fetchall(), 20)
+    results['checkpoints of an experiment'] = timed(lambda: conn.execute(
+        "SELECT id FROM checkpoints WHERE experiment_id=?", (experiments // 2,)).fetchall(), 20)
+    results['get_status (all)'] = timed(ddb.get_status, 5)
+    ddb.close()
+    return results
+
+def main():
+    experiments = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+    current = os.path.join(directory, 'current.db')
+    legacy = os.path.join(directory, 'legacy.db')
+    populate(current, experiments)
+    populate(legacy, experiments)
+    make_legacy(legacy)
+
+    before = bench(legacy, True, experiments)
+    after = bench(current, False, experiments)
+    print('%d experiments, median ms' % experiments)
+    print('  %-30s %10s %10s' % ('operation', 'before', 'after'))
+    for name in before:
+        print('  %-30s %10.3f %10.3f' % (name, before[name], after[name]))
+
+if __name__ == '__main__':
+    main()
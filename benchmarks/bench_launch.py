@@ -0,0 +1,114 @@
+"""Benchmark for the latency of starting an experiment
+
+Starts dlexd, then times from `Client.run` to the first training step
+reported by the experiment, for experiments started by forking dlexd
+(--zygotes 0) and from a warm zygote (see zygote.py). The experiment's
+definition imports the preloaded modules, as a real one imports its
+framework.
+
+usage: python benchmarks/bench_launch.py [runs] [preload, e.g. numpy,torch]
+"""
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import client # pylint: disable=wrong-import-position
+import unix_rpc # pylint: disable=wrong-import-position
+
+DEFINITION = '''
+import time
+from dlex import Experiment
+%s
+
+class Bench(Experiment):
+    def __init__(self):
+        super(Bench, self).__init__(None, None, None, epochs=10 ** 9)
+        self.position = 0
+
+    def epochs_left(self):
+        return self.epochs - self.current_epoch
+
+    def train(self):
+        while True:
+            time.sleep(0.001)
+            yield True
+'''
+
+
+def wait_for(subscriber, updates, exp_id, field, value=None):
+    """Read updates until `field` of `exp_id` is set (to `value`, if given)"""
+    while True:
+        update = updates.get(exp_id, {})
+        if field in update and update[field] is not None and (
+                value is None or update[field] == value):
+            return
+        if not subscriber.handle_message():
+            raise RuntimeError('dlexd exited')
+
+
+def bench(directory, runs, zygotes, preload):
+    socket_path = os.path.join(directory, 'dlexd.sock')
+    updates = {}
+    def update(exp_id, fields):
+        updates.setdefault(exp_id, {}).update(fields)
+    dlexd = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'dlexd'), '-s', socket_path,
+         '-p', os.path.join(directory, 'dlexd.pid'), '--zygotes', str(zygotes),
+         '--preload', ','.join(preload)],
+        cwd=directory, stdout=subprocess.DEVNULL)
+    try:
+        subscriber = None
+        while subscriber is None:
+            try:
+                subscriber = unix_rpc.Client(socket_path, handlers={'update': update})
+            except OSError:
+                time.sleep(0.01)
+        definition = os.path.join(directory, 'bench.py')
+        with open(definition, 'w') as definition_file:
+            definition_file.write(DEFINITION % '\n'.join('import ' + name for name in preload))
+        cli = client.Client(os.path.join(directory, 'test.db'), socket_path,
+                            cache_root=os.path.join(directory, 'cache'))
+        cli.add('bench', definition)
+        subscriber.subscribe()
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            exp_id = cli.run('bench', {})
+            wait_for(subscriber, updates, exp_id, 'step')
+            times.append((time.perf_counter() - start) * 1000)
+            subscriber.terminate([exp_id])
+            wait_for(subscriber, updates, exp_id, 'status', 'done')
+        subscriber.close()
+        cli.close()
+        return times
+    finally:
+        dlexd.send_signal(signal.SIGTERM)
+        dlexd.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    preload = [name for name in (sys.argv[2] if len(sys.argv) > 2 else '').split(',')
+               if name != '']
+    print('%d runs, preload: %s, ms from run to the first step' % (
+        runs, ', '.join(preload) or 'nothing'))
+    print('  %-20s %10s %10s %10s' % ('launcher', 'median', 'min', 'max'))
+    for (name, zygotes) in [('spawner', 0), ('zygote', 1)]:
+        directory = tempfile.mkdtemp()
+        try:
+            times = bench(directory, runs, zygotes, preload)
+        finally:
+            shutil.rmtree(directory)
+        print('  %-20s %10.1f %10.1f %10.1f' % (
+            name, statistics.median(times), min(times), max(times)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark for persisting metrics to SQLite
+
+Compares committing every metric row on its own with buffering them in a
+metrics.MetricWriter, and measures how long `MetricWriter.write` (the part
+that runs on the RPC loop) takes.
+
+usage: python benchmarks/bench_metric_writer.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db # pylint: disable=wrong-import-position
+import metrics # pylint: disable=wrong-import-position
+
+
+def bench_row_per_commit(path, rows):
+    ddb = db.DLEXDB(path)
+    start = time.perf_counter()
+    for step in range(rows):
+        ddb.insert_metrics([(1, 'loss', step, 0, time.time(), 0.5)])
+    elapsed = time.perf_counter() - start
+    ddb.close()
+    return elapsed
+
+def bench_writer(path, rows):
+    writer = metrics.MetricWriter(path)
+    writer.start()
+    start = time.perf_counter()
+    for step in range(rows):
+        writer.write(1, 'loss', step, 0, 0.5)
+    enqueued = time.perf_counter() - start
+    writer.close()
+    return enqueued, time.perf_counter() - start
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+
+    committed = min(rows, 2000)
+    elapsed = bench_row_per_commit(os.path.join(directory, 'commit.db'), committed)
+    print('commit per row:  %10.0f rows/s' % (committed / elapsed))
+
+    enqueued, elapsed = bench_writer(os.path.join(directory, 'writer.db'), rows)
+    print('MetricWriter:    %10.0f rows/s (%.2f us per write call)' % (
+        rows / elapsed, enqueued / rows * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark for creating the experiments of a sweep
+
+Times expanding a sweep into configurations, then creating its experiments
+one create_experiment call (and commit) at a time, as `dlex run` would in a
+loop, and in a single create_sweep transaction.
+
+usage: python benchmarks/bench_sweep.py [points]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db # pylint: disable=wrong-import-position
+import sweep # pylint: disable=wrong-import-position
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    directory = tempfile.mkdtemp()
+    ddb = db.DLEXDB(os.path.join(directory, 'sweep.db'))
+    ddb.insert_definition('def', '/defs/def.py')
+    spec = {'grid': {'batch': [32, 64, 128, 256]},
+            'distributions': {'lr': 'loguniform:1e-5:1e-1', 'layers': 'int:2:8'},
+            'samples': points // 4, 'seed': 0}
+
+    start = time.perf_counter()
+    configs = sweep.expand(spec['grid'], spec['distributions'], spec['samples'], spec['seed'])
+    expand_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for config in configs:
+        ddb.create_experiment('def', config)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ddb.create_sweep('def', spec, configs, time.time())
+    sweep_time = time.perf_counter() - start
+    ddb.close()
+
+    print('%d points, seconds' % len(configs))
+    print('  %-30s %10.3f' % ('expand', expand_time))
+    print('  %-30s %10.3f' % ('create_experiment loop', loop_time))
+    print('  %-30s %10.3f' % ('create_sweep', sweep_time))
+
+if __name__ == '__main__':
+    main()
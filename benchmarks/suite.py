@@ -0,0 +1,357 @@
+"""The benchmark suite of the RPC, DLEXDB, runner and dlexd hot paths
+
+Runs offline on one Linux host:
+
+    rpc      round-trip latency and pipelined and batched throughput of
+             unix_rpc.Server and unix_rpc.AsyncServer, served by another
+             process
+    db       DLEXDB insert and query latency with 1k and 100k experiments
+    runner   the per-step overhead of Runner.run with a no-op experiment, for
+             each metrics transport
+    launch   the time from Client.run to the first step of N experiments
+             started at once by dlexd
+    status   the latency of Client.status as the number of experiments grows
+    procstat the time of a pass of procstat.Sampler over N process trees of
+             3 processes each
+
+Every result is a number with a unit and whether lower or higher is better.
+They are printed, written as JSON with --output, and compared with the
+results of an earlier run with --baseline: a result more than --tolerance
+(relative) worse than its baseline is a regression, and makes the suite exit
+with status 1.
+
+usage: python benchmarks/suite.py [--quick] [--only rpc,db,runner,launch,status,procstat]
+                                  [--output FILE] [--baseline FILE] [--tolerance 0.2]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import client # pylint: disable=wrong-import-position
+import db # pylint: disable=wrong-import-position
+import procstat # pylint: disable=wrong-import-position
+import runner # pylint: disable=wrong-import-position
+import selectable # pylint: disable=wrong-import-position
+import shm_ring # pylint: disable=wrong-import-position
+import unix_rpc # pylint: disable=wrong-import-position
+
+# an experiment whose steps do nothing, and which never ends on its own
+NO_OP = '''
+from dlex import Experiment
+
+class NoOp(Experiment):
+    def __init__(self):
+        super(NoOp, self).__init__(None, None, None, epochs=10 ** 9)
+        self.position = 0
+
+    def epochs_left(self):
+        return self.epochs - self.current_epoch
+
+    def train(self):
+        while True:
+            self.position += 1
+            yield True
+'''
+
+
+class Results(object):
+    """Named results: {name: {'value', 'unit', 'better': 'lower'/'higher'}}"""
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, value, unit, better='lower'):
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+        print('  %-40s %12.3f %s' % (name, value, unit))
+        sys.stdout.flush()
+
+
+def median_ms(function, number):
+    """The median wall time of `function` in milliseconds"""
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def write_definition(directory):
+    path = os.path.join(directory, 'noop.py')
+    with open(path, 'w') as definition_file:
+        definition_file.write(NO_OP)
+    return path
+
+
+def _serve(server_type, path):
+    server = server_type(path)
+    server.register('echo', lambda value=None: value)
+    server.start()
+
+
+def bench_rpc(results, quick):
+    calls = 2000 if quick else 20000
+    for (name, server_type) in [('select', unix_rpc.Server), ('asyncio', unix_rpc.AsyncServer)]:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'rpc.sock')
+        server = multiprocessing.Process(target=_serve, args=(server_type, path), daemon=True)
+        server.start()
+        try:
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            rpc = unix_rpc.Client(path)
+            results.add('rpc.%s.round_trip' % name,
+                        median_ms(lambda: rpc.echo(1), calls // 10) * 1000, 'us')
+            # in windows of 100 calls in flight, as the server blocks once
+            # the client's socket buffer is full of replies
+            start = time.perf_counter()
+            for i in range(0, calls, 100):
+                rpc.wait([rpc.echo.call_async(j) for j in range(i, i + 100)])
+            results.add('rpc.%s.pipelined' % name,
+                        calls / (time.perf_counter() - start), 'calls/s', 'higher')
+            start = time.perf_counter()
+            for i in range(0, calls, 100):
+                rpc.wait(rpc.batch([('echo', [j], {}) for j in range(i, i + 100)]))
+            results.add('rpc.%s.batched' % name,
+                        calls / (time.perf_counter() - start), 'calls/s', 'higher')
+            rpc.close()
+        finally:
+            server.terminate()
+            server.join()
+            shutil.rmtree(directory)
+
+
+def bench_db(results, quick):
+    rand = random.Random(0)
+    for experiments in ([1000, 10000] if quick else [1000, 100000]):
+        directory = tempfile.mkdtemp()
+        try:
+            ddb = db.DLEXDB(os.path.join(directory, 'bench.db'))
+            for i in range(10):
+                ddb.insert_definition('def%d' % i, '/defs/def%d.py' % i)
+            for i in range(10):
+                ddb.create_sweep('def%d' % i, {}, [{'lr': j} for j in range(experiments // 10)])
+            ddb.enqueue_experiments(list(range(1, experiments + 1, 100)))
+            prefix = 'db.%dk.' % (experiments // 1000)
+            results.add(prefix + 'create_experiment',
+                        median_ms(lambda: ddb.create_experiment('def0', {'lr': 0.1}), 200), 'ms')
+            results.add(prefix + 'get_experiment', median_ms(
+                lambda: ddb.get_experiment(rand.randint(1, experiments)), 200), 'ms')
+            results.add(prefix + 'get_jobs', median_ms(lambda: ddb.get_jobs(['queued']), 20), 'ms')
+            results.add(prefix + 'get_status', median_ms(ddb.get_status, 5), 'ms')
+            results.add(prefix + 'open', median_ms(
+                lambda: db.DLEXDB(os.path.join(directory, 'bench.db')).close(), 20), 'ms')
+            ddb.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+def bench_runner(results, quick):
+    steps = 5000 if quick else 50000
+    directory = tempfile.mkdtemp()
+    path = write_definition(directory)
+    try:
+        for (name, hyperparams) in [
+                ('pipe_every_step', {}),
+                ('pipe_every_100_steps', {'report': {'every_steps': 100}}),
+                ('shm', {'metrics_transport': 'shm'})]:
+            pipe = selectable.Pipe()
+            run = runner.Runner(pipe, path, 1, hyperparams)
+            run.start()
+            pipe.use_left()
+            ring = None
+            first = None
+            last = None
+            while last is None or last[0] - first[0] < steps:
+                if ring is not None:
+                    records = ring.drain()
+                    if records == []:
+                        time.sleep(0.001)
+                        continue
+                    step = records[-1][1]
+                else:
+                    msg = pipe.read()
+                    if msg[0] == 'shm':
+                        ring = shm_ring.MetricRing.attach(msg[1])
+                    if msg[0] != 'metrics':
+                        continue
+                    step = msg[1]['step']
+                if first is None:
+                    first = (step, time.perf_counter())
+                last = (step, time.perf_counter())
+            pipe.write('terminate')
+            while pipe.read() not in [None, ['status', 'done']]:
+                pass
+            run.join()
+            if ring is not None:
+                ring.close(unlink=True)
+            results.add('runner.%s' % name,
+                        (last[1] - first[1]) / (last[0] - first[0]) * 1e6, 'us/step')
+    finally:
+        shutil.rmtree(directory)
+
+
+class Daemon(object):
+    """dlexd in a temporary directory, and a client of it"""
+    def __init__(self, *args):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'dlexd.sock')
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'dlexd'), '-s', self.socket_path,
+             '-p', os.path.join(self.directory, 'dlexd.pid')] + list(args),
+            cwd=self.directory, stdout=subprocess.DEVNULL)
+        self.updates = {}
+        self.subscriber = None
+        while self.subscriber is None:
+            try:
+                self.subscriber = unix_rpc.Client(
+                    self.socket_path, handlers={'update': self.update})
+            except OSError:
+                time.sleep(0.01)
+        self.client = client.Client(os.path.join(self.directory, 'test.db'), self.socket_path)
+        self.subscriber.subscribe()
+
+    def update(self, exp_id, fields):
+        self.updates.setdefault(exp_id, {}).update(fields)
+
+    def wait_for(self, exp_ids, field, value=None):
+        """Read updates until `field` of each of `exp_ids` is set (to
+        `value`, if given)"""
+        def ready(exp_id):
+            update = self.updates.get(exp_id, {})
+            return update.get(field) is not None and (value is None or update[field] == value)
+        while not all(ready(exp_id) for exp_id in exp_ids):
+            if not self.subscriber.handle_message():
+                raise RuntimeError('dlexd exited')
+
+    def close(self):
+        self.subscriber.close()
+        self.client.close()
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait()
+        shutil.rmtree(self.directory)
+
+
+def bench_launch(results, quick):
+    for count in ([1, 4] if quick else [1, 4, 16]):
+        daemon = Daemon('--zygotes', '1')
+        try:
+            daemon.client.add('noop', write_definition(daemon.directory))
+            start = time.perf_counter()
+            # unpinned, so that they all run at once on any host
+            exp_ids = [daemon.client.run('noop', {'resources': {'cores': 0}})
+                       for _ in range(count)]
+            daemon.wait_for(exp_ids, 'step')
+            results.add('launch.%d' % count, (time.perf_counter() - start) * 1000, 'ms')
+            daemon.subscriber.terminate(exp_ids)
+            daemon.wait_for(exp_ids, 'status', 'done')
+        finally:
+            daemon.close()
+
+
+def bench_status(results, quick):
+    daemon = Daemon('--zygotes', '0')
+    try:
+        ddb = db.DLEXDB(os.path.join(daemon.directory, 'test.db'))
+        ddb.insert_definition('noop', '/defs/noop.py')
+        created = 0
+        for experiments in ([10, 100, 1000] if quick else [10, 100, 1000, 10000]):
+            ddb.create_sweep('noop', {}, [{'lr': i} for i in range(experiments - created)])
+            created = experiments
+            results.add('status.%d' % experiments, median_ms(daemon.client.status, 20), 'ms')
+        ddb.close()
+    finally:
+        daemon.close()
+
+
+def bench_procstat(results, quick):
+    for count in ([10, 50] if quick else [10, 100, 300]):
+        trees = [subprocess.Popen(['sh', '-c', 'sleep 600 & sleep 600 & wait'],
+                                  start_new_session=True) for _ in range(count)]
+        sampler = procstat.Sampler()
+        try:
+            pids = {i: tree.pid for (i, tree) in enumerate(trees)}
+            # until every tree has its children
+            while sum(len(tree.processes) for tree in sampler.trees.values()) < 3 * count:
+                sampler.sample(pids)
+                time.sleep(0.01)
+            results.add('procstat.%d' % count, median_ms(lambda: sampler.sample(pids), 20), 'ms')
+        finally:
+            sampler.close()
+            for tree in trees:
+                os.killpg(tree.pid, signal.SIGKILL)
+                tree.wait()
+
+
+BENCHMARKS = [('rpc', bench_rpc), ('db', bench_db), ('runner', bench_runner),
+              ('launch', bench_launch), ('status', bench_status), ('procstat', bench_procstat)]
+
+
+def compare(results, baseline, tolerance):
+    """Print how `results` changed since `baseline`
+
+    Returns:
+        The names of the results more than `tolerance` worse than their
+        baseline
+    """
+    regressions = []
+    print('%-40s %12s %12s %8s' % ('result', 'baseline', 'now', 'change'))
+    for (name, result) in sorted(results.items()):
+        if name not in baseline:
+            continue
+        (before, now) = (baseline[name]['value'], result['value'])
+        change = (now - before) / before if before != 0 else 0.0
+        worse = change > tolerance if result['better'] == 'lower' else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print('%-40s %12.3f %12.3f %+7.1f%%%s' % (
+            name, before, now, change * 100, '  REGRESSION' if worse else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dlex benchmark suite')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a smoke test')
+    parser.add_argument('--only', default=None,
+                        help='comma-separated benchmarks (default: all of %s)' % ', '.join(
+                            name for (name, _) in BENCHMARKS))
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the relative change beyond which a result is a regression')
+    args = parser.parse_args()
+
+    only = args.only.split(',') if args.only is not None else None
+    results = Results()
+    for (name, bench) in BENCHMARKS:
+        if only is None or name in only:
+            print(name)
+            bench(results, args.quick)
+    report = {'host': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'cpus': os.cpu_count()},
+              'quick': args.quick, 'time': time.time(), 'results': results.results}
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            regressions = compare(results.results, json.load(baseline)['results'],
+                                  args.tolerance)
+        if regressions != []:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
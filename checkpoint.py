@@ -0,0 +1,293 @@
+"""Asynchronous, incremental checkpoints of experiments
+
+An experiment's state (see Experiment.checkpoint) is a dict of named entries.
+Each entry is serialized, split into chunks and stored in a ChunkStore under
+the SHA-256 of its content, so chunks that didn't change since the previous
+checkpoint (frozen layers, embeddings, ...) are stored once. A checkpoint is
+then only a small JSON manifest listing the chunks of every entry.
+
+The runner takes checkpoints on a CheckpointPolicy schedule, and a
+Checkpointer thread serializes and writes them while training continues.
+
+example:
+    checkpointer = Checkpointer(ChunkStore('~/.cache/dlex/checkpoints/1'))
+    checkpointer.start()
+    checkpointer.submit(step, epoch, position, experiment.checkpoint())
+    for meta in checkpointer.completed():
+        ...
+    checkpointer.close()
+"""
+import hashlib
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Tuple, Union # pylint: disable=unused-import
+
+CHECKPOINT_ROOT = '~/.cache/dlex/checkpoints'
+
+
+class CheckpointPolicy(object):
+    """Decides when the runner takes a checkpoint
+
+    A checkpoint is taken when `every_steps` steps or `every_seconds` seconds
+    have passed since the last one, and always when the experiment is paused,
+    terminated or done. Only the last `keep` checkpoints are kept.
+    """
+    def __init__(self, every_steps=None, every_seconds=None, keep=3, root=CHECKPOINT_ROOT):
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.keep = keep
+        self.root = root
+
+    @classmethod
+    def from_hyperparams(cls, hyperparams):
+        # type: (Dict[str, Any]) -> Union[None, CheckpointPolicy]
+        """Read the policy from the 'checkpoint' hyperparam, or return None if
+        the experiment isn't checkpointed."""
+        if 'checkpoint' not in hyperparams:
+            return None
+        return cls(**hyperparams['checkpoint'])
+
+    def due(self, steps, elapsed):
+        # type: (int, float) -> bool
+        """Whether to checkpoint, `steps` steps and `elapsed` seconds after
+        the last checkpoint."""
+        if self.every_steps is not None and steps >= self.every_steps:
+            return True
+        if self.every_seconds is not None and elapsed >= self.every_seconds:
+            return True
+        return False
+
+
+class ChunkStore(object):
+    """Content-addressed storage of checkpoint data
+
+    Chunks are stored in `root/chunks/<first 2 hex digits>/<sha256>`, and
+    checkpoint manifests in `root/manifests/`.
+    """
+    def __init__(self, root, chunk_size=1024 * 1024):
+        self.root = os.path.expanduser(root)
+        self.chunk_size = chunk_size
+        os.makedirs(os.path.join(self.root, 'chunks'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'manifests'), exist_ok=True)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.root, 'chunks', digest[:2], digest)
+
+    def put(self, data):
+        # type: (Union[bytes, memoryview]) -> Tuple[List[str], int]
+        """Store `data`, skipping the chunks that are already stored.
+
+        Returns:
+            (the digests of the chunks of `data`, the number of bytes written)
+        """
+        view = memoryview(data).cast('B')
+        digests = []
+        written = 0
+        for start in range(0, len(view), self.chunk_size):
+            chunk = view[start:start + self.chunk_size]
+            digest = hashlib.sha256(chunk).hexdigest()
+            digests.append(digest)
+            path = self._chunk_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = '%s.tmp.%d' % (path, os.getpid())
+                with open(tmp_path, 'wb') as chunk_file:
+                    chunk_file.write(chunk)
+                os.rename(tmp_path, path)
+                written += len(chunk)
+        return (digests, written)
+
+    def get(self, digests):
+        # type: (List[str]) -> bytes
+        """Read back the data stored as the chunks `digests`."""
+        data = bytearray()
+        for digest in digests:
+            with open(self._chunk_path(digest), 'rb') as chunk_file:
+                data += chunk_file.read()
+        return bytes(data)
+
+    def manifests(self):
+        # type: () -> List[str]
+        """The paths of the stored manifests, oldest first"""
+        directory = os.path.join(self.root, 'manifests')
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+    def gc(self):
+        # type: () -> int
+        """Remove the chunks no manifest refers to.
+
+        Returns:
+            The number of bytes freed
+        """
+        live = set()
+        for path in self.manifests():
+            with open(path) as manifest_file:
+                for entry in json.load(manifest_file)['entries'].values():
+                    live.update(entry['chunks'])
+        freed = 0
+        chunks = os.path.join(self.root, 'chunks')
+        for prefix in os.listdir(chunks):
+            for digest in os.listdir(os.path.join(chunks, prefix)):
+                if digest not in live:
+                    path = os.path.join(chunks, prefix, digest)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+        return freed
+
+
+def _serialize(value):
+    """Bytes-like values are stored as they are, anything else is pickled."""
+    try:
+        return ('raw', memoryview(value))
+    except TypeError:
+        return ('pickle', memoryview(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+
+def write(store, step, epoch, position, state): # pylint: disable=too-many-arguments
+    # type: (ChunkStore, int, int, Any, Dict[str, Any]) -> Dict[str, Any]
+    """Write a checkpoint of `state` to `store`.
+
+    Returns:
+        The checkpoint's metadata: its 'step', 'epoch', 'position',
+        'manifest' (path), 'size' (of the state), 'stored' (bytes actually
+        written), 'duration' (seconds) and 'created' (timestamp)
+    """
+    start = time.monotonic()
+    entries = {}
+    size = 0
+    stored = 0
+    for name, value in state.items():
+        (encoding, data) = _serialize(value)
+        (digests, written) = store.put(data)
+        entries[name] = {'encoding': encoding, 'chunks': digests, 'size': data.nbytes}
+        size += data.nbytes
+        stored += written
+    created = time.time()
+    path = os.path.join(store.root, 'manifests', '%012d-%f.json' % (step, created))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump({'step': step, 'epoch': epoch, 'position': position,
+                   'entries': entries}, manifest_file)
+    os.rename(tmp_path, path)
+    return {
+        'step': step,
+        'epoch': epoch,
+        'position': position,
+        'manifest': path,
+        'size': size,
+        'stored': stored,
+        'duration': time.monotonic() - start,
+        'created': created,
+    }
+
+
+def load(manifest_path, store=None):
+    # type: (str, Union[None, ChunkStore]) -> Tuple[Dict[str, Any], Dict[str, Any]]
+    """Read a checkpoint back.
+
+    Args:
+        manifest_path: the 'manifest' of the checkpoint's metadata
+        store: the ChunkStore holding it (by default, the one the manifest
+            is in)
+
+    Returns:
+        (the manifest, the state): raw entries come back as bytes, pickled
+        ones unpickled
+    """
+    if store is None:
+        store = ChunkStore(os.path.dirname(os.path.dirname(manifest_path)))
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    state = {}
+    for name, entry in manifest['entries'].items():
+        data = store.get(entry['chunks'])
+        state[name] = pickle.loads(data) if entry['encoding'] == 'pickle' else data
+    return (manifest, state)
+
+
+class Checkpointer(threading.Thread):
+    """Writes checkpoints on a background thread
+
+    At most one checkpoint is written at a time; `submit` returns False
+    instead of queueing another one, so a slow disk delays checkpoints rather
+    than training. The state passed to `submit` must not be modified by the
+    experiment afterwards (Experiment.checkpoint returns copies).
+
+    After each checkpoint, the oldest ones beyond `keep` are deleted and their
+    paths listed in the next metadata's 'pruned'.
+
+    A checkpoint that fails to be written (e.g. the disk is full) doesn't
+    stop training: `completed` returns its 'step', 'epoch' and 'position',
+    and the 'error' that stopped it.
+    """
+    def __init__(self, store, keep=3):
+        super(Checkpointer, self).__init__(name='Checkpointer', daemon=True)
+        self.store = store
+        self.keep = keep
+        self.pending = queue.Queue(1) # type: queue.Queue
+        self.done = queue.Queue() # type: queue.Queue
+
+    def submit(self, step, epoch, position, state):
+        # type: (int, int, Any, Dict[str, Any]) -> bool
+        """Queue a checkpoint. Returns False if one is still being written."""
+        try:
+            self.pending.put_nowait((step, epoch, position, state))
+            return True
+        except queue.Full:
+            return False
+
+    def run(self):
+        while True:
+            job = self.pending.get()
+            try:
+                if job is None:
+                    return
+                meta = write(self.store, *job)
+                meta['pruned'] = self.prune()
+                self.done.put(meta)
+            except Exception as error: # pylint: disable=broad-except
+                (step, epoch, position, _) = job
+                self.done.put({'step': step, 'epoch': epoch, 'position': position,
+                               'error': error})
+            finally:
+                self.pending.task_done()
+
+    def prune(self):
+        # type: () -> List[str]
+        """Delete all but the last `keep` checkpoints and their chunks."""
+        manifests = self.store.manifests()
+        pruned = manifests[:max(0, len(manifests) - self.keep)]
+        if pruned != []:
+            for path in pruned:
+                os.remove(path)
+            self.store.gc()
+        return pruned
+
+    def completed(self):
+        # type: () -> List[Dict[str, Any]]
+        """The metadata of the checkpoints written, or that failed, since the
+        last call"""
+        metas = []
+        while True:
+            try:
+                metas.append(self.done.get_nowait())
+            except queue.Empty:
+                return metas
+
+    def idle(self):
+        # type: () -> bool
+        """Whether no checkpoint is being written"""
+        return self.pending.unfinished_tasks == 0
+
+    def wait(self):
+        """Wait for the submitted checkpoint to be written."""
+        self.pending.join()
+
+    def close(self):
+        """Finish writing the submitted checkpoint and stop the thread."""
+        self.pending.put(None)
+        self.join()
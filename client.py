@@ -1,27 +1,65 @@
 """
 This module defines the main interface for running dlex experiments.
+
+The CLI runs a single command per process, so the modules only some commands
+need (db, dataset_cache, definitions and sweep) are imported by those
+commands, and the DLEXDB is only opened by commands that use it.
 """
 import os
+import time
 
-import db
 import unix_rpc
-from spawner import Spawner
+
+# pylint: disable=import-outside-toplevel
 
 class Client(object):
-    """An object for executing CLI commands."""
-    def __init__(self, db_path='test.db', socket_path='/tmp/sock_path'):
+    """An object for executing CLI commands.
+
+    With `readonly=True`, the DLEXDB is opened read-only (see DLEXDB), for
+    commands that don't change it.
+    """
+    def __init__(self, db_path='test.db', socket_path='/tmp/sock_path', # pylint: disable=too-many-arguments
+                 cache_root='~/.cache/dlex/datasets', cache_max_bytes=10 * 1024 ** 3,
+                 readonly=False):
         self.db_path = db_path
-        self.ddb = db.DLEXDB(db_path)
         self.socket_path = socket_path
+        self.readonly = readonly
+        self.cache_root = cache_root
+        self.cache_max_bytes = cache_max_bytes
+        self._ddb = None
+        self._cache = None
+
+    @property
+    def ddb(self):
+        """The DLEXDB, opened on first use"""
+        if self._ddb is None:
+            import db
+            self._ddb = db.DLEXDB(self.db_path, readonly=self.readonly)
+        return self._ddb
+
+    @property
+    def cache(self):
+        """The DatasetCache, created on first use"""
+        if self._cache is None:
+            import dataset_cache
+            self._cache = dataset_cache.DatasetCache(
+                self.ddb, self.cache_root, self.cache_max_bytes)
+        return self._cache
 
     def close(self):
         # type: () -> ()
         """Close the CLI object."""
-        self.ddb.close()
+        if self._ddb is not None:
+            self._ddb.close()
+            self._ddb = None
 
     def clean(self):
-        """Removes all non-running experiments from state"""
+        """Removes all non-running experiments from state, but not the ones
+        waiting in dlexd's queue or being started"""
         for exp in self.status():
+            if exp['state'] in ['queued', 'running'] and exp['pid'] is None:
+                # dlexd's scheduler holds them, and launches them later
+                continue
             if exp['pid'] is None:
                 self.ddb.delete_experiment(exp['id'])
             else:
@@ -35,8 +73,9 @@ class Client(object):
         # type: (str, str) -> bool
         """Creates a new experiment definition
 
-        This command tries to create a new experiment. It does so by trying
-        to load the module at `def_path`.
+        This command imports the module at `def_path` to check that it
+        defines an experiment, and caches its compiled code and experiment
+        class name for runners (see definitions.py).
 
         Args:
             def_name: name of the experiment to create
@@ -44,10 +83,16 @@ class Client(object):
             inheriting from the Experiment class)
 
         Returns:
-            True on success, False on failure
+            True on success, False if the name is taken
+
+        Raises:
+            definitions.DefinitionError: if the module can't be imported or
+                defines no experiment
         """
-        def_id = self.ddb.insert_definition(def_name, def_path)
-        if def_id is None:
+        import definitions
+        cache = definitions.inspect(def_path)
+        def_id = self.ddb.insert_definition(def_name, def_path, **cache)
+        if def_id is False:
             return False
         return True
 
@@ -72,33 +117,235 @@ class Client(object):
         """
         return self.ddb.get_definitions()
 
-    def run(self, def_name, hyperparams):
-        # type: (str) -> Union[None, int]
-        """Runs an experiment, based on definition `def_name`."""
+    def run(self, def_name, hyperparams, priority=0):
+        # type: (str, Dict[str, Any], int) -> Union[None, int]
+        """Queues an experiment, based on definition `def_name`. dlexd starts
+        it when the host has room for it (see scheduler.py)."""
         exp_id = self.ddb.create_experiment(def_name, hyperparams)
         if exp_id is None:
             return None
-        spawner = Spawner(self.db_path, self.socket_path, exp_id)
-        spawner.run()
+        client = unix_rpc.Client(self.socket_path)
+        client.submit([exp_id], priority)
+        client.close()
         return exp_id
 
+    def sweep(self, def_name, spec, priority=0):
+        # type: (str, Dict[str, Any], int) -> Union[None, Tuple[int, List[int]]]
+        """Queues a sweep of experiments, based on definition `def_name`
+
+        Args:
+            def_name: name of the definition
+            spec: the arguments of sweep.expand: 'grid', 'distributions',
+                'samples', 'seed' and 'base'
+            priority: the priority of the experiments
+
+        Returns:
+            (the ID of the sweep, the IDs of its experiments), or None if the
+            definition doesn't exist
+        """
+        import sweep
+        configs = sweep.expand(spec.get('grid', {}), spec.get('distributions'),
+                               spec.get('samples', 1), spec.get('seed', 0), spec.get('base'))
+        created = self.ddb.create_sweep(def_name, spec, configs, time.time())
+        if created is None:
+            return None
+        client = unix_rpc.Client(self.socket_path)
+        client.submit(created[1], priority)
+        client.close()
+        return created
+
+    def sweeps(self):
+        # type: () -> List[Dict[str, Any]]
+        """Returns all sweeps, with the number of their experiments in each
+        state (see DLEXDB.get_sweeps)"""
+        return self.ddb.get_sweeps()
+
+    def sweep_status(self, sweep_id):
+        # type: (int) -> Union[None, Dict[str, Any]]
+        """Returns a sweep, with the number of its experiments in each state"""
+        return self.ddb.get_sweep(sweep_id)
+
+    def cancel_sweep(self, sweep_id):
+        # type: (int) -> Union[None, List[int]]
+        """Cancels the queued and running experiments of a sweep
+
+        Returns:
+            The IDs of the cancelled experiments, or None if the sweep doesn't
+            exist
+        """
+        if self.ddb.get_sweep(sweep_id) is None:
+            return None
+        client = unix_rpc.Client(self.socket_path)
+        cancelled = client.cancel(self.ddb.get_sweep_experiments(sweep_id))
+        client.close()
+        return cancelled
+
+    def sweep_decisions(self, sweep_id):
+        # type: (int) -> List[Dict[str, Any]]
+        """Returns the early stopping decisions made about the experiments of
+        a sweep (see asha.py)"""
+        return self.ddb.get_asha_decisions('sweep:%d' % sweep_id)
+
+    def restart(self, exp_id):
+        # type: (int) -> bool
+        """Runs an existing experiment again, from its latest checkpoint (if
+        it has one)"""
+        if self.ddb.get_experiment(exp_id) is None:
+            return False
+        client = unix_rpc.Client(self.socket_path)
+        client.submit([exp_id])
+        client.close()
+        return True
+
+    def copy(self, exp_id, overrides=None):
+        # type: (int, Dict[str, Any]) -> Union[None, int]
+        """Copies a running experiment, with hyperparams `overrides`
+
+        The runner forks at the next step, so the copy starts with the
+        experiment's in-memory state without serializing it.
+
+        Returns:
+            The ID of the copy, or None if `exp_id` isn't running
+        """
+        new_exp_id = self.ddb.copy_experiment(exp_id, overrides or {})
+        if new_exp_id is None:
+            return None
+        client = unix_rpc.Client(self.socket_path)
+        forked = client.copy(exp_id, new_exp_id, overrides or {})
+        client.close()
+        if not forked:
+            self.ddb.delete_experiment(new_exp_id)
+            return None
+        return new_exp_id
+
     def status(self):
         # type: () -> List[Any]
-        """Returns the status of all experiments"""
-        status = self.ddb.get_status()
+        """Returns the status of all experiments, from dlexd in a single call
+        (see Tracker.experiments), without opening the DLEXDB"""
         client = unix_rpc.Client(self.socket_path)
-        for exp in status:
-            exp['status'] = client.get_status(exp['id'])
-            exp['loss'] = client.get_loss(exp['id'])
-            exp['epoch'] = client.get_epoch(exp['id'])
+        status = client.experiments()
+        client.close()
         return status
 
-    def pause(self, exp_id):
+    def procstat(self, exp_ids=None):
+        # type: (Union[None, List[int]]) -> List[Dict[str, Any]]
+        """Returns the recent CPU, memory and I/O samples of running
+        experiments (see procstat.py and Tracker.get_procstat)"""
         client = unix_rpc.Client(self.socket_path)
+        samples = client.get_procstat(exp_ids)
+        client.close()
+        return samples
 
-    def unpause(self, exp_id):
-        pass
+    def profiles(self, exp_ids=None):
+        # type: (Union[None, List[int]]) -> List[Dict[str, Any]]
+        """Returns the latest profile of experiments' runs: the wall and CPU
+        time of their phases, their step times and the runner's overhead
+        (see profiling.py)"""
+        client = unix_rpc.Client(self.socket_path)
+        profiles = client.get_profile(exp_ids)
+        client.close()
+        return profiles
+
+    def profile(self, exp_id, seconds=10.0, path=None):
+        # type: (int, float, Union[None, str]) -> Union[None, str]
+        """Runs cProfile in a running experiment for `seconds`
+
+        Args:
+            exp_id: the ID of the experiment
+            seconds: how long to profile for
+            path: where the runner writes the pstats file (default:
+                dlex-<exp_id>-<time>.prof in the current directory)
+
+        Returns:
+            The path of the pstats file, written once the time is up, or None
+            if the experiment isn't running
+        """
+        if path is None:
+            path = 'dlex-%d-%d.prof' % (exp_id, time.time())
+        # the runner doesn't run in this directory
+        path = os.path.abspath(path)
+        client = unix_rpc.Client(self.socket_path)
+        started = client.start_profiler(exp_id, seconds, path)
+        client.close()
+        return path if started else None
+
+    def tail(self, exp_id, callback):
+        # type: (int, Callable[[int, Dict[str, Any]], None]) -> None
+        """Streams the updates of an experiment from dlexd
+
+        Calls `callback(exp_id, changed_fields)` for every update pushed by
+        dlexd, until dlexd closes the connection.
+        """
+        client = unix_rpc.Client(self.socket_path, handlers={'update': callback})
+        client.subscribe([exp_id])
+        try:
+            while client.handle_message():
+                pass
+        finally:
+            client.close()
+
+    def pause(self, exp_ids=None):
+        # type: (Union[None, List[int]]) -> List[int]
+        """Pauses running experiments after a checkpoint, keeping their state
+        in memory
+
+        Args:
+            exp_ids: the IDs of the experiments, or None for all of them
+
+        Returns:
+            The IDs of the experiments that were paused
+        """
+        client = unix_rpc.Client(self.socket_path)
+        paused = client.pause(exp_ids)
+        client.close()
+        return paused
+
+    def unpause(self, exp_ids=None):
+        # type: (Union[None, List[int]]) -> List[int]
+        """Resumes experiments paused by `pause`
+
+        Args:
+            exp_ids: the IDs of the experiments, or None for all of them
+
+        Returns:
+            The IDs of the experiments that were resumed
+        """
+        client = unix_rpc.Client(self.socket_path)
+        unpaused = client.unpause(exp_ids)
+        client.close()
+        return unpaused
+
+    def shares(self):
+        # type: () -> List[Dict[str, Any]]
+        """Returns the share of time each time-sliced experiment got, and its
+        target (see timeslice.py)"""
+        client = unix_rpc.Client(self.socket_path)
+        shares = client.get_shares()
+        client.close()
+        return shares
 
     def get_datasets(self):
-        """List all known datasets"""
+        """List all known datasets, with the size and hit counts of their caches"""
         return self.ddb.get_datasets()
+
+    def add_dataset(self, name, path):
+        # type: (str, str) -> bool
+        """Registers a dataset: a text file, or a directory of them, with one
+        sample per line"""
+        if not os.path.exists(path):
+            return False
+        return self.ddb.insert_dataset(name, os.path.abspath(path)) is not False
+
+    def cache_dataset(self, name):
+        # type: (str) -> str
+        """Builds the binary cache of a dataset, if it is missing or stale
+
+        Returns:
+            The directory of the cache (see dataset_cache.py)
+        """
+        return self.cache.get(name)
+
+    def evict_dataset(self, name):
+        # type: (str) -> bool
+        """Removes the binary cache of a dataset"""
+        return self.cache.evict(name)
@@ -0,0 +1,224 @@
+"""Payload encodings for unix_rpc frames
+
+Each codec has a one byte ID that is carried in the frame header, so the two
+ends of a connection don't have to agree on a codec in advance: a receiver
+decodes whatever it is sent and replies in kind.
+
+JSON is the original encoding and stays the default. BINARY is a compact
+tagged encoding which, unlike JSON, ships numeric arrays (`array.array`,
+NumPy arrays and long lists of floats) as raw typed buffers instead of
+formatting every element as text. Both ends of a UNIX socket are on the same
+host, so the binary encoding uses native byte order.
+"""
+import array
+import json
+import numbers
+import struct
+
+_INT = struct.Struct('=q')
+_SMALL_INT = struct.Struct('=i')
+_FLOAT = struct.Struct('=d')
+_LEN = struct.Struct('=L')
+_ARRAY = struct.Struct('=cL')
+
+_INT_MIN = -2 ** 63
+_INT_MAX = 2 ** 63 - 1
+_SMALL_INT_MIN = -2 ** 31
+_SMALL_INT_MAX = 2 ** 31 - 1
+
+# lists of at least this many floats are packed as one float64 buffer
+_PACK_FLOATS_MIN = 8
+
+_ARRAY_TYPECODES = frozenset('bBhHiIlLqQfd')
+
+
+class JSONCodec(object):
+    """UTF-8 JSON, as spoken by RPC_VERSION 1 peers"""
+    codec_id = 0
+
+    @staticmethod
+    def encode(msg):
+        # type: (Any) -> bytes
+        """Encode `msg` to bytes."""
+        return json.dumps(msg).encode('utf-8')
+
+    @staticmethod
+    def decode(buff):
+        # type: (Union[bytes, memoryview]) -> Any
+        """Decode a message from a bytes-like object."""
+        return json.loads(bytes(buff))
+
+
+def _buffer_of(obj):
+    """Return a flat memoryview over `obj` if it is a typed numeric array."""
+    if isinstance(obj, array.array) or hasattr(obj, '__array_interface__'):
+        try:
+            view = memoryview(obj)
+        except TypeError:
+            return None
+        fmt = view.format.lstrip('@=<')
+        if fmt in _ARRAY_TYPECODES and view.c_contiguous:
+            return view.cast('B').cast(fmt)
+    return None
+
+def _encode(obj, out):
+    # pylint: disable=too-many-branches
+    if obj is None:
+        out += b'N'
+    elif obj is True:
+        out += b'T'
+    elif obj is False:
+        out += b'F'
+    elif isinstance(obj, int):
+        if _SMALL_INT_MIN <= obj <= _SMALL_INT_MAX:
+            out += b'j'
+            out += _SMALL_INT.pack(obj)
+        elif _INT_MIN <= obj <= _INT_MAX:
+            out += b'i'
+            out += _INT.pack(obj)
+        else:
+            data = str(obj).encode('ascii')
+            out += b'I'
+            out += _LEN.pack(len(data))
+            out += data
+    elif isinstance(obj, float):
+        out += b'd'
+        out += _FLOAT.pack(obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        out += b's'
+        out += _LEN.pack(len(data))
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        out += b'b'
+        out += _LEN.pack(len(obj))
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        if (len(obj) >= _PACK_FLOATS_MIN
+                and all(type(item) is float for item in obj)): # pylint: disable=unidiomatic-typecheck
+            out += b'D'
+            out += _LEN.pack(len(obj))
+            out += array.array('d', obj).tobytes()
+        else:
+            out += b'l'
+            out += _LEN.pack(len(obj))
+            for item in obj:
+                _encode(item, out)
+    elif isinstance(obj, dict):
+        out += b'm'
+        out += _LEN.pack(len(obj))
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    elif isinstance(obj, numbers.Integral):
+        # e.g. NumPy integer scalars, which also expose a buffer, but are
+        # not arrays
+        _encode(int(obj), out)
+    elif isinstance(obj, numbers.Real):
+        _encode(float(obj), out)
+    elif getattr(obj, 'ndim', None) == 0 and hasattr(obj, 'item'):
+        # other NumPy scalars (np.bool_, ...) and 0-d arrays
+        _encode(obj.item(), out)
+    else:
+        view = _buffer_of(obj)
+        if view is None:
+            raise TypeError('cannot encode %r' % type(obj))
+        out += b'a'
+        out += _ARRAY.pack(view.format.encode('ascii'), len(view))
+        out += view.cast('B')
+
+def _decode(buff, offset):
+    # pylint: disable=too-many-return-statements,too-many-branches
+    tag = buff[offset]
+    offset += 1
+    if tag == 0x6a: # j
+        return _SMALL_INT.unpack_from(buff, offset)[0], offset + _SMALL_INT.size
+    elif tag == 0x64: # d
+        return _FLOAT.unpack_from(buff, offset)[0], offset + _FLOAT.size
+    elif tag == 0x73: # s
+        (length,) = _LEN.unpack_from(buff, offset)
+        offset += _LEN.size
+        return str(buff[offset:offset + length], 'utf-8'), offset + length
+    elif tag == 0x6c: # l
+        (length,) = _LEN.unpack_from(buff, offset)
+        offset += _LEN.size
+        items = []
+        for _ in range(length):
+            item, offset = _decode(buff, offset)
+            items.append(item)
+        return items, offset
+    elif tag == 0x6d: # m
+        (length,) = _LEN.unpack_from(buff, offset)
+        offset += _LEN.size
+        items = {}
+        for _ in range(length):
+            key, offset = _decode(buff, offset)
+            value, offset = _decode(buff, offset)
+            items[key] = value
+        return items, offset
+    elif tag == 0x4e: # N
+        return None, offset
+    elif tag == 0x54: # T
+        return True, offset
+    elif tag == 0x46: # F
+        return False, offset
+    elif tag == 0x69: # i
+        return _INT.unpack_from(buff, offset)[0], offset + _INT.size
+    elif tag in (0x62, 0x49): # b, I
+        (length,) = _LEN.unpack_from(buff, offset)
+        offset += _LEN.size
+        data = buff[offset:offset + length].tobytes()
+        if tag == 0x49:
+            return int(data), offset + length
+        return data, offset + length
+    elif tag == 0x44: # D
+        (length,) = _LEN.unpack_from(buff, offset)
+        offset += _LEN.size
+        end = offset + length * 8
+        return buff[offset:end].cast('d').tolist(), end
+    elif tag == 0x61: # a
+        (typecode, length) = _ARRAY.unpack_from(buff, offset)
+        offset += _ARRAY.size
+        values = array.array(typecode.decode('ascii'))
+        end = offset + length * values.itemsize
+        values.frombytes(buff[offset:end])
+        return values, end
+    raise ValueError('unknown tag %r' % chr(tag))
+
+
+class BinaryCodec(object):
+    """A compact tagged binary encoding with raw typed numeric buffers
+
+    Decoded typed arrays come back as `array.array`. Lists of floats come back
+    as lists, and tuples as lists (as with JSON).
+    """
+    codec_id = 1
+
+    @staticmethod
+    def encode(msg):
+        # type: (Any) -> bytearray
+        """Encode `msg` to bytes."""
+        out = bytearray()
+        _encode(msg, out)
+        return out
+
+    @staticmethod
+    def decode(buff):
+        # type: (Union[bytes, memoryview]) -> Any
+        """Decode a message from a bytes-like object."""
+        view = memoryview(buff)
+        if view.format != 'B':
+            view = view.cast('B')
+        msg, _ = _decode(view, 0)
+        return msg
+
+
+JSON = JSONCodec()
+BINARY = BinaryCodec()
+
+CODECS = {codec.codec_id: codec for codec in [JSON, BINARY]}
+
+def get_codec(name):
+    # type: (str) -> Union[JSONCodec, BinaryCodec]
+    """Look up a codec by name ('json' or 'binary')."""
+    return {'json': JSON, 'binary': BINARY}[name]
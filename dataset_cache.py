@@ -0,0 +1,262 @@
+"""Binary columnar caches of registered datasets
+
+A dataset is registered with a path to a line-oriented text file, or to a
+directory of them (read in name order), one sample per line. Caching it
+converts it once to two NumPy .npy arrays that experiments can map instead of
+parsing text every epoch:
+
+    data.npy     uint8, every sample's bytes, without newlines, concatenated
+    offsets.npy  int64, count + 1 offsets: sample i is data[offsets[i]:offsets[i + 1]]
+
+with a manifest.json recording their dtype and shape, and the checksum and
+fingerprint (the size and modification time of every file) of the source.
+The .npy files are written directly, so NumPy isn't needed to build them.
+
+See DatasetCache class docstring for usage.
+"""
+import array
+import ast
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import time
+from typing import Any, Dict, List, Union # pylint: disable=unused-import
+
+import db
+
+MANIFEST = 'manifest.json'
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# headers are padded to a fixed length, so that data.npy can be written in
+# one pass and its header filled in once the shape is known
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr, shape):
+    # type: (str, List[int]) -> bytes
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%s), }" % (
+        descr, ''.join('%d,' % dim for dim in shape))
+    header = header.ljust(_NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2 - 1) + '\n'
+    return _NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def read_npy_header(npy_file):
+    """Read the header of an .npy file written by this module.
+
+    Returns:
+        (dtype descr, shape, offset of the data)
+    """
+    magic = npy_file.read(len(_NPY_MAGIC))
+    if magic != _NPY_MAGIC:
+        raise ValueError('not a version 1.0 .npy file')
+    (length,) = struct.unpack('<H', npy_file.read(2))
+    header = ast.literal_eval(npy_file.read(length).decode('latin1'))
+    return (header['descr'], list(header['shape']), len(_NPY_MAGIC) + 2 + length)
+
+
+def source_files(path):
+    # type: (str) -> List[str]
+    """The files of a dataset, in the order their samples are read"""
+    if os.path.isdir(path):
+        return [
+            os.path.join(path, name) for name in sorted(os.listdir(path))
+            if not name.startswith('.') and os.path.isfile(os.path.join(path, name))]
+    return [path]
+
+
+def fingerprint(path):
+    # type: (str) -> str
+    """A cheap summary of the source, which changes whenever a file does"""
+    stats = []
+    for name in source_files(path):
+        stat = os.stat(name)
+        stats.append([name, stat.st_size, stat.st_mtime_ns])
+    return json.dumps(stats)
+
+
+def build(path, cache_dir):
+    # type: (str, str) -> Dict[str, Any]
+    """Convert the dataset at `path` to the columnar form in `cache_dir`.
+
+    The cache is built next to `cache_dir` and renamed into place, so readers
+    never see a partial cache.
+
+    Returns:
+        The manifest
+    """
+    source = fingerprint(path)
+    tmp_dir = '%s.tmp.%d' % (cache_dir, os.getpid())
+    os.makedirs(tmp_dir)
+    checksum = hashlib.sha256()
+    offsets = array.array('q', [0])
+    position = 0
+    with open(os.path.join(tmp_dir, 'data.npy'), 'wb') as data_file:
+        data_file.write(b'\0' * _NPY_HEADER_SIZE)
+        for name in source_files(path):
+            with open(name, 'rb') as source_file:
+                for line in source_file:
+                    checksum.update(line)
+                    if line.endswith(b'\n'):
+                        line = line[:-1]
+                    data_file.write(line)
+                    position += len(line)
+                    offsets.append(position)
+        data_file.seek(0)
+        data_file.write(_npy_header('|u1', [position]))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    with open(os.path.join(tmp_dir, 'offsets.npy'), 'wb') as offsets_file:
+        offsets_file.write(_npy_header('<i8', [len(offsets)]))
+        offsets.tofile(offsets_file)
+
+    manifest = {
+        'source': path,
+        'fingerprint': source,
+        'checksum': checksum.hexdigest(),
+        'count': len(offsets) - 1,
+        'columns': {
+            'data': {'file': 'data.npy', 'dtype': '|u1', 'shape': [position]},
+            'offsets': {'file': 'offsets.npy', 'dtype': '<i8', 'shape': [len(offsets)]},
+        },
+        'created': time.time(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+    return manifest
+
+
+def disk_usage(cache_dir):
+    # type: (str) -> int
+    return sum(
+        os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+
+class DatasetCache(object):
+    """The caches of the datasets registered in a DLEXDB
+
+    `get` returns the directory of a dataset's cache, building it first if it
+    is missing or if the source's fingerprint changed. The caches' total size
+    is kept under `max_bytes` by evicting the least recently used ones. Hits,
+    misses (builds) and sizes are recorded in the dataset_caches table.
+
+    example:
+        cache = DatasetCache(ddb, '~/.cache/dlex/datasets')
+        cache_dir = cache.get('mnist')
+
+    and in an experiment:
+        data = np.load(os.path.join(cache_dir, 'data.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(cache_dir, 'offsets.npy'), mmap_mode='r')
+    """
+    def __init__(self, ddb, root, max_bytes=10 * 1024 ** 3):
+        # type: (db.DLEXDB, str, int) -> None
+        self.ddb = ddb
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+
+    def path(self, dataset):
+        # type: (Dict[str, Any]) -> str
+        """The cache directory of a dataset (as returned by DLEXDB.get_dataset)"""
+        return os.path.join(self.root, str(dataset['id']))
+
+    def _dataset(self, name):
+        dataset = self.ddb.get_dataset(name)
+        if dataset is None:
+            raise KeyError('unknown dataset %s' % name)
+        return dataset
+
+    def get(self, name):
+        # type: (str) -> str
+        """The cache directory of dataset `name`, (re)built if it is stale"""
+        dataset = self._dataset(name)
+        cache_dir = self.path(dataset)
+        if (dataset['fingerprint'] is not None
+                and dataset['fingerprint'] == fingerprint(dataset['directory'])
+                and os.path.exists(os.path.join(cache_dir, MANIFEST))):
+            self.ddb.touch_dataset_cache(dataset['id'], time.time())
+            return cache_dir
+        manifest = build(dataset['directory'], cache_dir)
+        self.ddb.set_dataset_cache(
+            dataset['id'], manifest['fingerprint'], manifest['checksum'],
+            disk_usage(cache_dir), time.time())
+        self.enforce_limit(keep=dataset['id'])
+        return cache_dir
+
+    def evict(self, name):
+        # type: (str) -> bool
+        """Remove a dataset's cache. Returns False if it wasn't cached."""
+        return self._evict(self._dataset(name))
+
+    def _evict(self, dataset):
+        cache_dir = self.path(dataset)
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        if dataset['fingerprint'] is None:
+            return False
+        self.ddb.clear_dataset_cache(dataset['id'])
+        return True
+
+    def enforce_limit(self, keep=None):
+        # type: (Union[None, int]) -> List[str]
+        """Evict least recently used caches (except dataset `keep`'s) until
+        the total size is under `max_bytes`.
+
+        Returns:
+            The names of the evicted datasets
+        """
+        cached = [
+            dataset for dataset in self.ddb.get_datasets()
+            if dataset['fingerprint'] is not None]
+        total = sum(dataset['size'] for dataset in cached)
+        evicted = []
+        for dataset in sorted(cached, key=lambda dataset: dataset['last_used']):
+            if total <= self.max_bytes:
+                break
+            if dataset['id'] == keep:
+                continue
+            self._evict(dataset)
+            total -= dataset['size']
+            evicted.append(dataset['name'])
+        return evicted
+
+
+class CachedDataset(object):
+    """Random access to a cache without NumPy, like dlex.MappedDataset
+
+    Samples are memoryview slices of the mapped data.npy.
+    """
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, MANIFEST)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+        with open(os.path.join(cache_dir, 'offsets.npy'), 'rb') as offsets_file:
+            (_, _, start) = read_npy_header(offsets_file)
+            offsets_file.seek(start)
+            self.offsets = array.array('q')
+            self.offsets.frombytes(offsets_file.read())
+        if sys.byteorder != 'little':
+            self.offsets.byteswap()
+        self.file = open(os.path.join(cache_dir, 'data.npy'), 'rb')
+        (_, _, self.start) = read_npy_header(self.file)
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('sample %d out of range' % i)
+        return self.view[self.start + self.offsets[i]:self.start + self.offsets[i + 1]]
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+        self.file.close()
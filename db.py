@@ -3,8 +3,9 @@
 See DLEXDB class docstring for usage.
 """
 
-import sqlite3
 import json
+import os
+import sqlite3
 from typing import Dict, Any, List # pylint: disable=unused-import
 from typing import Tuple, Union # pylint: disable=unused-import
 
@@ -14,81 +15,206 @@ def _defs_sql_to_json(rows):
     """Transform a row from an definition experiment table SQL query to JSON"""
     return [{'id': row[0], 'name': row[1], 'path': row[2]} for row in rows]
 
+# Each migration is a list of statements bringing the schema from version i
+# to version i + 1, and PRAGMA user_version records the version a database is
+# at. Never change a migration that has been released; append a new one.
+_MIGRATIONS = [
+    # 1: the tables of databases created before schema versioning, hence
+    # IF NOT EXISTS
+    [
+        "CREATE TABLE IF NOT EXISTS definitions ("
+        "  id    INTEGER PRIMARY KEY,"
+        "  name  TEXT UNIQUE,"
+        "  path  TEXT"
+        ")",
+        "CREATE TABLE IF NOT EXISTS experiments ("
+        "  id             INTEGER PRIMARY KEY,"
+        "  definition_id  INTEGER,"
+        "  hyperparams    TEXT,"
+        "  pid            INTEGER UNIQUE,"
+        "  FOREIGN KEY    (definition_id) REFERENCES definitions(id)"
+        ")",
+        "CREATE TABLE IF NOT EXISTS checkpoints ("
+        "  id INTEGER     PRIMARY KEY,"
+        "  experiment_id  INTEGER,"
+        "  FOREIGN KEY    (experiment_id) REFERENCES experiments(id)"
+        ")",
+        "CREATE TABLE IF NOT EXISTS datasets ("
+        "  id INTEGER     PRIMARY KEY,"
+        "  name           TEXT,"
+        "  directory      TEXT"
+        ")",
+        "CREATE TABLE IF NOT EXISTS metrics ("
+        "  id INTEGER     PRIMARY KEY,"
+        "  experiment_id  INTEGER,"
+        "  name           TEXT,"
+        "  step           INTEGER,"
+        "  epoch          INTEGER,"
+        "  timestamp      REAL,"
+        "  value          REAL,"
+        "  FOREIGN KEY    (experiment_id) REFERENCES experiments(id)"
+        ")",
+        "CREATE INDEX IF NOT EXISTS metrics_experiment_step "
+        "ON metrics (experiment_id, step)",
+    ],
+    # 2: indexes for the foreign keys (experiments.pid is UNIQUE, so it
+    # already has one)
+    [
+        "CREATE INDEX experiments_definition_id ON experiments (definition_id)",
+        "CREATE INDEX checkpoints_experiment_id ON checkpoints (experiment_id)",
+    ],
+    # 3: the binary caches of datasets (see dataset_cache.py)
+    [
+        "CREATE INDEX datasets_name ON datasets (name)",
+        "CREATE TABLE dataset_caches ("
+        "  dataset_id     INTEGER PRIMARY KEY,"
+        "  fingerprint    TEXT,"
+        "  checksum       TEXT,"
+        "  size           INTEGER,"
+        "  hits           INTEGER DEFAULT 0,"
+        "  misses         INTEGER DEFAULT 0,"
+        "  last_used      REAL,"
+        "  FOREIGN KEY    (dataset_id) REFERENCES datasets(id)"
+        ")",
+    ],
+    # 4: checkpoint metadata (see checkpoint.py)
+    [
+        "ALTER TABLE checkpoints ADD COLUMN step INTEGER",
+        "ALTER TABLE checkpoints ADD COLUMN epoch INTEGER",
+        "ALTER TABLE checkpoints ADD COLUMN position TEXT",
+        "ALTER TABLE checkpoints ADD COLUMN manifest TEXT",
+        "ALTER TABLE checkpoints ADD COLUMN size INTEGER",
+        "ALTER TABLE checkpoints ADD COLUMN stored INTEGER",
+        "ALTER TABLE checkpoints ADD COLUMN duration REAL",
+        "ALTER TABLE checkpoints ADD COLUMN created REAL",
+    ],
+    # 5: the experiment an experiment was copied from (see dlex copy)
+    [
+        "ALTER TABLE experiments ADD COLUMN parent_id INTEGER"
+        "  REFERENCES experiments(id)",
+    ],
+    # 6: the job queue of dlexd (see scheduler.py). Experiments created
+    # before it have a NULL state.
+    [
+        "ALTER TABLE experiments ADD COLUMN state TEXT",
+        "ALTER TABLE experiments ADD COLUMN priority INTEGER DEFAULT 0",
+        "ALTER TABLE experiments ADD COLUMN queued_at REAL",
+        "ALTER TABLE experiments ADD COLUMN started_at REAL",
+        "ALTER TABLE experiments ADD COLUMN finished_at REAL",
+        "ALTER TABLE experiments ADD COLUMN cores TEXT",
+        "CREATE INDEX experiments_state ON experiments (state, priority, id)",
+    ],
+    # 7: sweeps, groups of experiments created together (see sweep.py)
+    [
+        "CREATE TABLE sweeps ("
+        "  id             INTEGER PRIMARY KEY,"
+        "  definition_id  INTEGER,"
+        "  spec           TEXT,"
+        "  created        REAL,"
+        "  FOREIGN KEY    (definition_id) REFERENCES definitions(id)"
+        ")",
+        "ALTER TABLE experiments ADD COLUMN sweep_id INTEGER REFERENCES sweeps(id)",
+        "CREATE INDEX experiments_sweep_id ON experiments (sweep_id)",
+    ],
+    # 8: the compiled caches of definitions (see definitions.py)
+    [
+        "ALTER TABLE definitions ADD COLUMN source_hash TEXT",
+        "ALTER TABLE definitions ADD COLUMN class_name TEXT",
+        "ALTER TABLE definitions ADD COLUMN bytecode BLOB",
+    ],
+    # 9: the decisions of asynchronous successive halving (see asha.py)
+    [
+        "CREATE TABLE asha_decisions ("
+        "  id             INTEGER PRIMARY KEY,"
+        "  experiment_id  INTEGER,"
+        "  group_key      TEXT,"
+        "  rung           INTEGER,"
+        "  epoch          INTEGER,"
+        "  loss           REAL,"
+        "  decision       TEXT,"
+        "  created        REAL,"
+        "  FOREIGN KEY    (experiment_id) REFERENCES experiments(id)"
+        ")",
+        "CREATE INDEX asha_decisions_group_key ON asha_decisions (group_key)",
+    ],
+]
+
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+def _uri_path(path):
+    # type: (str) -> str
+    """Escape the characters of a path that are special in an SQLite URI"""
+    return path.replace('%', '%25').replace('?', '%3f').replace('#', '%23')
+
 class DLEXDB(object):
     """A wrapper around sqlite3
 
+    The database is kept in WAL mode, so that readers (the CLI) and the writer
+    (dlexd) don't block each other, with synchronous=NORMAL, which in WAL mode
+    can lose the last transactions on power loss but never corrupts the
+    database.
+
+    With `readonly=True` the database is opened with SQLite's mode=ro, for
+    commands that only read: it isn't switched to WAL mode (it already is
+    once created) and isn't locked for writing. A database that doesn't exist
+    or isn't at SCHEMA_VERSION yet is opened for writing instead, to be
+    created or migrated.
+
     example:
         db = DLEXDB('~/mystate.db')
         db.insert_definition('exp_name')
         db.close()
     """
-    def __init__(self, name='test.db'):
+    def __init__(self, name='test.db', check_same_thread=True, readonly=False):
         self.name = name
-        self.conn = sqlite3.connect(name)
+        self.readonly = readonly
+        if readonly:
+            try:
+                self.conn = sqlite3.connect(
+                    'file:%s?mode=ro' % _uri_path(os.path.abspath(name)),
+                    uri=True, check_same_thread=check_same_thread)
+                self.cursor = self.conn.cursor()
+                self.cursor.execute("PRAGMA user_version")
+                if self.cursor.fetchone()[0] >= SCHEMA_VERSION:
+                    return
+                self.conn.close()
+            except sqlite3.OperationalError:
+                pass
+            self.readonly = False
+        self.conn = sqlite3.connect(name, check_same_thread=check_same_thread)
         self.cursor = self.conn.cursor()
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute("PRAGMA user_version")
+        if self.cursor.fetchone()[0] < SCHEMA_VERSION:
+            self.migrate()
 
-        self.cursor.execute(
-            "SELECT name "
-            "FROM sqlite_master "
-            "WHERE type='table' AND name='definitions'")
-
-        if len(self.cursor.fetchall()) == 0:
-            self.cursor.execute(
-                "CREATE TABLE definitions ("
-                "  id    INTEGER PRIMARY KEY,"
-                "  name  TEXT UNIQUE,"
-                "  path  TEXT"
-                ")")
-
-        self.cursor.execute(
-            "SELECT name "
-            "FROM sqlite_master "
-            "WHERE type='table' AND name='experiments'")
-
-        if len(self.cursor.fetchall()) == 0:
-            self.cursor.execute(
-                "CREATE TABLE experiments ("
-                "  id             INTEGER PRIMARY KEY,"
-                "  definition_id  INTEGER,"
-                "  hyperparams    TEXT,"
-                "  pid            INTEGER UNIQUE,"
-                "  FOREIGN KEY    (definition_id) REFERENCES definitions(id)"
-                ")")
-
-        self.cursor.execute(
-            "SELECT name "
-            "FROM sqlite_master "
-            "WHERE type='table' AND name='checkpoints'")
-
-        if len(self.cursor.fetchall()) == 0:
-            self.cursor.execute(
-                "CREATE TABLE checkpoints ("
-                "  id INTEGER     PRIMARY KEY,"
-                "  experiment_id  INTEGER,"
-                "  FOREIGN KEY    (experiment_id) REFERENCES experiments(id)"
-                ")")
-
-        self.cursor.execute(
-            "SELECT name "
-            "FROM sqlite_master "
-            "WHERE type='table' AND name='datasets'")
-
-        if len(self.cursor.fetchall()) == 0:
-            self.cursor.execute(
-                "CREATE TABLE datasets ("
-                "  id INTEGER     PRIMARY KEY,"
-                "  name           TEXT,"
-                "  directory      TEXT"
-                ")")
-
+    def migrate(self):
+        # type: () -> None
+        """Apply the migrations this database hasn't had yet"""
+        # IMMEDIATE, so that two processes can't both migrate
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute("PRAGMA user_version")
+            version = self.cursor.fetchone()[0]
+            for statements in _MIGRATIONS[version:]:
+                for statement in statements:
+                    self.cursor.execute(statement)
+            self.cursor.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+        except:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
 
-    def insert_definition(self, name, path):
-        # type: (str, str) -> Union[bool, int]
-        """Insert a new experiment definition"""
+    def insert_definition(self, name, path, source_hash=None, class_name=None, # pylint: disable=too-many-arguments
+                          bytecode=None):
+        # type: (str, str, Union[None, str], Union[None, str], Union[None, bytes]) -> Union[bool, int]
+        """Insert a new experiment definition, with its compiled cache (see
+        definitions.inspect)"""
         try:
             self.cursor.execute(
-                "INSERT INTO definitions (name, path)"
-                "VALUES (?, ?)", (name, path))
+                "INSERT INTO definitions (name, path, source_hash, class_name, bytecode)"
+                "VALUES (?, ?, ?, ?, ?)", (name, path, source_hash, class_name, bytecode))
 
             self.conn.commit()
             return self.cursor.lastrowid
@@ -127,9 +253,31 @@ class DLEXDB(object):
     def get_definitions(self):
         # type: () -> List[Union[None, Dict[str, Union[int, str]]]]
         """Return a list of all experiment definitions."""
-        self.cursor.execute('SELECT * FROM definitions')
+        self.cursor.execute('SELECT id, name, path FROM definitions')
         return _defs_sql_to_json(self.cursor.fetchall())
 
+    def get_definition_cache(self, def_id):
+        # type: (int) -> Union[None, Dict[str, Any]]
+        """The compiled cache of a definition: its 'source_hash',
+        'class_name' and 'bytecode' (None for definitions added before they
+        were cached), or None if it doesn't exist"""
+        self.cursor.execute(
+            "SELECT source_hash, class_name, bytecode FROM definitions WHERE id=?",
+            (def_id,))
+        for (source_hash, class_name, bytecode) in self.cursor.fetchall():
+            return {'source_hash': source_hash, 'class_name': class_name,
+                    'bytecode': bytecode}
+        return None
+
+    def set_definition_cache(self, def_id, source_hash, class_name, bytecode):
+        # type: (int, str, Union[None, str], bytes) -> bool
+        """Replace the compiled cache of a definition"""
+        self.cursor.execute(
+            "UPDATE definitions SET source_hash = ?, class_name = ?, bytecode = ?"
+            "  WHERE id = ?", (source_hash, class_name, bytecode, def_id))
+        self.conn.commit()
+        return self.cursor.rowcount == 1
+
     def set_pid(self, exp_id, pid):
         # type: (int, int) -> bool
         """Setter for experiment OS PID
@@ -169,6 +317,99 @@ class DLEXDB(object):
             return None
         return self.cursor.lastrowid
 
+    def copy_experiment(self, exp_id, overrides):
+        # type: (int, Dict[Any, Any]) -> Union[int, None]
+        """Creates an experiment from the definition of experiment `exp_id`,
+        with its hyperparams updated with `overrides`
+
+        Returns:
+            The ID of the new experiment, or None if `exp_id` doesn't exist
+        """
+        exp = self.get_experiment(exp_id)
+        if exp is None:
+            return None
+        hyperparams = dict(exp['hyperparams'])
+        hyperparams.update(overrides)
+        self.cursor.execute(
+            "INSERT INTO experiments (definition_id, hyperparams, parent_id)"
+            "  VALUES (?, ?, ?)", (exp['def_id'], json.dumps(hyperparams), exp_id))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def create_sweep(self, def_name, spec, hyperparams_list, created=None):
+        # type: (str, Dict[str, Any], List[Dict[Any, Any]], Union[None, float]) -> Union[None, Tuple[int, List[int]]]
+        """Creates a sweep and its experiments in a single transaction
+
+        Args:
+            def_name: name of the definition
+            spec: the search space the sweep was expanded from, for the record
+            hyperparams_list: the hyperparams of each experiment
+            created: the time the sweep was created
+        Returns:
+            (the ID of the sweep, the IDs of its experiments, in the order of
+            `hyperparams_list`), or None if the definition doesn't exist
+        """
+        definition = self.get_definition(def_name)
+        if definition is None:
+            return None
+        with self.conn:
+            self.cursor.execute(
+                "INSERT INTO sweeps (definition_id, spec, created) VALUES (?, ?, ?)",
+                (definition['id'], json.dumps(spec), created))
+            sweep_id = self.cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO experiments (definition_id, hyperparams, sweep_id)"
+                "  VALUES (?, ?, ?)",
+                [(definition['id'], json.dumps(hyperparams), sweep_id)
+                 for hyperparams in hyperparams_list])
+        return (sweep_id, self.get_sweep_experiments(sweep_id))
+
+    def get_sweep_experiments(self, sweep_id):
+        # type: (int) -> List[int]
+        """The IDs of the experiments of a sweep, in creation order"""
+        self.cursor.execute(
+            "SELECT id FROM experiments WHERE sweep_id=? ORDER BY id", (sweep_id,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_sweeps(self):
+        # type: () -> List[Dict[str, Any]]
+        """Gets a list of all sweeps
+
+        Returns:
+            A list of dicts with the sweep's 'id', 'name' (of its definition),
+            'spec', 'created' and 'states', the number of its experiments in
+            each state ('new' for those never queued)
+        """
+        return self._sweeps("", ())
+
+    def get_sweep(self, sweep_id):
+        # type: (int) -> Union[None, Dict[str, Any]]
+        """Query for a sweep by ID (see get_sweeps)"""
+        for sweep in self._sweeps("WHERE sweeps.id=?", (sweep_id,)):
+            return sweep
+        return None
+
+    def _sweeps(self, where, args):
+        self.cursor.execute(
+            "SELECT sweeps.id, definitions.name, sweeps.spec, sweeps.created"
+            "  FROM sweeps"
+            "  LEFT JOIN definitions"
+            "  ON sweeps.definition_id == definitions.id " + where +
+            "  ORDER BY sweeps.id", args)
+        sweeps = []
+        for (sweep_id, name, spec, created) in self.cursor.fetchall():
+            sweeps.append({'id': sweep_id, 'name': name, 'spec': json.loads(spec),
+                           'created': created, 'states': {}})
+        by_id = {sweep['id']: sweep for sweep in sweeps}
+        self.cursor.execute(
+            "SELECT sweep_id, IFNULL(state, 'new'), COUNT(*)"
+            "  FROM experiments"
+            "  WHERE sweep_id IN (%s)"
+            "  GROUP BY sweep_id, state" % ', '.join('?' * len(by_id)), list(by_id))
+        for (sweep_id, state, count) in self.cursor.fetchall():
+            by_id[sweep_id]['states'][state] = count
+        return sweeps
+
     def get_experiment(self, exp_id):
         # type: (int) -> Union[None, Dict[str, Union[int, str]]]
         """Reads an experiment given its ID
@@ -181,7 +422,8 @@ class DLEXDB(object):
         """
         self.cursor.execute(
             "SELECT experiments.definition_id, definitions.path, "
-            "       experiments.hyperparams, experiments.pid"
+            "       experiments.hyperparams, experiments.pid, experiments.parent_id,"
+            "       experiments.sweep_id, experiments.priority"
             "  FROM experiments"
             "  INNER JOIN definitions"
             "  ON experiments.definition_id == definitions.id"
@@ -191,13 +433,16 @@ class DLEXDB(object):
         resp = self.cursor.fetchall()
         if resp == []:
             return None
-        [(def_id, def_path, hyperparams, pid)] = resp
+        [(def_id, def_path, hyperparams, pid, parent_id, sweep_id, priority)] = resp
         return {
             'id': exp_id,
             'def_id': def_id,
             'def_path': def_path,
             'hyperparams': json.loads(hyperparams),
-            'pid': pid}
+            'pid': pid,
+            'parent_id': parent_id,
+            'sweep_id': sweep_id,
+            'priority': priority}
 
     def delete_experiment(self, exp_id):
         # type: (int) -> bool
@@ -210,20 +455,280 @@ class DLEXDB(object):
     def get_status(self):
         # type: () -> List[Any]
         """Gets the status of all experiments"""
-        self.cursor.execute("SELECT id, hyperparams, pid FROM experiments")
+        self.cursor.execute("SELECT id, hyperparams, pid, state FROM experiments")
         exps = []
-        for exp_id, hyperparams, pid in self.cursor.fetchall():
-            exps.append({'id': exp_id, 'hyperparams': hyperparams, 'pid': pid})
+        for exp_id, hyperparams, pid, state in self.cursor.fetchall():
+            exps.append({'id': exp_id, 'hyperparams': hyperparams, 'pid': pid, 'state': state})
         return exps
 
+    def enqueue_experiments(self, exp_ids, priority=0, queued_at=None):
+        # type: (List[int], int, Union[None, float]) -> None
+        """Put experiments in the queue of experiments waiting to run"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE experiments"
+                "  SET state = 'queued', priority = ?, queued_at = ?,"
+                "      started_at = NULL, finished_at = NULL, cores = NULL"
+                "  WHERE id = ?",
+                [(priority, queued_at, exp_id) for exp_id in exp_ids])
+
+    def get_jobs(self, states):
+        # type: (List[str]) -> List[Dict[str, Any]]
+        """The experiments in any of `states`, highest priority first, and
+        first queued first within a priority
+
+        Returns:
+            A list of dicts with the experiment's 'id', 'hyperparams',
+            'state', 'priority', 'queued_at', 'started_at', 'finished_at',
+            'cores' and 'pid'
+        """
+        self.cursor.execute(
+            "SELECT id, hyperparams, state, priority, queued_at, started_at,"
+            "       finished_at, cores, pid"
+            "  FROM experiments"
+            "  WHERE state IN (%s)"
+            "  ORDER BY priority DESC, id" % ', '.join('?' * len(states)), states)
+        jobs = []
+        for row in self.cursor.fetchall():
+            job = dict(zip(
+                ['id', 'hyperparams', 'state', 'priority', 'queued_at', 'started_at',
+                 'finished_at', 'cores', 'pid'], row))
+            job['hyperparams'] = json.loads(job['hyperparams'])
+            job['cores'] = json.loads(job['cores']) if job['cores'] is not None else None
+            jobs.append(job)
+        return jobs
+
+    def set_job_state(self, exp_id, state, timestamp, cores=None):
+        # type: (int, str, float, Union[None, List[int]]) -> bool
+        """Record that an experiment started running on `cores` (state
+        'running') or finished (any other state) at `timestamp`"""
+        if state == 'running':
+            self.cursor.execute(
+                "UPDATE experiments SET state = ?, started_at = ?, cores = ?"
+                "  WHERE id = ?", (state, timestamp, json.dumps(cores), exp_id))
+        else:
+            self.cursor.execute(
+                "UPDATE experiments SET state = ?, finished_at = ?"
+                "  WHERE id = ?", (state, timestamp, exp_id))
+        self.conn.commit()
+        return self.cursor.rowcount == 1
+
+    def finish_jobs(self, exp_ids, state, timestamp):
+        # type: (List[int], str, float) -> None
+        """Record that experiments finished at `timestamp`, in a single
+        transaction"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE experiments SET state = ?, finished_at = ? WHERE id = ?",
+                [(state, timestamp, exp_id) for exp_id in exp_ids])
+
+    def get_run_durations(self, limit=100):
+        # type: (int) -> List[float]
+        """How long the last `limit` finished experiments ran, in seconds"""
+        self.cursor.execute(
+            "SELECT finished_at - started_at FROM experiments"
+            "  WHERE state = 'done' AND started_at IS NOT NULL"
+            "    AND finished_at IS NOT NULL"
+            "  ORDER BY finished_at DESC LIMIT ?", (limit,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def insert_asha_decision(self, exp_id, group, rung, epoch, loss, decision, created): # pylint: disable=too-many-arguments
+        # type: (int, str, int, int, float, str, float) -> None
+        """Log a decision of asha.ASHA"""
+        self.cursor.execute(
+            "INSERT INTO asha_decisions"
+            "  (experiment_id, group_key, rung, epoch, loss, decision, created)"
+            "  VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (exp_id, group, rung, epoch, loss, decision, created))
+        self.conn.commit()
+
+    def get_asha_decisions(self, group=None):
+        # type: (Union[None, str]) -> List[Dict[str, Any]]
+        """The decisions of asha.ASHA, oldest first
+
+        Args:
+            group: only return the decisions about this group of experiments
+                ('sweep:<id>' or 'definition:<id>')
+        Returns:
+            A list of dicts with the decision's 'exp_id', 'group', 'rung',
+            'epoch', 'loss', 'decision' and 'created'
+        """
+        self.cursor.execute(
+            "SELECT experiment_id, group_key, rung, epoch, loss, decision, created"
+            "  FROM asha_decisions"
+            "  WHERE ? IS NULL OR group_key = ?"
+            "  ORDER BY id", (group, group))
+        keys = ['exp_id', 'group', 'rung', 'epoch', 'loss', 'decision', 'created']
+        return [dict(zip(keys, row)) for row in self.cursor.fetchall()]
+
+    def insert_dataset(self, name, directory):
+        # type: (str, str) -> Union[bool, int]
+        """Register a dataset. Returns False if the name is taken."""
+        if self.get_dataset(name) is not None:
+            return False
+        self.cursor.execute(
+            "INSERT INTO datasets (name, directory) VALUES (?, ?)", (name, directory))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def get_dataset(self, name):
+        # type: (str) -> Union[None, Dict[str, Any]]
+        """Query for a dataset by name, with its cache stats (see get_datasets)"""
+        for dataset in self._datasets("WHERE datasets.name=?", (name,)):
+            return dataset
+        return None
+
     def get_datasets(self):
         # type: () -> List[Any]
-        """Gets a list of all datasets"""
-        self.cursor.execute("SELECT id, name, directory FROM datasets")
-        datasets = []
-        for d_id, name, directory in self.cursor.fetchall():
-            datasets.append({'id': d_id, 'name': name, 'directory': directory})
-        return datasets
+        """Gets a list of all datasets
+
+        Returns:
+            A list of dicts with the dataset's 'id', 'name' and 'directory',
+            and the 'fingerprint', 'checksum', 'size', 'hits', 'misses' and
+            'last_used' of its cache (None when it isn't cached)
+        """
+        return self._datasets("", ())
+
+    def _datasets(self, where, args):
+        self.cursor.execute(
+            "SELECT datasets.id, datasets.name, datasets.directory,"
+            "       dataset_caches.fingerprint, dataset_caches.checksum,"
+            "       dataset_caches.size, dataset_caches.hits,"
+            "       dataset_caches.misses, dataset_caches.last_used"
+            "  FROM datasets"
+            "  LEFT JOIN dataset_caches"
+            "  ON datasets.id == dataset_caches.dataset_id " + where +
+            "  ORDER BY datasets.id", args)
+        keys = ['id', 'name', 'directory', 'fingerprint', 'checksum', 'size',
+                'hits', 'misses', 'last_used']
+        return [dict(zip(keys, row)) for row in self.cursor.fetchall()]
+
+    def set_dataset_cache(self, dataset_id, fingerprint, checksum, size, last_used):
+        # type: (int, str, str, int, float) -> None
+        """Record a freshly built cache, counting a miss"""
+        self.cursor.execute(
+            "INSERT INTO dataset_caches"
+            "  (dataset_id, fingerprint, checksum, size, misses, last_used)"
+            "  VALUES (?, ?, ?, ?, 1, ?)"
+            "  ON CONFLICT (dataset_id) DO UPDATE SET"
+            "    fingerprint=excluded.fingerprint, checksum=excluded.checksum,"
+            "    size=excluded.size, misses=misses + 1,"
+            "    last_used=excluded.last_used",
+            (dataset_id, fingerprint, checksum, size, last_used))
+        self.conn.commit()
+
+    def touch_dataset_cache(self, dataset_id, last_used):
+        # type: (int, float) -> None
+        """Count a cache hit"""
+        self.cursor.execute(
+            "UPDATE dataset_caches SET hits = hits + 1, last_used = ?"
+            "  WHERE dataset_id = ?", (last_used, dataset_id))
+        self.conn.commit()
+
+    def clear_dataset_cache(self, dataset_id):
+        # type: (int) -> bool
+        """Record that a dataset's cache was removed, keeping its hit counts"""
+        self.cursor.execute(
+            "UPDATE dataset_caches SET fingerprint = NULL, checksum = NULL, size = 0"
+            "  WHERE dataset_id=?", (dataset_id,))
+        self.conn.commit()
+        return self.cursor.rowcount == 1
+
+    def insert_checkpoint(self, exp_id, meta):
+        # type: (int, Dict[str, Any]) -> int
+        """Record a checkpoint
+
+        Args:
+            exp_id: the SQL ID of the experiment
+            meta: the metadata returned by checkpoint.write
+        Returns:
+            The ID of the checkpoint
+        """
+        self.cursor.execute(
+            "INSERT INTO checkpoints"
+            "  (experiment_id, step, epoch, position, manifest, size, stored,"
+            "   duration, created)"
+            "  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (exp_id, meta['step'], meta['epoch'], json.dumps(meta['position']),
+             meta['manifest'], meta['size'], meta['stored'], meta['duration'],
+             meta['created']))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def get_checkpoints(self, exp_id):
+        # type: (int) -> List[Dict[str, Any]]
+        """The checkpoints of an experiment, oldest first, as dicts of the
+        metadata passed to insert_checkpoint (and their 'id')"""
+        return self._checkpoints(exp_id, "ORDER BY id")
+
+    def get_latest_checkpoint(self, exp_id):
+        # type: (int) -> Union[None, Dict[str, Any]]
+        """The last checkpoint of an experiment, or None"""
+        for checkpoint in self._checkpoints(exp_id, "ORDER BY id DESC LIMIT 1"):
+            return checkpoint
+        return None
+
+    def _checkpoints(self, exp_id, order):
+        self.cursor.execute(
+            "SELECT id, step, epoch, position, manifest, size, stored,"
+            "       duration, created"
+            "  FROM checkpoints"
+            "  WHERE experiment_id=? " + order, (exp_id,))
+        checkpoints = []
+        for row in self.cursor.fetchall():
+            checkpoint = dict(zip(
+                ['id', 'step', 'epoch', 'position', 'manifest', 'size', 'stored',
+                 'duration', 'created'], row))
+            checkpoint['position'] = json.loads(checkpoint['position'])
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    def delete_checkpoints(self, manifests):
+        # type: (List[str]) -> None
+        """Forget the checkpoints with the given manifests"""
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM checkpoints WHERE manifest=?",
+                [(manifest,) for manifest in manifests])
+
+    def insert_metrics(self, rows):
+        # type: (List[Tuple[int, str, int, int, float, float]]) -> None
+        """Insert many metric values in a single transaction
+
+        Args:
+            rows: (experiment ID, metric name, step, epoch, timestamp, value)
+                tuples
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO metrics"
+                "  (experiment_id, name, step, epoch, timestamp, value)"
+                "  VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def get_metrics(self, exp_id, name, start_step=None, end_step=None):
+        # type: (int, str, Union[None, int], Union[None, int]) -> List[Dict[str, Any]]
+        """Reads the stored values of a metric of an experiment
+
+        Args:
+            exp_id: the SQL ID of the experiment
+            name: the name of the metric
+            start_step: if given, the first step to return
+            end_step: if given, the last step to return
+        Returns:
+            A list of {'step', 'epoch', 'timestamp', 'value'} dicts, ordered
+            by step
+        """
+        self.cursor.execute(
+            "SELECT step, epoch, timestamp, value"
+            "  FROM metrics"
+            "  WHERE experiment_id=? AND name=? AND step BETWEEN ? AND ?"
+            "  ORDER BY step",
+            (exp_id, name,
+             start_step if start_step is not None else -2 ** 63,
+             end_step if end_step is not None else 2 ** 63 - 1))
+        return [
+            {'step': step, 'epoch': epoch, 'timestamp': timestamp, 'value': value}
+            for step, epoch, timestamp, value in self.cursor.fetchall()]
 
     def close(self):
         # type: () -> None
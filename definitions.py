@@ -0,0 +1,168 @@
+"""Validation and compiled caches of experiment definitions
+
+`dlex add` imports a definition once to check that it defines an experiment
+(a class with Experiment in its bases), and records in DLEXDB the SHA-256 of
+its source, the name of that class and its compiled bytecode. Runners then
+execute the cached bytecode and take the class by name, instead of compiling
+the source and scanning the module. The cache is refreshed when the source's
+hash changes.
+
+example:
+    cache = inspect('/defs/mnist.py')       # raises DefinitionError
+    ddb.insert_definition('mnist', '/defs/mnist.py', **cache)
+    ...
+    exp_class = load('/defs/mnist.py', ddb.get_definition_cache(def_id))
+"""
+import hashlib
+import importlib.machinery
+import importlib.util
+import inspect as pyinspect
+import marshal
+from typing import Any, Dict, Tuple, Union # pylint: disable=unused-import
+
+from dlex import Experiment
+
+
+class DefinitionError(Exception):
+    """A definition can't be loaded, or doesn't define an experiment"""
+
+
+def _module_name(path):
+    # type: (str) -> str
+    return path.split('/')[-1].split('.')[0]
+
+
+def dump_code(code):
+    # type: (Any) -> bytes
+    """Serialize a code object, tagged with this interpreter's bytecode
+    version"""
+    return importlib.util.MAGIC_NUMBER + marshal.dumps(code)
+
+
+def load_code(bytecode):
+    # type: (bytes) -> Any
+    """Deserialize a code object, or return None if it was compiled by
+    another Python version"""
+    magic = importlib.util.MAGIC_NUMBER
+    if bytecode is None or bytes(bytecode[:len(magic)]) != magic:
+        return None
+    try:
+        return marshal.loads(bytecode[len(magic):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def compile_source(path):
+    # type: (str) -> Tuple[str, Any]
+    """Read and compile a definition
+
+    Returns:
+        (the SHA-256 of its source, its code object)
+    """
+    try:
+        with open(path, 'rb') as source_file:
+            source = source_file.read()
+    except OSError as error:
+        raise DefinitionError('cannot read %s: %s' % (path, error))
+    try:
+        code = compile(source, path, 'exec', dont_inherit=True)
+    except SyntaxError as error:
+        raise DefinitionError('syntax error in %s: %s' % (path, error))
+    return (hashlib.sha256(source).hexdigest(), code)
+
+
+def source_hash(path):
+    # type: (str) -> Union[None, str]
+    """The SHA-256 of a definition's source, or None if it can't be read"""
+    try:
+        with open(path, 'rb') as source_file:
+            return hashlib.sha256(source_file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def find_experiment(module):
+    # type: (Any) -> Union[None, str]
+    """The name of the first class of `module` with Experiment in its bases"""
+    for item in dir(module):
+        value = getattr(module, item)
+        if pyinspect.isclass(value) and Experiment in value.__bases__:
+            return item
+    return None
+
+
+def _execute(path, code):
+    name = _module_name(path)
+    spec = importlib.util.spec_from_file_location(
+        name, path, loader=importlib.machinery.SourceFileLoader(name, path))
+    module = importlib.util.module_from_spec(spec)
+    exec(code, module.__dict__) # pylint: disable=exec-used
+    return module
+
+
+def inspect(path):
+    # type: (str) -> Dict[str, Any]
+    """Import a definition and find its experiment
+
+    Returns:
+        Its cache: {'source_hash', 'class_name', 'bytecode'}
+
+    Raises:
+        DefinitionError: if the definition can't be imported, or doesn't
+            define an experiment
+    """
+    (digest, code) = compile_source(path)
+    try:
+        module = _execute(path, code)
+    except Exception as error: # pylint: disable=broad-except
+        raise DefinitionError('importing %s failed: %s: %s' % (
+            path, type(error).__name__, error))
+    class_name = find_experiment(module)
+    if class_name is None:
+        raise DefinitionError('%s defines no subclass of Experiment' % path)
+    return {'source_hash': digest, 'class_name': class_name, 'bytecode': dump_code(code)}
+
+
+def refresh(path, cache):
+    # type: (str, Union[None, Dict[str, Any]]) -> Union[None, Dict[str, Any]]
+    """Recompile a definition if its source changed since it was cached
+
+    The class name is kept, as finding it again means executing the
+    definition; `load` falls back to a scan if the class was renamed.
+
+    Returns:
+        The new cache, or None if `cache` is up to date
+    """
+    magic = importlib.util.MAGIC_NUMBER
+    if (cache is not None and cache['bytecode'] is not None
+            and bytes(cache['bytecode'][:len(magic)]) == magic
+            and cache['source_hash'] == source_hash(path)):
+        return None
+    (digest, code) = compile_source(path)
+    return {'source_hash': digest,
+            'class_name': cache['class_name'] if cache is not None else None,
+            'bytecode': dump_code(code)}
+
+
+def load(path, cache=None):
+    # type: (str, Union[None, Dict[str, Any]]) -> Union[None, type]
+    """Execute a definition and return its experiment class
+
+    Args:
+        path: the path of the definition
+        cache: its cache (see `inspect`), trusted to be up to date (see
+            `refresh`); without one the source is compiled and scanned
+
+    Returns:
+        The experiment class, or None if the definition has none
+    """
+    code = load_code(cache['bytecode']) if cache is not None else None
+    if code is None:
+        (_, code) = compile_source(path)
+    module = _execute(path, code)
+    class_name = cache['class_name'] if cache is not None else None
+    exp_class = getattr(module, class_name, None) if class_name is not None else None
+    if not (pyinspect.isclass(exp_class) and Experiment in exp_class.__bases__):
+        class_name = find_experiment(module)
+        exp_class = getattr(module, class_name) if class_name is not None else None
+    return exp_class
@@ -1,3 +1,10 @@
+import array
+import copy
+import mmap
+import os
+import random
+import struct
+
 class Experiment(object):
     def __init__(self, model, optimizer, dataset, epochs=1):
         self.model = model
@@ -6,6 +13,9 @@ class Experiment(object):
         self.epochs = epochs
         self.loss = 0
         self.current_epoch = 0
+        # loader.BatchLoaders, paused and closed by the runner with the
+        # experiment
+        self.loaders = []
 
     def get_epoch(self):
         return self.current_epoch
@@ -22,21 +32,61 @@ class Experiment(object):
     def set_loss(self, loss):
         self.loss = loss
 
+    def set_hyperparams(self, hyperparams):
+        """Apply hyperparam overrides to the running experiment, e.g. to a
+        copy made by `dlex copy`. By default, each one sets the attribute of
+        the same name."""
+        for name, value in hyperparams.items():
+            setattr(self, name, value)
+
     def checkpoint(self):
+        """The state to checkpoint, as a dict of names to values
+
+        Bytes-like values (bytes, array.array, NumPy arrays) are stored as
+        they are and anything else is pickled; entries that don't change
+        between checkpoints are stored once. Training continues while the
+        checkpoint is written, so the values must be copies. The runner
+        records the epoch and position along with them.
+        """
         raise NotImplementedError
 
     def save(self):
-        raise NotImplementedError
+        """The state to checkpoint (see `checkpoint`)"""
+        return self.checkpoint()
 
-    def load(self):
+    def load(self, state):
+        """Restore the state returned by `checkpoint`
+
+        Bytes-like values come back as bytes. `current_epoch` and `position`
+        are restored by the runner.
+        """
         raise NotImplementedError
 
     def is_done(self):
         raise NotImplementedError
 
 class PyTorchExperiment(object):
+    """Checkpointing of `self.model` and `self.optimizer`
+
+    Use it as a mixin: class MyExperiment(PyTorchExperiment, Experiment).
+    Every parameter is its own checkpoint entry, so unchanged (e.g. frozen)
+    parameters are stored once.
+    """
+    def checkpoint(self):
+        state = {
+            'model/' + name: tensor.detach().cpu().clone()
+            for name, tensor in self.model.state_dict().items()}
+        state['optimizer'] = copy.deepcopy(self.optimizer.state_dict())
+        return state
+
     def save(self):
-        pass
+        return self.checkpoint()
+
+    def load(self, state):
+        self.model.load_state_dict({
+            name[len('model/'):]: value
+            for name, value in state.items() if name.startswith('model/')})
+        self.optimizer.load_state_dict(state['optimizer'])
 
 class Dataset(object):
     def __init__(self, dataset_file):
@@ -52,3 +102,134 @@ class Dataset(object):
                 return acc
             acc.append(next_line)
         return acc
+
+_INDEX_HEADER = struct.Struct('=QdQ')
+
+class MappedDataset(object):
+    """A random-access, line-oriented dataset
+
+    The file is memory-mapped, and the offsets of its lines are indexed once
+    and cached next to it (in `path + '.idx'`, rebuilt whenever the file's
+    size or modification time change). Samples are returned as memoryview
+    slices of the mapping, without the trailing newline and without copying.
+
+    Unlike Dataset, samples can be read in any order: `dataset[i]`, shuffled
+    epochs with `batches`, and resuming from a position saved with `state`.
+    """
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path if index_path is not None else path + '.idx'
+        self.file = open(path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        if stat.st_size > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+        else:
+            self.mmap = None
+            self.view = memoryview(b'')
+        self.offsets = self._load_index(stat)
+        self.epoch = 0
+        self.position = 0
+
+    def _load_index(self, stat):
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                header = index_file.read(_INDEX_HEADER.size)
+                (size, mtime, count) = _INDEX_HEADER.unpack(header)
+                if size == stat.st_size and mtime == stat.st_mtime:
+                    offsets = array.array('Q')
+                    offsets.fromfile(index_file, count)
+                    return offsets
+        except (OSError, struct.error, EOFError):
+            pass
+        offsets = self._build_index()
+        try:
+            tmp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+            with open(tmp_path, 'wb') as index_file:
+                index_file.write(_INDEX_HEADER.pack(stat.st_size, stat.st_mtime, len(offsets)))
+                offsets.tofile(index_file)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass
+        return offsets
+
+    def _build_index(self):
+        """Offsets of the start of every line, followed by the file size"""
+        offsets = array.array('Q')
+        size = len(self.view)
+        start = 0
+        while start < size:
+            offsets.append(start)
+            end = self.mmap.find(b'\n', start)
+            start = size if end == -1 else end + 1
+        offsets.append(size)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('sample %d out of range' % i)
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        if end > start and self.view[end - 1] == 0x0a:
+            end -= 1
+        return self.view[start:end]
+
+    def order(self, epoch, shuffle=False, seed=0):
+        """The order samples are read in during `epoch`"""
+        indices = list(range(len(self)))
+        if shuffle:
+            random.Random(seed * 1000003 + epoch).shuffle(indices)
+        return indices
+
+    def batches(self, batch_size=1, shuffle=False, seed=0):
+        """Yield the batches of the current epoch, from the current position
+
+        Each batch is a list of samples. When the epoch is over, `epoch` is
+        incremented and `position` goes back to 0.
+        """
+        order = self.order(self.epoch, shuffle, seed)
+        while self.position < len(order):
+            indices = order[self.position:self.position + batch_size]
+            self.position += len(indices)
+            yield [self[i] for i in indices]
+        self.epoch += 1
+        self.position = 0
+
+    def next(self, batch_size=1):
+        """Like Dataset.next: the next `batch_size` samples in file order, or
+        None at the end of the file"""
+        if self.position >= len(self):
+            return None
+        end = min(self.position + batch_size, len(self))
+        batch = [self[i] for i in range(self.position, end)]
+        self.position = end
+        return batch
+
+    def state(self):
+        return {'epoch': self.epoch, 'position': self.position}
+
+    def resume(self, state):
+        """Continue from a `state()`, without reading the skipped samples"""
+        self.epoch = state['epoch']
+        self.position = state['position']
+
+    def close(self):
+        """Close the file and unmap it
+
+        Samples still referenced (e.g. in the batches of a BatchLoader) keep
+        the mapping alive: it is then unmapped when the last of them is
+        collected, and they can be read until then.
+        """
+        self.view.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+            self.mmap = None
+        self.file.close()
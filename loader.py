@@ -0,0 +1,224 @@
+"""Parallel prefetching of dataset batches
+
+See BatchLoader class docstring for usage.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+from dlex import MappedDataset
+
+# how long blocked workers wait before checking whether they were closed
+_POLL_INTERVAL = 0.1
+
+
+class WorkerError(Exception):
+    """A loader's worker failed to read or decode a batch"""
+
+
+def _put(out, item, running, stopped):
+    """Put `item` on `out` once it has room, unless the loader is closed
+    first. Returns whether it was put."""
+    while not stopped.is_set():
+        if not running.wait(_POLL_INTERVAL):
+            continue
+        try:
+            out.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(dataset, batch_size, shuffle, seed, start, worker, workers, out, running, stopped): # pylint: disable=too-many-arguments
+    """The body of a worker: read and decode every `workers`-th batch.
+
+    If reading or decoding fails, the worker puts (None, None, the formatted
+    exception) in place of its next batch, which BatchLoader raises as a
+    WorkerError, and stops.
+
+    Args:
+        dataset: a MappedDataset shared by thread workers, or the path of
+            the dataset for process workers, which map it themselves
+    """
+    (epoch, first_batch, decode) = start
+    as_bytes = isinstance(dataset, str)
+    try:
+        if as_bytes:
+            dataset = MappedDataset(dataset)
+        while not stopped.is_set():
+            order = dataset.order(epoch, shuffle, seed)
+            batches = (len(order) + batch_size - 1) // batch_size
+            for k in range(first_batch, batches):
+                if k % workers != worker:
+                    continue
+                samples = [dataset[i] for i in order[k * batch_size:(k + 1) * batch_size]]
+                if as_bytes:
+                    samples = [bytes(sample) for sample in samples]
+                batch = decode(samples) if decode is not None else samples
+                if not _put(out, (epoch, k, batch), running, stopped):
+                    return
+            epoch += 1
+            first_batch = 0
+    except Exception: # pylint: disable=broad-except
+        _put(out, (None, None, traceback.format_exc()), running, stopped)
+    finally:
+        if as_bytes and isinstance(dataset, MappedDataset):
+            dataset.close()
+
+
+class BatchLoader(object):
+    """Reads and decodes batches ahead of the training loop
+
+    `workers` threads (mode='thread', for I/O-bound parsing) or processes
+    (mode='process', for CPU-heavy decoding) read batches of a MappedDataset
+    and run `decode(samples)` on them, at most `prefetch` batches ahead of the
+    consumer. Batch k of an epoch is always made by worker k % workers, and
+    read back from that worker's queue, so batches come out in the same order
+    as with a single reader. With `shuffle`, each epoch's order is a
+    permutation drawn from `seed` and the epoch number (see
+    MappedDataset.order).
+
+    Samples are passed to `decode` as memoryviews in thread mode and as bytes
+    in process mode, where `decode` must also be picklable.
+
+    Iterating over the loader yields the batches of one epoch; iterate again
+    for the next one. It raises WorkerError if a worker fails to read or
+    decode a batch, or exits. Experiments should add their loaders to
+    `Experiment.loaders`, so that the runner pauses them with the experiment
+    and closes them when it ends.
+
+    example:
+        loader = BatchLoader('train.txt', 32, decode=parse, shuffle=True)
+        self.loaders.append(loader)
+        for batch in loader:
+            ...
+    """
+    def __init__(self, path, batch_size, decode=None, workers=2, prefetch=8, # pylint: disable=too-many-arguments
+                 shuffle=False, seed=0, mode='thread', state=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = state['epoch'] if state is not None else 0
+        self.position = state['position'] if state is not None else 0
+        self.decode = decode
+        self.prefetch = prefetch
+        self.mode = mode
+        if mode not in ('thread', 'process'):
+            raise ValueError('unknown mode %s' % mode)
+        self.dataset = MappedDataset(path)
+        self.size = len(self.dataset)
+        # the seconds the consumer waited for batches (see profiling.py)
+        self.wait_time = 0.0
+        self._start()
+
+    def _start(self):
+        """Start the workers, from the current position"""
+        if self.mode == 'thread':
+            make_queue = queue.Queue
+            make_event = threading.Event
+            make_worker = threading.Thread
+            source = self.dataset
+        else:
+            make_queue = multiprocessing.Queue
+            make_event = multiprocessing.Event
+            make_worker = multiprocessing.Process
+            source = self.path
+
+        self.running = make_event()
+        self.running.set()
+        self.stopped = make_event()
+        per_worker = max(1, self.prefetch // self.workers)
+        self.queues = [make_queue(per_worker) for _ in range(self.workers)]
+        start = (self.epoch, self.position // self.batch_size, self.decode)
+        self.threads = [
+            make_worker(
+                target=_produce,
+                args=(source, self.batch_size, self.shuffle, self.seed, start, worker,
+                      self.workers, self.queues[worker], self.running, self.stopped),
+                daemon=True)
+            for worker in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def restart(self):
+        """Start new workers in a forked copy of the process
+
+        Threads don't survive a fork, and worker processes belong to the
+        parent, so the copy's loader starts its own workers from the current
+        position (batches prefetched by the parent are read again).
+        """
+        self._start()
+
+    def __len__(self):
+        """The number of batches in an epoch"""
+        return (self.size + self.batch_size - 1) // self.batch_size
+
+    def _get(self, worker):
+        """The next item of a worker's queue, as long as the worker runs"""
+        worker_queue = self.queues[worker]
+        while True:
+            try:
+                return worker_queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if not self.threads[worker].is_alive():
+                    break
+        try:
+            # put before it exited
+            return worker_queue.get_nowait()
+        except queue.Empty:
+            raise WorkerError('worker %d exited' % worker) from None
+
+    def __iter__(self):
+        first_batch = self.position // self.batch_size
+        for k in range(first_batch, len(self)):
+            start = time.perf_counter()
+            (epoch, batch_index, batch) = self._get(k % self.workers)
+            self.wait_time += time.perf_counter() - start
+            if epoch is None:
+                raise WorkerError('worker %d failed:\n%s' % (k % self.workers, batch))
+            assert (epoch, batch_index) == (self.epoch, k)
+            self.position = min((k + 1) * self.batch_size, self.size)
+            yield batch
+        self.epoch += 1
+        self.position = 0
+
+    def state(self):
+        """Where the loader is, to resume from with BatchLoader(state=...)"""
+        return {'epoch': self.epoch, 'position': self.position}
+
+    def pause(self):
+        """Stop reading ahead until `resume`."""
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    @staticmethod
+    def _drain(worker_queue):
+        try:
+            while True:
+                worker_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        """Stop and join the workers."""
+        self.stopped.set()
+        self.running.set()
+        for thread in self.threads:
+            while True:
+                # unblock workers waiting on a full queue, and in process
+                # mode, the feeder threads of their queues, which the
+                # workers wait for on exit: they may be writing a batch put
+                # after the queue was last drained
+                for worker_queue in self.queues:
+                    self._drain(worker_queue)
+                thread.join(_POLL_INTERVAL)
+                if not thread.is_alive():
+                    break
+        self.dataset.close()
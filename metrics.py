@@ -0,0 +1,329 @@
+"""Bounded per-experiment metric history for dlexd
+
+See MetricSeries and MetricStore for usage, and MetricWriter for persisting
+metrics to the DLEXDB metrics table.
+"""
+import array
+import threading
+import time
+import traceback
+from typing import Dict, Any, List, Optional # pylint: disable=unused-import
+
+import db
+
+COLUMNS = ('first_step', 'last_step', 'epoch', 'timestamp', 'min', 'mean', 'max', 'count')
+
+_TYPECODES = {
+    'first_step': 'q',
+    'last_step': 'q',
+    'epoch': 'q',
+    'timestamp': 'd',
+    'min': 'd',
+    'mean': 'd',
+    'max': 'd',
+    'count': 'q',
+}
+
+
+class _Ring(object):
+    """A ring of at most `capacity` buckets, stored as one array per column
+
+    The arrays grow as buckets are appended, until they hold `capacity`
+    buckets, and are then reused in place.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.columns = {name: array.array(_TYPECODES[name]) for name in COLUMNS}
+
+    def full(self):
+        return self.size == self.capacity
+
+    def append(self, bucket):
+        # type: (List[Any]) -> None
+        """Append a bucket (a list of values, in COLUMNS order). The ring
+        must not be full."""
+        index = (self.start + self.size) % self.capacity
+        if index == len(self.columns['count']):
+            # not grown to capacity yet
+            for name, value in zip(COLUMNS, bucket):
+                self.columns[name].append(value)
+        else:
+            for name, value in zip(COLUMNS, bucket):
+                self.columns[name][index] = value
+        self.size += 1
+
+    def pop(self):
+        # type: () -> List[Any]
+        """Remove and return the oldest bucket."""
+        bucket = [self.columns[name][self.start] for name in COLUMNS]
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+        return bucket
+
+    def buckets(self):
+        """Yield every bucket, oldest first."""
+        for i in range(self.size):
+            index = (self.start + i) % self.capacity
+            yield [self.columns[name][index] for name in COLUMNS]
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+
+def _merge(acc, bucket):
+    # type: (Optional[List[Any]], List[Any]) -> List[Any]
+    """Merge `bucket` (newer) into the aggregate bucket `acc` (older)."""
+    if acc is None:
+        return list(bucket)
+    count = acc[7] + bucket[7]
+    return [
+        acc[0], bucket[1], bucket[2], bucket[3],
+        min(acc[4], bucket[4]),
+        (acc[5] * acc[7] + bucket[5] * bucket[7]) / count,
+        max(acc[6], bucket[6]),
+        count]
+
+
+class MetricSeries(object):
+    """The history of one metric of one experiment, in bounded memory
+
+    Recent points are kept at full resolution in a ring of `capacity` points.
+    When it is full, the oldest points are folded, `factor` at a time, into
+    min/mean/max buckets in a second ring of the same capacity, whose oldest
+    buckets are folded into a third ring, and so on for `levels` rings. Once
+    the last ring is full its oldest buckets are dropped.
+
+    Memory use grows with the points recorded up to `levels` * `capacity`
+    buckets, while the span of steps covered grows geometrically with
+    `levels`: capacity * (1 + factor + ... + factor ** (levels - 1)) points.
+
+    example:
+        series = MetricSeries()
+        series.append(step, epoch, loss)
+        series.query(start_step=1000)
+    """
+    def __init__(self, capacity=1024, factor=16, levels=4):
+        self.factor = factor
+        self.rings = [_Ring(capacity) for _ in range(levels)]
+        # pending[i] accumulates buckets evicted from rings[i - 1] until it
+        # holds `factor` of them and is pushed to rings[i]
+        self.pending = [None] * levels
+        self.pending_count = [0] * levels
+
+    def append(self, step, epoch, value, timestamp=None):
+        # type: (int, int, float, Optional[float]) -> None
+        """Record `value` at training step `step`."""
+        if timestamp is None:
+            timestamp = time.time()
+        self._push(0, [step, step, epoch, timestamp, value, value, value, 1])
+
+    def append_summary(self, first_step, last_step, epoch, summary, timestamp=None): # pylint: disable=too-many-arguments
+        """Record the aggregate of a metric over steps first_step..last_step.
+
+        Args:
+            summary: a dict with 'min', 'mean', 'max' and 'count' keys
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self._push(0, [
+            first_step, last_step, epoch, timestamp,
+            summary['min'], summary['mean'], summary['max'], summary['count']])
+
+    def _push(self, level, bucket):
+        ring = self.rings[level]
+        if ring.full():
+            evicted = ring.pop()
+            if level + 1 < len(self.rings):
+                self._fold(level + 1, evicted)
+        ring.append(bucket)
+
+    def _fold(self, level, bucket):
+        self.pending[level] = _merge(self.pending[level], bucket)
+        self.pending_count[level] += 1
+        if self.pending_count[level] == self.factor:
+            merged = self.pending[level]
+            self.pending[level] = None
+            self.pending_count[level] = 0
+            self._push(level, merged)
+
+    def buckets(self):
+        """Yield every bucket, oldest first."""
+        for level in reversed(range(len(self.rings))):
+            for bucket in self.rings[level].buckets():
+                yield bucket
+            if self.pending[level] is not None:
+                yield self.pending[level]
+
+    def query(self, start_step=None, end_step=None):
+        # type: (Optional[int], Optional[int]) -> Dict[str, List[Any]]
+        """Return the buckets overlapping [start_step, end_step], oldest first.
+
+        Returns:
+            A dict of columns (see COLUMNS). Full resolution points have a
+            count of 1 and equal min, mean and max.
+        """
+        result = {name: [] for name in COLUMNS}
+        for bucket in self.buckets():
+            if start_step is not None and bucket[1] < start_step:
+                continue
+            if end_step is not None and bucket[0] > end_step:
+                break
+            for name, value in zip(COLUMNS, bucket):
+                result[name].append(value)
+        return result
+
+    def epoch_mean(self, epoch):
+        # type: (int) -> Optional[float]
+        """The mean of the values recorded during `epoch`, or None if there
+        are none. Buckets folded across epochs count for their last one."""
+        (total, count) = (0.0, 0)
+        for bucket in self.buckets():
+            if bucket[2] == epoch:
+                total += bucket[5] * bucket[7]
+                count += bucket[7]
+        return total / count if count > 0 else None
+
+    def nbytes(self):
+        """The memory used by the ring buffers."""
+        return sum(ring.nbytes() for ring in self.rings)
+
+
+class MetricStore(object):
+    """MetricSeries for every metric of every experiment
+
+    Each experiment may record at most `max_metrics` different metrics, so
+    memory per experiment is bounded by max_metrics * MetricSeries.nbytes().
+    """
+    def __init__(self, max_metrics=8, **series_args):
+        self.max_metrics = max_metrics
+        self.series_args = series_args
+        self.series = {} # type: Dict[Any, Dict[str, MetricSeries]]
+
+    def _series(self, exp_id, metric):
+        metrics = self.series.setdefault(exp_id, {})
+        if metric not in metrics:
+            if len(metrics) >= self.max_metrics:
+                raise ValueError(
+                    'experiment %s already records %d metrics' % (exp_id, self.max_metrics))
+            metrics[metric] = MetricSeries(**self.series_args)
+        return metrics[metric]
+
+    def append(self, exp_id, metric, step, epoch, value, timestamp=None): # pylint: disable=too-many-arguments
+        """Record `value` of `metric` for experiment `exp_id`."""
+        self._series(exp_id, metric).append(step, epoch, value, timestamp)
+
+    def append_summary(self, exp_id, metric, first_step, last_step, epoch, summary): # pylint: disable=too-many-arguments
+        """Record an aggregate of `metric` (see MetricSeries.append_summary)."""
+        self._series(exp_id, metric).append_summary(first_step, last_step, epoch, summary)
+
+    def query(self, exp_id, metric, start_step=None, end_step=None):
+        """Return MetricSeries.query for a metric, or None if it's unknown."""
+        series = self.series.get(exp_id, {}).get(metric)
+        if series is None:
+            return None
+        return series.query(start_step, end_step)
+
+    def epoch_mean(self, exp_id, metric, epoch):
+        """Return MetricSeries.epoch_mean for a metric, or None if it's
+        unknown."""
+        series = self.series.get(exp_id, {}).get(metric)
+        if series is None:
+            return None
+        return series.epoch_mean(epoch)
+
+    def metrics(self, exp_id):
+        # type: (Any) -> List[str]
+        """The names of the metrics recorded for `exp_id`."""
+        return sorted(self.series.get(exp_id, {}))
+
+    def remove(self, exp_id):
+        """Forget all metrics of `exp_id`."""
+        self.series.pop(exp_id, None)
+
+
+class MetricWriter(threading.Thread):
+    """Persists metric values to SQLite in the background
+
+    `write` only appends to an in-memory buffer, so it never waits on the
+    disk. The writer thread inserts the buffered rows with one executemany
+    in one transaction whenever `max_rows` rows are buffered or `max_delay`
+    seconds have passed, and once more on `close`. Rows that fail to be
+    inserted (e.g. the disk is full) are logged and dropped, and counted in
+    `dropped`.
+
+    example:
+        writer = MetricWriter('~/mystate.db')
+        writer.start()
+        writer.write(exp_id, 'loss', step, epoch, loss)
+        writer.close()
+    """
+    def __init__(self, db_path, max_rows=5000, max_delay=1.0):
+        super(MetricWriter, self).__init__(name='MetricWriter', daemon=True)
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.rows = [] # type: List[Any]
+        # called once the rows buffered before them are written
+        self.callbacks = [] # type: List[Any]
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, exp_id, name, step, epoch, value, timestamp=None): # pylint: disable=too-many-arguments
+        """Buffer one metric value."""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            self.rows.append((exp_id, name, step, epoch, timestamp, value))
+            if len(self.rows) >= self.max_rows:
+                self.wakeup.set()
+
+    def after_write(self, callback):
+        """Call `callback(ddb)`, in the writer thread with its DLEXDB, once the
+        rows buffered so far are written (e.g. to write other rows off the
+        caller's thread)."""
+        with self.lock:
+            self.callbacks.append(callback)
+        self.wakeup.set()
+
+    def flush(self, ddb):
+        """Write the buffered rows with `ddb`."""
+        with self.lock:
+            rows = self.rows
+            self.rows = []
+            callbacks = self.callbacks
+            self.callbacks = []
+        if rows != []:
+            try:
+                ddb.insert_metrics(rows)
+                self.written += len(rows)
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
+                self.dropped += len(rows)
+        for callback in callbacks:
+            try:
+                callback(ddb)
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
+
+    def run(self):
+        # SQLite connections can't be shared between threads
+        ddb = db.DLEXDB(self.db_path)
+        try:
+            while not self.stopped:
+                self.wakeup.wait(self.max_delay)
+                self.wakeup.clear()
+                self.flush(ddb)
+            self.flush(ddb)
+        finally:
+            ddb.close()
+
+    def close(self):
+        """Flush the remaining rows and stop the writer thread."""
+        self.stopped = True
+        self.wakeup.set()
+        self.join()
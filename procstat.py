@@ -0,0 +1,281 @@
+"""CPU, memory and I/O telemetry of running experiments, read from /proc
+
+dlexd samples the process tree of every running experiment (its runner's
+parent, whose pid is the experiment's, the runner and their children, e.g.
+loader workers) every few seconds:
+
+    sampler = Sampler()
+    sampler.sample({exp_id: pid, ...})
+    sampler.latest(exp_id)   # {'cpu': percent, 'rss': bytes, ...}
+    sampler.series(exp_id)   # the last `history` samples, oldest first
+
+Each process's /proc/<pid>/stat, status and io files are opened once and
+re-read with pread on every pass. An experiment's CPU time, page faults and
+read/write bytes add up what each of its processes did between passes, so
+they don't go down when a child process exits.
+
+Children are found through /proc/<pid>/task/<pid>/children, or on kernels
+without it, through the parent of every process in /proc, which is read once
+per process.
+"""
+import collections
+import os
+import time
+from typing import Any, Dict, List, Tuple, Union # pylint: disable=unused-import
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# the fields of a sample: the time it was taken, the number of processes, CPU
+# use in % of a core since the last sample, resident and swapped memory in
+# bytes, and minor and major page faults, bytes read from and written to
+# storage since the experiment started
+FIELDS = ('time', 'processes', 'cpu', 'rss', 'swap', 'minflt', 'majflt', 'read_bytes',
+          'write_bytes')
+
+HAS_CHILDREN_FILES = os.path.exists('/proc/self/task/%d/children' % os.getpid())
+
+
+def _parse_stat(stat):
+    # type: (bytes) -> List[bytes]
+    """The fields of /proc/<pid>/stat after the command, which may contain
+    spaces and parentheses: field N of proc(5) is at index N - 3"""
+    return stat[stat.rindex(b')') + 2:].split()
+
+
+def _parse_kb(status, name):
+    # type: (bytes, bytes) -> int
+    """The size in bytes of the line `name` (e.g. b'\\nVmSwap:') of
+    /proc/<pid>/status, or 0 if it's missing"""
+    start = status.find(name)
+    if start == -1:
+        return 0
+    return int(status[start + len(name):status.find(b' kB', start)]) * 1024
+
+
+class ProcFile(object):
+    """A /proc file kept open, and read from the start on every call"""
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        # type: () -> bytes
+        return os.pread(self.fd, 16384, 0)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Process(object):
+    """The /proc files of a process
+
+    The files belong to the process that was opened, so once it has exited
+    they raise OSError, even if its pid has been reused.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.files = []
+        self.stat = self.open('/proc/%d/stat' % pid)
+        self.status = self.open('/proc/%d/status' % pid)
+        try:
+            self.io = self.open('/proc/%d/io' % pid)
+        except PermissionError:
+            # another user's process (e.g. a setuid child)
+            self.io = None
+        self.children = None
+        if HAS_CHILDREN_FILES:
+            self.children = self.open('/proc/%d/task/%d/children' % (pid, pid))
+        # the counters at the last read
+        self.counters = (0, 0, 0, 0, 0)
+
+    def open(self, path):
+        try:
+            proc_file = ProcFile(path)
+        except OSError:
+            self.close()
+            raise
+        self.files.append(proc_file)
+        return proc_file
+
+    def read(self, totals):
+        # type: (List[float]) -> Tuple[int, int]
+        """Add the counters' changes since the last read to `totals`
+
+        Returns:
+            (rss, swap) in bytes
+        """
+        fields = _parse_stat(self.stat.read())
+        (read_bytes, write_bytes) = (0, 0)
+        if self.io is not None:
+            # rchar, wchar, syscr, syscw, read_bytes, write_bytes, ...
+            io = self.io.read().split()
+            (read_bytes, write_bytes) = (int(io[9]), int(io[11]))
+        counters = ((int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[7]),
+                    int(fields[9]), read_bytes, write_bytes)
+        last = self.counters
+        totals[0] += counters[0] - last[0]
+        totals[1] += counters[1] - last[1]
+        totals[2] += counters[2] - last[2]
+        totals[3] += counters[3] - last[3]
+        totals[4] += counters[4] - last[4]
+        self.counters = counters
+        return (int(fields[21]) * PAGE_SIZE, _parse_kb(self.status.read(), b'\nVmSwap:'))
+
+    def child_pids(self):
+        # type: () -> List[int]
+        return [int(pid) for pid in self.children.read().split()]
+
+    def close(self):
+        for proc_file in self.files:
+            proc_file.close()
+        self.files = []
+
+
+class ProcessTree(object):
+    """The processes of an experiment, and its samples"""
+    def __init__(self, pid, history):
+        self.pid = pid
+        self.processes = {} # type: Dict[int, Process]
+        self.totals = [0.0, 0, 0, 0, 0]
+        self.samples = collections.deque(maxlen=history)
+        self.last_sampled = None
+
+    def child_pids(self, pid):
+        # type: (int) -> List[int]
+        """The children of `pid`, from its children file"""
+        try:
+            if pid in self.processes:
+                return self.processes[pid].child_pids()
+            with open('/proc/%d/task/%d/children' % (pid, pid), 'rb') as children:
+                return [int(child) for child in children.read().split()]
+        except OSError:
+            return []
+
+    def update(self, children=None):
+        """Open the processes that joined the tree and close the ones that
+        left it
+
+        Args:
+            children: the pids of the children of each pid, or None to read
+                them from the children files
+        """
+        pids = set()
+        stack = [self.pid]
+        while stack != []:
+            pid = stack.pop()
+            if pid in pids:
+                continue
+            pids.add(pid)
+            stack.extend(self.child_pids(pid) if children is None else children.get(pid, []))
+        for pid in list(self.processes):
+            if pid not in pids:
+                self.processes.pop(pid).close()
+        for pid in pids:
+            if pid not in self.processes:
+                try:
+                    self.processes[pid] = Process(pid)
+                except OSError:
+                    # it exited
+                    pass
+
+    def sample(self):
+        now = time.monotonic()
+        totals = self.totals
+        cpu = totals[0]
+        (rss, swap) = (0, 0)
+        for (pid, process) in list(self.processes.items()):
+            try:
+                (process_rss, process_swap) = process.read(totals)
+            except OSError:
+                self.processes.pop(pid).close()
+                continue
+            rss += process_rss
+            swap += process_swap
+        cpu_percent = None
+        if self.last_sampled is not None and now > self.last_sampled:
+            cpu_percent = 100 * (totals[0] - cpu) / (now - self.last_sampled)
+        self.last_sampled = now
+        self.samples.append((time.time(), len(self.processes), cpu_percent, rss, swap,
+                             self.totals[1], self.totals[2], self.totals[3], self.totals[4]))
+
+    def close(self):
+        for process in self.processes.values():
+            process.close()
+        self.processes = {}
+
+
+class Sampler(object):
+    """Samples the process trees of running experiments (see `sample`)
+
+    Args:
+        history: the number of samples kept per experiment
+    """
+    def __init__(self, history=600):
+        self.history = history
+        self.trees = {} # type: Dict[int, ProcessTree]
+        # pid -> its parent, for kernels without children files
+        self.parents = {} # type: Dict[int, int]
+
+    def children(self):
+        # type: () -> Dict[int, List[int]]
+        """The pids of the children of each pid, from a scan of /proc"""
+        parents = {}
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            parent = self.parents.get(pid)
+            if parent is None:
+                try:
+                    with open('/proc/%d/stat' % pid, 'rb') as stat:
+                        parent = int(_parse_stat(stat.read())[1])
+                except OSError:
+                    continue
+            parents[pid] = parent
+        self.parents = parents
+        children = collections.defaultdict(list)
+        for (pid, parent) in parents.items():
+            children[parent].append(pid)
+        return children
+
+    def sample(self, pids):
+        # type: (Dict[int, int]) -> None
+        """Take a sample of each experiment, and forget the experiments that
+        stopped running
+
+        Args:
+            pids: the pid of each running experiment, by experiment ID
+        """
+        for (exp_id, tree) in list(self.trees.items()):
+            if pids.get(exp_id) != tree.pid:
+                self.trees.pop(exp_id).close()
+        for (exp_id, pid) in pids.items():
+            if exp_id not in self.trees:
+                self.trees[exp_id] = ProcessTree(pid, self.history)
+        if self.trees == {}:
+            return
+        children = None if HAS_CHILDREN_FILES else self.children()
+        for tree in self.trees.values():
+            tree.update(children)
+            tree.sample()
+
+    def latest(self, exp_id):
+        # type: (int) -> Union[None, Dict[str, Any]]
+        """The latest sample of an experiment, or None if it isn't sampled"""
+        tree = self.trees.get(exp_id)
+        if tree is None or len(tree.samples) == 0:
+            return None
+        return dict(zip(FIELDS, tree.samples[-1]))
+
+    def series(self, exp_id):
+        # type: (int) -> List[Dict[str, Any]]
+        """The samples of an experiment, oldest first"""
+        tree = self.trees.get(exp_id)
+        if tree is None:
+            return []
+        return [dict(zip(FIELDS, sample)) for sample in tree.samples]
+
+    def close(self):
+        for tree in self.trees.values():
+            tree.close()
+        self.trees = {}
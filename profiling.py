@@ -0,0 +1,241 @@
+"""Phase timings, step-time histograms and on-demand profiling of runners
+
+A Runner keeps a Profile of its experiment: the wall and CPU time of each
+phase of the run (loading the definition, initializing the experiment,
+loading its checkpoint, training), a histogram of the time of its training
+steps, and the time the runner itself spends writing to its pipe and polling
+it. The Profile's summary is sent through the pipe every `interval` seconds
+and when the run ends, and dlexd serves the latest one (see `dlex status
+--profile`).
+
+A running experiment can also be profiled with cProfile for a few seconds
+(see `dlex profile`), which writes a pstats file:
+
+    python -m pstats /path/to/stats
+"""
+import cProfile
+import math
+import os
+import time
+from typing import Any, Dict, List, Union # pylint: disable=unused-import
+
+
+class StepHistogram(object):
+    """A histogram of durations in logarithmic buckets
+
+    Bucket k holds durations in [min_time * ratio^k, min_time * ratio^(k+1)),
+    so percentiles are within a factor `ratio` of the exact ones in constant
+    memory, however many steps are recorded.
+    """
+    def __init__(self, min_time=1e-6, ratio=2 ** 0.125):
+        self.min_time = min_time
+        self.ratio = ratio
+        self.log_ratio = math.log(ratio)
+        self.buckets = {} # type: Dict[int, int]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        # type: (float) -> None
+        """Record a duration in seconds"""
+        if duration <= self.min_time:
+            bucket = 0
+        else:
+            bucket = int(math.log(duration / self.min_time) / self.log_ratio)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, percent):
+        # type: (float) -> Union[None, float]
+        """The duration below which `percent`% of the durations are (the
+        upper bound of its bucket), or None if there are none"""
+        if self.count == 0:
+            return None
+        rank = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.min_time * self.ratio ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        # type: () -> Dict[str, Any]
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count != 0 else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max if self.count != 0 else None}
+
+
+class Phase(object):
+    """Times a phase of a Profile, between `start` and `stop` or as a
+    context manager"""
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.started = None
+
+    def start(self):
+        self.started = (time.perf_counter(), time.process_time())
+        return self
+
+    def stop(self):
+        self.profile.add_phase(
+            self.name, time.perf_counter() - self.started[0],
+            time.process_time() - self.started[1])
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Profile(object):
+    """The timings of a run
+
+    Args:
+        interval: how often the summary is sent, in seconds (see `due`)
+    """
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        # name -> [wall, cpu], in the order the phases started
+        self.phases = {} # type: Dict[str, List[float]]
+        self.steps = StepHistogram()
+        # name -> [seconds, calls] of the runner's own overhead
+        self.overhead = {'pipe_write': [0.0, 0], 'select': [0.0, 0]}
+        self.last_sent = time.monotonic()
+
+    def phase(self, name):
+        # type: (str) -> Phase
+        """Phase `name`, to use as a context manager or to start and stop"""
+        return Phase(self, name)
+
+    def add_phase(self, name, wall, cpu):
+        # type: (str, float, float) -> None
+        times = self.phases.setdefault(name, [0.0, 0.0])
+        times[0] += wall
+        times[1] += cpu
+
+    def add_overhead(self, name, duration):
+        # type: (str, float) -> None
+        totals = self.overhead[name]
+        totals[0] += duration
+        totals[1] += 1
+
+    def due(self):
+        # type: () -> bool
+        """Whether `interval` seconds have passed since the summary was last
+        sent (see `sent`)"""
+        return time.monotonic() - self.last_sent >= self.interval
+
+    def sent(self):
+        self.last_sent = time.monotonic()
+
+    def summary(self, running=None, extra=None):
+        # type: (Union[None, Phase], Union[None, Dict[str, float]]) -> Dict[str, Any]
+        """The profile as a JSON-serializable dict
+
+        Args:
+            running: a phase that hasn't ended, counted up to now
+            extra: other overheads, in seconds (e.g. 'data_wait')
+        """
+        phases = {name: {'wall': wall, 'cpu': cpu}
+                  for (name, (wall, cpu)) in self.phases.items()}
+        if running is not None:
+            (wall, cpu) = self.phases.get(running.name, [0.0, 0.0])
+            phases[running.name] = {
+                'wall': wall + time.perf_counter() - running.started[0],
+                'cpu': cpu + time.process_time() - running.started[1]}
+        overhead = {name: {'seconds': seconds, 'calls': calls}
+                    for (name, (seconds, calls)) in self.overhead.items()}
+        for (name, seconds) in (extra or {}).items():
+            overhead[name] = {'seconds': seconds, 'calls': None}
+        return {'phases': phases, 'steps': self.steps.summary(), 'overhead': overhead,
+                'time': time.time()}
+
+
+class TimedPipe(object):
+    """A runner's pipe, with the time spent writing to it added to a Profile"""
+    def __init__(self, pipe, profile):
+        self.pipe = pipe
+        self.profile = profile
+
+    def write(self, msg):
+        start = time.perf_counter()
+        self.pipe.write(msg)
+        self.profile.add_overhead('pipe_write', time.perf_counter() - start)
+
+    def read(self):
+        return self.pipe.read()
+
+    def fileno(self):
+        return self.pipe.fileno()
+
+
+class Profiler(object):
+    """Runs cProfile in the runner's thread for a given time
+
+    The runner calls `check` between steps, which writes the stats file
+    once the time is up. A stats file that can't be written doesn't stop the
+    run: `error` then says why, until the next stats file.
+    """
+    def __init__(self):
+        self.profiler = None
+        self.path = None
+        self.end = None
+        self.error = None # type: Union[None, str]
+
+    def start(self, seconds, path):
+        # type: (float, str) -> Union[None, str]
+        """Profile the next `seconds` seconds into the pstats file `path`
+
+        Returns:
+            The stats file of the profile that was running, if any, which is
+            written out first
+        """
+        previous = self.stop()
+        self.profiler = cProfile.Profile()
+        self.path = path
+        self.end = time.monotonic() + seconds
+        self.profiler.enable()
+        return previous
+
+    def check(self):
+        # type: () -> Union[None, str]
+        """Stop profiling if the time is up. Returns the stats file then."""
+        if self.profiler is None or time.monotonic() < self.end:
+            return None
+        return self.stop()
+
+    def stop(self):
+        # type: () -> Union[None, str]
+        """Stop profiling. Returns the stats file, if a profile was running,
+        even if writing it failed (see `error`)."""
+        if self.profiler is None:
+            return None
+        (profiler, self.profiler) = (self.profiler, None)
+        profiler.disable()
+        self.error = None
+        try:
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(self.path)
+        except (OSError, TypeError, ValueError) as error:
+            # e.g. an unwritable or invalid path
+            self.error = str(error)
+        return self.path
+
+    def discard(self):
+        """Stop profiling without writing the stats, e.g. in a forked copy"""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler = None
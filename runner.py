@@ -1,11 +1,215 @@
 """This module provides a class to run experiments
 """
 import multiprocessing
-import importlib.util
-import inspect
+import numbers
+import os
 import select
+import sys
+import time
+import traceback
 
 from dlex import Experiment
+import checkpoint
+import definitions
+import profiling
+import shm_ring
+
+# how often, in seconds, the run loop checks whether a profile is due or a
+# cProfile run is over
+PROFILE_CHECK_INTERVAL = 0.1
+
+class ReportPolicy(object):
+    """Decides when the runner reports metrics
+
+    A report is sent when any of the configured conditions holds:
+    `every_steps` steps have run since the last report, `every_ms`
+    milliseconds have passed since the last report, or the loss has moved by
+    more than `threshold` since the last reported loss. With no condition
+    configured, it reports after every step.
+    """
+    def __init__(self, every_steps=None, every_ms=None, threshold=None):
+        if every_steps is None and every_ms is None and threshold is None:
+            every_steps = 1
+        self.every_steps = every_steps
+        self.every_ms = every_ms
+        self.threshold = threshold
+
+    @classmethod
+    def from_hyperparams(cls, hyperparams):
+        # type: (Dict[str, Any]) -> ReportPolicy
+        """Read the policy from the 'report' hyperparam, if there is one."""
+        return cls(**hyperparams.get('report', {}))
+
+    def due(self, steps, elapsed, loss, last_loss):
+        # type: (int, float, float, Union[None, float]) -> bool
+        """Whether to report, `steps` steps and `elapsed` seconds after the
+        last report."""
+        if self.every_steps is not None and steps >= self.every_steps:
+            return True
+        if self.every_ms is not None and elapsed * 1000 >= self.every_ms:
+            return True
+        if (self.threshold is not None
+                and (last_loss is None or abs(loss - last_loss) > self.threshold)):
+            return True
+        return False
+
+class MetricAggregator(object):
+    """Aggregates a metric between two reports"""
+    def __init__(self):
+        self.last = None
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.count = 0
+
+    def add(self, value):
+        self.last = value
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.count += 1
+
+    def summary(self):
+        # type: () -> Dict[str, Union[int, float]]
+        return {
+            'last': self.last,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'count': self.count}
+
+class Reporter(object):
+    """Sends metrics through the pipe according to a ReportPolicy
+
+    Between reports the loss is aggregated locally, and each report is a
+    single ['metrics', {...}] message:
+
+        {'step': the number of steps run so far,
+         'loss': {'last', 'mean', 'min', 'max', 'count'},
+         'position': the last position}
+    """
+    def __init__(self, pipe, policy):
+        self.pipe = pipe
+        self.policy = policy
+        self.step = 0
+        self.loss = MetricAggregator()
+        self.position = None
+        self.last_loss = None
+        self.last_report = time.monotonic()
+
+    def add(self, loss, position, epoch=0): # pylint: disable=unused-argument
+        """Record one training step, and report if the policy says so."""
+        self.step += 1
+        self.loss.add(loss)
+        self.position = position
+        if self.policy.due(
+                self.loss.count, time.monotonic() - self.last_report, loss, self.last_loss):
+            self.flush()
+
+    def flush(self):
+        """Report whatever has been aggregated since the last report."""
+        if self.loss.count == 0:
+            return
+        self.pipe.write(['metrics', {
+            'step': self.step,
+            'loss': self.loss.summary(),
+            'position': self.position}])
+        self.last_loss = self.loss.last
+        self.loss = MetricAggregator()
+        self.last_report = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+class ShmReporter(object):
+    """Sends metrics through a shared-memory ring instead of the pipe
+
+    The ring's name is sent once through the pipe as ['shm', name], and dlexd
+    maps the ring and drains it on its own schedule; every step then costs a
+    couple of stores into shared memory.
+    A position that isn't a number doesn't fit in a record, and is sent
+    through the pipe as ['position', position] instead, when it changes.
+    """
+    def __init__(self, pipe, exp_id, capacity=4096):
+        self.pipe = pipe
+        self.step = 0
+        self.position = None
+        self.ring = shm_ring.MetricRing.create(
+            'dlex_%s_%d' % (exp_id, os.getpid()), capacity)
+        self.pipe.write(['shm', self.ring.name])
+
+    def add(self, loss, position, epoch=0):
+        """Record one training step."""
+        self.step += 1
+        self.ring.put(shm_ring.LOSS, self.step, epoch, loss)
+        if isinstance(position, numbers.Real):
+            self.ring.put(shm_ring.POSITION, self.step, epoch, position)
+        elif position != self.position:
+            self.pipe.write(['position', position])
+        self.position = position
+
+    def flush(self):
+        """Records are visible to dlexd as soon as they are written."""
+        pass
+
+    def close(self):
+        self.ring.close()
+
+class Checkpoints(object):
+    """Takes checkpoints of an experiment on a CheckpointPolicy schedule
+
+    Checkpoints are written by a checkpoint.Checkpointer thread, and their
+    metadata is sent through the pipe as ['checkpoint', meta] once written,
+    or ['checkpoint_error', message] if writing failed; training goes on
+    either way.
+    A scheduled checkpoint that comes due while the previous one is still
+    being written is taken at the first step after it is.
+    """
+    def __init__(self, pipe, policy, exp_id):
+        self.pipe = pipe
+        self.policy = policy
+        store = checkpoint.ChunkStore(os.path.join(policy.root, str(exp_id)))
+        self.checkpointer = checkpoint.Checkpointer(store, policy.keep)
+        self.checkpointer.start()
+        self.steps = 0
+        self.last = time.monotonic()
+
+    def step(self, experiment, step):
+        """Count one training step, and checkpoint if the policy says so."""
+        self.steps += 1
+        if (self.policy.due(self.steps, time.monotonic() - self.last)
+                and self.checkpointer.idle()):
+            self.take(experiment, step)
+        self.report()
+
+    def take(self, experiment, step):
+        """Checkpoint now, after the checkpoint being written if any."""
+        self.checkpointer.wait()
+        self.checkpointer.submit(
+            step, experiment.current_epoch, getattr(experiment, 'position', None),
+            experiment.checkpoint())
+        self.steps = 0
+        self.last = time.monotonic()
+
+    def report(self):
+        for meta in self.checkpointer.completed():
+            if 'error' in meta:
+                self.pipe.write(['checkpoint_error', 'step %d: %s: %s' % (
+                    meta['step'], type(meta['error']).__name__, meta['error'])])
+            else:
+                self.pipe.write(['checkpoint', meta])
+
+    def close(self, experiment, step):
+        """Take a last checkpoint and wait for it to be written."""
+        self.take(experiment, step)
+        self.checkpointer.close()
+        self.report()
+
+def _close_loaders(experiment):
+    """Stop the prefetching workers of an experiment's BatchLoaders."""
+    loaders = getattr(experiment, 'loaders', [])
+    while loaders != []:
+        loaders.pop().close()
 
 class Runner(multiprocessing.Process):
     """A process for running an experiment.
@@ -13,65 +217,245 @@ class Runner(multiprocessing.Process):
     This process runs an experiment. It also handles communication with dlexd
     and the experiment, via a UNIX domain socket and UNIX pipe respectively.
     """
-    def __init__(self, pipe, path, exp_id, hyperparams):
+    def __init__(self, pipe, path, exp_id, hyperparams, report_policy=None, # pylint: disable=too-many-arguments
+                 metrics_transport=None, resume_from=None, relay=None, definition=None):
         self.pipe = pipe
         self.path = path
         self.exp_id = exp_id
         self.hyperparams = hyperparams
+        if report_policy is None:
+            report_policy = ReportPolicy.from_hyperparams(hyperparams)
+        self.report_policy = report_policy
+        if metrics_transport is None:
+            metrics_transport = hyperparams.get('metrics_transport', 'pipe')
+        self.metrics_transport = metrics_transport
+        self.checkpoint_policy = checkpoint.CheckpointPolicy.from_hyperparams(hyperparams)
+        # the metadata of the checkpoint to load, from DLEXDB.get_latest_checkpoint
+        self.resume_from = resume_from
+        # called as relay(exp_id, pipe, pid) in a new process, to connect a
+        # copy of the experiment to dlexd (see fork)
+        self.relay = relay
+        # the compiled cache of the definition, from
+        # DLEXDB.get_definition_cache (see definitions.py)
+        self.definition = definition
+        # the timings of the run, and the pipe with its writes timed (see
+        # profiling.py), set in `run`
+        self.profile = None
+        self.output = None
+        self.forked = False
         super(Runner, self).__init__()
 
+    def reporter(self, step=0):
+        """A reporter for the configured metrics transport"""
+        if self.metrics_transport == 'shm':
+            reporter = ShmReporter(self.output, self.exp_id)
+        else:
+            reporter = Reporter(self.output, self.report_policy)
+        reporter.step = step
+        return reporter
+
+    def checkpoints(self, experiment):
+        """A Checkpoints, or None if the experiment isn't checkpointed"""
+        if (self.checkpoint_policy is None
+                or type(experiment).checkpoint is Experiment.checkpoint):
+            return None
+        return Checkpoints(self.output, self.checkpoint_policy, self.exp_id)
+
+    def fork(self, exp_id):
+        # type: (int) -> bool
+        """Fork a copy of the experiment, to run as experiment `exp_id`
+
+        The copy shares the experiment's memory copy-on-write, so it costs
+        one fork and no serialization. It gets its own pipe, and a relay
+        process (see `relay`) connects that pipe to dlexd.
+
+        Returns:
+            False in this process, True in the copy, which is now running
+            experiment `exp_id`
+        """
+        pid = os.fork()
+        if pid != 0:
+            os.waitpid(pid, 0)
+            return False
+        # the intermediate process exits right away, so that neither the copy
+        # nor its relay are children of this runner
+        try:
+            if os.fork() != 0:
+                os._exit(0) # pylint: disable=protected-access
+            pipe = type(self.pipe)()
+            runner_pid = os.fork()
+            if runner_pid != 0:
+                pipe.use_left()
+                self.relay(exp_id, pipe, runner_pid)
+                os._exit(0) # pylint: disable=protected-access
+        except BaseException: # pylint: disable=broad-except
+            traceback.print_exc()
+            os._exit(1) # pylint: disable=protected-access
+        pipe.use_right()
+        self.pipe = pipe
+        self.profile = profiling.Profile(self.profile.interval)
+        self.output = profiling.TimedPipe(pipe, self.profile)
+        self.exp_id = exp_id
+        self.forked = True
+        return True
+
+    def send_profile(self, experiment=None, running=None):
+        """Send the profile's summary (see profiling.Profile.summary)"""
+        loaders = getattr(experiment, 'loaders', [])
+        self.output.write(['profile', self.profile.summary(running, {
+            'data_wait': sum(getattr(loader, 'wait_time', 0.0) for loader in loaders)})])
+        self.profile.sent()
+
     def run(self):
         self.pipe.use_right()
-        self.pipe.write(['status', 'loading module'])
-        name = self.path.split('/')[-1].split('.')[0]
-        spec = importlib.util.spec_from_file_location(name, self.path)
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
-
-        exp_class = None
-        for item in dir(mod):
-            if (inspect.isclass(getattr(mod, item))
-                    and Experiment in getattr(mod, item).__bases__):
-                exp_class = getattr(mod, item)
-                break
+        self.profile = profiling.Profile(**self.hyperparams.get('profile', {}))
+        self.output = profiling.TimedPipe(self.pipe, self.profile)
+        profiler = profiling.Profiler()
+        self.output.write(['status', 'loading module'])
+        with self.profile.phase('load'):
+            try:
+                exp_class = definitions.load(self.path, self.definition)
+            except definitions.DefinitionError:
+                traceback.print_exc()
+                exp_class = None
 
         if exp_class is not None:
-            self.pipe.write(['status', 'initializing experiment'])
-            experiment = exp_class()
-            self.pipe.write(['epoch', experiment.get_epoch()])
-            self.pipe.write(['status', 'experiment running'])
+            self.output.write(['status', 'initializing experiment'])
+            with self.profile.phase('init'):
+                experiment = exp_class()
+            step = 0
+            if self.resume_from is not None:
+                self.output.write(['status', 'loading checkpoint'])
+                with self.profile.phase('resume'):
+                    (manifest, state) = checkpoint.load(self.resume_from['manifest'])
+                    experiment.load(state)
+                experiment.current_epoch = manifest['epoch']
+                experiment.position = manifest['position']
+                step = manifest['step']
+            self.output.write(['epoch', experiment.get_epoch()])
+            self.output.write(['status', 'experiment running'])
 
+            reporter = self.reporter(step)
+            checkpoints = self.checkpoints(experiment)
             train_gen = experiment.train()
             paused = False
             done = False
+            train = self.profile.phase('train').start()
+            # bound locally, as they are used on every step
+            add_step = self.profile.steps.add
+            select_time = self.profile.overhead['select']
+            next_check = 0.0
             while not done:
-                if experiment.epochs_left() < 0:
+                if paused:
+                    # wait for a message below, without using the CPU
+                    pass
+                elif experiment.epochs_left() < 0:
                     paused = True
+                    train.stop()
                 else:
+                    step_start = time.perf_counter()
                     train_status = next(train_gen)
+                    add_step(time.perf_counter() - step_start)
                     if train_status is False:
+                        # epoch changes are reported right away
+                        reporter.flush()
                         experiment.current_epoch += 1
-                        self.pipe.write(['epoch', experiment.current_epoch])
-                    self.pipe.write(['loss', experiment.loss])
-                    self.pipe.write(['position', experiment.position])
-                (readable, _, _) = select.select([self.pipe], [], [], 0)
+                        self.output.write(['epoch', experiment.current_epoch])
+                    reporter.add(
+                        experiment.loss, experiment.position, experiment.current_epoch)
+                    if checkpoints is not None:
+                        checkpoints.step(experiment, reporter.step)
+                if paused:
+                    (readable, _, _) = select.select([self.pipe], [], [])
+                    now = time.perf_counter()
+                else:
+                    select_start = time.perf_counter()
+                    (readable, _, _) = select.select([self.pipe], [], [], 0)
+                    now = time.perf_counter()
+                    select_time[0] += now - select_start
+                    select_time[1] += 1
+                if now >= next_check:
+                    next_check = now + PROFILE_CHECK_INTERVAL
+                    stats = profiler.check()
+                    if stats is not None:
+                        self.output.write(['profiler_stats', stats, profiler.error])
+                    if self.profile.due():
+                        self.send_profile(experiment, None if paused else train)
 
                 if readable != []:
                     msg = self.pipe.read()
-                    if msg == 'terminate':
+                    if msg is None and not self.pipe.read_pipe.is_open():
+                        # the relay is gone, and nothing can unpause or
+                        # terminate the run anymore
+                        break
+                    elif msg == 'terminate':
                         done = True
-                        self.pipe.write(['status', 'terminated'])
+                        reporter.flush()
+                        _close_loaders(experiment)
+                        if checkpoints is not None:
+                            checkpoints.close(experiment, reporter.step)
+                            checkpoints = None
+                        self.output.write(['status', 'terminated'])
                         break
                     elif msg == 'save':
                         break
-                    elif msg == 'pause':
-                        paused = True
+                    elif isinstance(msg, list) and msg[0] == 'fork':
+                        reporter.flush()
+                        if self.fork(msg[1]):
+                            # only this thread survives the fork, and the copy
+                            # runs even if the original was paused
+                            profiler.discard()
+                            paused = False
+                            train = self.profile.phase('train').start()
+                            experiment.set_hyperparams(msg[2])
+                            for loader in getattr(experiment, 'loaders', []):
+                                loader.restart()
+                            reporter = self.reporter(reporter.step)
+                            checkpoints = self.checkpoints(experiment)
+                            self.output.write(['epoch', experiment.current_epoch])
+                            self.output.write(['status', 'experiment running'])
+                    elif isinstance(msg, list) and msg[0] == 'start_profiler':
+                        stats = profiler.start(msg[1], msg[2])
+                        if stats is not None:
+                            self.output.write(['profiler_stats', stats, profiler.error])
+                    elif msg == 'pause' or isinstance(msg, list) and msg[0] == 'pause':
+                        # ['pause', False] doesn't checkpoint, for the short
+                        # pauses of time slicing (see timeslice.py)
+                        reporter.flush()
+                        if not paused:
+                            paused = True
+                            train.stop()
+                        for loader in getattr(experiment, 'loaders', []):
+                            loader.pause()
+                        if checkpoints is not None and (msg == 'pause' or msg[1]):
+                            checkpoints.take(experiment, reporter.step)
+                            checkpoints.checkpointer.wait()
+                            checkpoints.report()
+                    elif msg == 'unpause':
+                        if paused:
+                            paused = False
+                            train = self.profile.phase('train').start()
+                        for loader in getattr(experiment, 'loaders', []):
+                            loader.resume()
                     print('model got a message: %s' % msg)
-
-                while paused:
-                    msg = self.pipe.read()
-                    if msg == 'unpause':
-                        paused = False
-            self.pipe.write(['status', 'done'])
+            if not paused:
+                train.stop()
+            stats = profiler.stop()
+            if stats is not None:
+                self.output.write(['profiler_stats', stats, profiler.error])
+            with self.profile.phase('finish'):
+                _close_loaders(experiment)
+                if checkpoints is not None:
+                    checkpoints.close(experiment, reporter.step)
+                reporter.close()
+            self.send_profile(experiment)
+            self.output.write(['status', 'done'])
         else:
-            self.pipe.write(['status', 'failed'])
+            self.send_profile()
+            self.output.write(['status', 'failed'])
+        if self.forked:
+            # the multiprocessing state (e.g. the list of child processes) is
+            # this runner's parent's, so don't clean up through it
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0) # pylint: disable=protected-access
@@ -0,0 +1,239 @@
+"""A resource-aware queue of experiments for dlexd
+
+Experiments submitted to dlexd wait in a queue persisted in DLEXDB
+(experiments.state = 'queued'), and are started when the host has room for
+them: at most `max_runs` at once, within the host's CPU cores and memory.
+Each experiment declares what it needs in its 'resources' hyperparam, e.g.
+{'resources': {'cores': 4, 'memory': 8 * 2 ** 30}} (1 core and no memory by
+default), and its runner is pinned to the cores it is given (or not pinned,
+if it asks for none).
+
+A core may be given to `share` experiments at once (1 by default), which
+dlexd then time-slices (see timeslice.py).
+
+Experiments start in priority order, and in submission order within a
+priority. A queued experiment that doesn't fit blocks the ones behind it, so
+that large experiments aren't starved by a stream of small ones.
+
+example:
+    scheduler = Scheduler(ddb, launch, Limits(max_runs=8))
+    scheduler.submit([exp_id])      # launch(exp_id, cores) once it fits
+    scheduler.finished(exp_id)      # frees its cores, and starts the next ones
+"""
+import heapq
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Tuple # pylint: disable=unused-import
+
+
+def host_cores():
+    # type: () -> List[int]
+    """The cores this process may run on"""
+    return sorted(os.sched_getaffinity(0))
+
+
+def host_memory():
+    # type: () -> int
+    """The total memory of the host, in bytes"""
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+class Limits(object):
+    """The resources experiments may use
+
+    Args:
+        max_runs: the number of experiments that may run at once (default:
+            no limit but cores)
+        cores: the IDs of the cores runners may be pinned to (default: all
+            of this process's)
+        memory: the memory experiments may reserve, in bytes (default: all
+            of the host's)
+        share: the number of experiments each core may be given to at once
+    """
+    def __init__(self, max_runs=None, cores=None, memory=None, share=1):
+        self.max_runs = max_runs
+        self.cores = sorted(cores) if cores is not None else host_cores()
+        self.memory = memory if memory is not None else host_memory()
+        self.share = share
+
+    def requirements(self, hyperparams):
+        # type: (Dict[str, Any]) -> Tuple[int, int]
+        """The (cores, memory) an experiment asks for"""
+        resources = hyperparams.get('resources', {})
+        return (min(resources.get('cores', 1), len(self.cores)),
+                min(resources.get('memory', 0), self.memory))
+
+
+class Scheduler(object):
+    """Starts queued experiments when there's room for them
+
+    Args:
+        ddb: the DLEXDB holding the queue
+        launch: called as launch(exp_id, cores) to start an experiment
+        limits: the Limits of the host
+        lock: held around every use of `ddb`, which may be shared
+    """
+    def __init__(self, ddb, launch, limits=None, lock=None):
+        self.ddb = ddb
+        self.launch = launch
+        self.limits = limits if limits is not None else Limits()
+        self.lock = lock if lock is not None else threading.Lock()
+        self.queue = [] # type: List[Dict[str, Any]]
+        self.running = {} # type: Dict[int, Dict[str, Any]]
+        with self.lock:
+            self.durations = deque(self.ddb.get_run_durations(), maxlen=100)
+            jobs = self.ddb.get_jobs(['queued', 'running'])
+        for job in jobs:
+            if job['state'] == 'queued':
+                self.queue.append(job)
+            elif _alive(job['pid']):
+                # still running from before dlexd was restarted
+                (_, job['memory']) = self.limits.requirements(job['hyperparams'])
+                self.running[job['id']] = job
+            else:
+                with self.lock:
+                    self.ddb.set_job_state(job['id'], 'lost', time.time())
+
+    def submit(self, exp_ids, priority=0):
+        # type: (List[int], int) -> List[int]
+        """Queue experiments, and start them if there's room.
+
+        Returns:
+            The IDs of the experiments that were started
+        """
+        now = time.time()
+        with self.lock:
+            self.ddb.enqueue_experiments(exp_ids, priority, now)
+            jobs = self.ddb.get_jobs(['queued'])
+        submitted = set(exp_ids)
+        self.queue.extend(job for job in jobs if job['id'] in submitted)
+        self.queue.sort(key=lambda job: (-job['priority'], job['id']))
+        return self.schedule()
+
+    def cancel(self, exp_ids):
+        # type: (List[int]) -> List[int]
+        """Remove experiments from the queue. Running ones aren't affected.
+
+        Returns:
+            The IDs of the experiments that were removed
+        """
+        cancelled = set(exp_ids) & set(job['id'] for job in self.queue)
+        self.queue = [job for job in self.queue if job['id'] not in cancelled]
+        now = time.time()
+        with self.lock:
+            self.ddb.finish_jobs(cancelled, 'cancelled', now)
+        return sorted(cancelled)
+
+    def free(self):
+        # type: () -> Tuple[List[int], int]
+        """The cores that can be given to another experiment, least used
+        first, and the memory not used by running experiments"""
+        used = Counter() # type: Dict[int, int]
+        memory = self.limits.memory
+        for job in self.running.values():
+            used.update(job['cores'])
+            memory -= job['memory']
+        cores = [core for core in self.limits.cores if used[core] < self.limits.share]
+        return (sorted(cores, key=lambda core: used[core]), memory)
+
+    def schedule(self):
+        # type: () -> List[int]
+        """Start queued experiments, in order, for as long as the next one
+        fits.
+
+        Returns:
+            The IDs of the experiments that were started
+        """
+        started = []
+        while self.queue != []:
+            if self.limits.max_runs is not None and len(self.running) >= self.limits.max_runs:
+                break
+            job = self.queue[0]
+            (cores, memory) = self.limits.requirements(job['hyperparams'])
+            (free_cores, free_memory) = self.free()
+            if cores > len(free_cores) or memory > free_memory:
+                break
+            self.queue.pop(0)
+            job['cores'] = free_cores[:cores]
+            job['memory'] = memory
+            job['started_at'] = time.time()
+            with self.lock:
+                self.ddb.set_job_state(job['id'], 'running', job['started_at'], job['cores'])
+            self.running[job['id']] = job
+            self.launch(job['id'], job['cores'])
+            started.append(job['id'])
+        return started
+
+    def finished(self, exp_id, state='done'):
+        # type: (int, str) -> List[int]
+        """Record that an experiment stopped running, and start the ones that
+        now fit.
+
+        Returns:
+            The IDs of the experiments that were started
+        """
+        job = self.running.pop(exp_id, None)
+        if job is None:
+            return []
+        now = time.time()
+        if job['started_at'] is not None:
+            self.durations.append(now - job['started_at'])
+        with self.lock:
+            self.ddb.set_job_state(exp_id, state, now)
+        return self.schedule()
+
+    def queue_info(self, now=None):
+        # type: (float) -> Dict[int, Dict[str, Any]]
+        """The position of every queued experiment, and an estimate of when it
+        will start, assuming that experiments run for the mean duration of
+        recent ones.
+
+        Returns:
+            {exp_id: {'queue_position': 1 for the next one to start,
+                      'estimated_start': timestamp, or None without history}}
+        """
+        if now is None:
+            now = time.time()
+        mean = sum(self.durations) / len(self.durations) if self.durations else None
+        (free_cores, free_memory) = self.free()
+        free_cores = len(free_cores)
+        runs = len(self.running)
+        ends = [] # type: List[Tuple[float, int, int]]
+        if mean is not None:
+            ends = [(max(now, job['started_at'] + mean), len(job['cores']), job['memory'])
+                    for job in self.running.values()]
+            heapq.heapify(ends)
+        info = {}
+        start = now
+        for position, job in enumerate(self.queue):
+            (cores, memory) = self.limits.requirements(job['hyperparams'])
+            while start is not None and (
+                    cores > free_cores or memory > free_memory
+                    or (self.limits.max_runs is not None and runs >= self.limits.max_runs)):
+                if ends == []:
+                    start = None
+                    break
+                (end, end_cores, end_memory) = heapq.heappop(ends)
+                start = max(start, end)
+                free_cores += end_cores
+                free_memory += end_memory
+                runs -= 1
+            if start is not None and mean is not None:
+                heapq.heappush(ends, (start + mean, cores, memory))
+            free_cores -= cores
+            free_memory -= memory
+            runs += 1
+            info[job['id']] = {'queue_position': position + 1, 'estimated_start': start}
+        return info
+
+
+def _alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,164 @@
+"""A shared-memory ring buffer of metric records
+
+The runner (the only producer) appends fixed-size records to a
+`multiprocessing.shared_memory` segment, and dlexd (the only consumer) maps the
+same segment and drains it whenever it likes. Neither side takes a lock or
+makes a syscall per record: the producer only writes `head` and the
+consumer only writes `tail`, each in its own cache line, and a record is
+written before `head` is advanced past it. Both processes are on the same
+host, and CPython does each 8 byte store with a single aligned write.
+
+When the consumer falls behind and the ring is full, new records are dropped
+(and counted) rather than blocking training.
+
+The consumer owns the segment's lifetime: a short run may be over before
+dlexd attaches, so the producer never removes the segment, and the consumer
+removes it once it has drained the last records. Segments are named
+'dlex_<exp_id>_<runner pid>', so that dlexd can `sweep` the ones whose runner
+died while dlexd wasn't running.
+
+example:
+    ring = MetricRing.create('dlex_1', capacity=4096)    # in the runner
+    ring.put(LOSS, step, epoch, loss)
+
+    ring = MetricRing.attach('dlex_1')                   # in dlexd
+    for (metric, step, epoch, value, timestamp) in ring.drain():
+        ...
+    ring.close(unlink=True)
+"""
+import os
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import List, Tuple # pylint: disable=unused-import
+
+# where Linux keeps POSIX shared memory segments
+SHM_DIRECTORY = '/dev/shm'
+
+LOSS = 0
+POSITION = 1
+
+METRIC_NAMES = {LOSS: 'loss', POSITION: 'position'}
+
+_COUNTER = struct.Struct('=Q')
+# head, tail and dropped each get their own 64 byte cache line
+_HEAD = 0
+_TAIL = 64
+_DROPPED = 128
+_CAPACITY = 192
+_RECORDS = 256
+
+# metric, step, epoch, value, timestamp
+RECORD = struct.Struct('=qqqdd')
+
+
+class MetricRing(object):
+    """One end of a single-producer, single-consumer metric ring"""
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        # the resource tracker would unlink the segment when this process
+        # exits, but its lifetime is managed by the consumer
+        resource_tracker.unregister(shm._name, 'shared_memory') # pylint: disable=protected-access
+        (self.capacity,) = _COUNTER.unpack_from(self.buf, _CAPACITY)
+
+    @classmethod
+    def create(cls, name, capacity=4096):
+        # type: (str, int) -> MetricRing
+        """Create the segment (producer side)."""
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_RECORDS + capacity * RECORD.size)
+        for offset in [_HEAD, _TAIL, _DROPPED]:
+            _COUNTER.pack_into(shm.buf, offset, 0)
+        _COUNTER.pack_into(shm.buf, _CAPACITY, capacity)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        # type: (str) -> MetricRing
+        """Map an existing segment (consumer side)."""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(self, offset):
+        return _COUNTER.unpack_from(self.buf, offset)[0]
+
+    def put(self, metric, step, epoch, value, timestamp=None): # pylint: disable=too-many-arguments
+        # type: (int, int, int, float, float) -> bool
+        """Append a record. Returns False if the ring was full and the record
+        was dropped."""
+        head = self._get(_HEAD)
+        if head - self._get(_TAIL) >= self.capacity:
+            _COUNTER.pack_into(self.buf, _DROPPED, self._get(_DROPPED) + 1)
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        RECORD.pack_into(
+            self.buf, _RECORDS + (head % self.capacity) * RECORD.size,
+            metric, step, epoch, value, timestamp)
+        _COUNTER.pack_into(self.buf, _HEAD, head + 1)
+        return True
+
+    def drain(self):
+        # type: () -> List[Tuple[int, int, int, float, float]]
+        """Remove and return every record written since the last drain."""
+        head = self._get(_HEAD)
+        tail = self._get(_TAIL)
+        records = [
+            RECORD.unpack_from(self.buf, _RECORDS + (i % self.capacity) * RECORD.size)
+            for i in range(tail, head)]
+        _COUNTER.pack_into(self.buf, _TAIL, head)
+        return records
+
+    def dropped(self):
+        # type: () -> int
+        """The number of records dropped because the ring was full."""
+        return self._get(_DROPPED)
+
+    def close(self, unlink=False):
+        """Unmap the segment, and remove it if `unlink` is True."""
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            # unlink() unregisters the segment from the resource tracker
+            resource_tracker.register(self.shm._name, 'shared_memory') # pylint: disable=protected-access
+            self.shm.unlink()
+
+
+def _alive(pid):
+    # type: (int) -> bool
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def sweep(prefix='dlex_', directory=SHM_DIRECTORY):
+    # type: (str, str) -> List[str]
+    """Remove the segments named '<prefix>..._<pid>' whose producer has
+    exited, e.g. left over by a dlexd that was killed before draining them.
+
+    Returns:
+        The names of the removed segments
+    """
+    if not os.path.isdir(directory):
+        return []
+    removed = []
+    for name in os.listdir(directory):
+        if not name.startswith(prefix):
+            continue
+        pid = name.rsplit('_', 1)[-1]
+        if not pid.isdigit() or _alive(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        removed.append(name)
+    return removed
@@ -1,61 +1,149 @@
+import functools
 import select
 import multiprocessing
 import os
 
 import unix_rpc
 import db
+import definitions
 import runner
 import selectable
 
+def relay(client, ddb, exp_id, pipe):
+    """Forward a runner's messages to dlexd, and dlexd's pushes to the runner,
+    until the runner exits. The connection to dlexd is then closed.
+
+    The runner's messages are sent as notifications, so dlexd doesn't reply
+    to them.
+
+    Args:
+        client: a unix_rpc.Client connected to dlexd
+        ddb: a DLEXDB, for recording checkpoints
+        exp_id: the ID of the experiment the runner runs
+        pipe: the spawner's end of the runner's pipe
+    """
+    client.handlers['fork'] = lambda new_exp_id, overrides: pipe.write(
+        ['fork', new_exp_id, overrides])
+    client.handlers['terminate'] = lambda: pipe.write('terminate')
+    client.handlers['pause'] = lambda checkpoint=True: pipe.write(['pause', checkpoint])
+    client.handlers['unpause'] = lambda: pipe.write('unpause')
+    client.handlers['start_profiler'] = lambda seconds, path: pipe.write(
+        ['start_profiler', seconds, path])
+    read_from = [pipe, client]
+    while read_from != []:
+        (readable, _, _) = select.select(read_from, [], [])
+        if pipe in readable:
+            msg = pipe.read()
+            if msg is None:
+                if not pipe.read_pipe.is_open():
+                    read_from.remove(pipe)
+                    if client in read_from:
+                        client.close()
+                        read_from.remove(client)
+            elif msg[0] == 'metrics':
+                client.report_metrics.notify(exp_id, msg[1])
+            elif msg[0] == 'shm':
+                client.attach_metrics.notify(exp_id, msg[1])
+            elif msg[0] == 'position':
+                client.set_position.notify(exp_id, msg[1])
+            elif msg[0] == 'loss':
+                client.set_loss.notify(exp_id, msg[1])
+            elif msg[0] == 'status':
+                client.set_status.notify(exp_id, msg[1])
+                if msg[1] == 'done':
+                    response = client.done(exp_id, os.getpid())
+                    if response == 'terminate':
+                        client.close()
+                        read_from.remove(client)
+                    else:
+                        # the call may have read what was readable
+                        (readable, _, _) = select.select(read_from, [], [], 0)
+            elif msg[0] == 'epoch':
+                client.set_epoch.notify(exp_id, msg[1])
+            elif msg[0] == 'profile':
+                client.set_profile.notify(exp_id, msg[1])
+            elif msg[0] == 'profiler_stats':
+                client.set_profiler_stats.notify(exp_id, *msg[1:])
+            elif msg[0] == 'checkpoint':
+                ddb.insert_checkpoint(exp_id, msg[1])
+                ddb.delete_checkpoints(msg[1]['pruned'])
+            elif msg[0] == 'checkpoint_error':
+                print('experiment %s checkpoint failed at %s' % (exp_id, msg[1]))
+        if client in readable and client in read_from:
+            # a push from dlexd. Read even when the pipe is readable too, so
+            # that a runner reporting all the time doesn't hold up dlexd's
+            # commands.
+            if not client.handle_message():
+                read_from.remove(client)
+
+def relay_fork(db_path, socket_path, exp_id, pipe, pid): # pylint: disable=too-many-arguments
+    """Relay for a copy of an experiment forked by its runner (see
+    Runner.fork), which runs as process `pid`."""
+    client = unix_rpc.Client(socket_path)
+    client.running(exp_id, os.getpid())
+    ddb = db.DLEXDB(db_path)
+    assert ddb.set_pid(exp_id, os.getpid())
+    relay(client, ddb, exp_id, pipe)
+    os.waitpid(pid, 0)
+
+def start_runner(db_path, socket_path, exp_id, cores=None):
+    """Run experiment `exp_id` in a new Runner process, and relay its messages
+    until it exits. Called in the process that is the runner's parent (see
+    Spawner and zygote.Zygote), whose pid is recorded as the experiment's.
+
+    Args:
+        db_path: the path of the DLEXDB
+        socket_path: the path of dlexd's socket
+        exp_id: the ID of the experiment
+        cores: the cores to pin the runner to (see scheduler.py)
+    """
+    client = unix_rpc.Client(socket_path)
+    client.running(exp_id, os.getpid())
+    ddb = db.DLEXDB(db_path)
+    assert ddb.set_pid(exp_id, os.getpid())
+    exp = ddb.get_experiment(exp_id)
+    definition = ddb.get_definition_cache(exp['def_id'])
+    try:
+        fresh = definitions.refresh(exp['def_path'], definition)
+    except definitions.DefinitionError:
+        # the runner fails to load it, and reports it
+        fresh = None
+        definition = None
+    if fresh is not None:
+        ddb.set_definition_cache(exp['def_id'], **fresh)
+        definition = fresh
+    if cores:
+        # experiments asking for no cores aren't pinned
+        os.sched_setaffinity(0, cores)
+    pipe = selectable.Pipe()
+    run = runner.Runner(
+        pipe,
+        exp['def_path'],
+        exp_id,
+        exp['hyperparams'],
+        resume_from=ddb.get_latest_checkpoint(exp_id),
+        relay=functools.partial(relay_fork, db_path, socket_path),
+        definition=definition)
+    run.start()
+    pipe.use_left()
+    relay(client, ddb, exp_id, pipe)
+    run.join()
+    ddb.close()
+
 class Spawner(multiprocessing.Process):
     """A process to fork the model runner daemon.
 
     This wrapper is necessary so as to not cause the os.fork to copy the CLI.
     """
-    def __init__(self, db_path, socket_path, exp_id):
+    def __init__(self, db_path, socket_path, exp_id, cores=None):
         self.db_path = db_path
         self.socket_path = socket_path
         self.exp_id = exp_id
+        # the cores to pin the runner to (see scheduler.py)
+        self.cores = cores
         super(Spawner, self).__init__()
 
     def run(self):
         if os.fork() == 0:
             if os.fork() == 0:
-                client = unix_rpc.Client(self.socket_path)
-                client.running(self.exp_id, os.getpid())
-                ddb = db.DLEXDB(self.db_path)
-                assert ddb.set_pid(self.exp_id, os.getpid())
-                exp = ddb.get_experiment(self.exp_id)
-                pipe = selectable.Pipe()
-                run = runner.Runner(
-                    pipe,
-                    exp['def_path'],
-                    self.exp_id,
-                    exp['hyperparams'])
-                run.start()
-                pipe.use_left()
-                read_from = [pipe, client]
-                while read_from != []:
-                    (readable, _, _) = select.select(read_from, [], [])
-                    if pipe in readable:
-                        msg = pipe.read()
-                        if msg is None and not pipe.read_pipe.is_open():
-                            read_from.remove(pipe)
-                        elif msg[0] == 'loss':
-                            client.set_loss(self.exp_id, msg[1])
-                        elif msg[0] == 'status':
-                            client.set_status(self.exp_id, msg[1])
-                            if msg[1] == 'done':
-                                response = client.done(self.exp_id, os.getpid())
-                                if response == 'terminate':
-                                    client.close()
-                                    read_from.remove(client)
-                        elif msg[0] == 'epoch':
-                            client.set_epoch(self.exp_id, msg[1])
-                    else:
-                        msg = client.read()
-                        if msg == 'terminate':
-                            response = client.close()
-                            if response == 'terminate':
-                                read_from.remove(client)
-                run.join()
+                start_runner(self.db_path, self.socket_path, self.exp_id, self.cores)
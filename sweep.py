@@ -0,0 +1,104 @@
+"""Hyperparameter sweeps
+
+A sweep expands a search space into many hyperparam configurations of one
+definition. These are created with one transaction (DLEXDB.create_sweep) and
+queued with one call to dlexd. The space is the cartesian product of `grid`
+values, with each point repeated `samples` times with values drawn at random
+from `distributions`:
+
+    grid:          {'batch': [32, 64], 'opt': ['sgd', 'adam']}
+    distributions: {'lr': 'loguniform:1e-4:1e-1', 'layers': 'int:2:6'}
+
+The distributions are `uniform:LOW:HIGH`, `loguniform:LOW:HIGH`,
+`int:LOW:HIGH` (inclusive) and `choice:A,B,...`. Draws are made from a
+random.Random(seed), so a sweep is reproducible.
+
+example:
+    configs = expand({'batch': [32, 64]}, {'lr': 'loguniform:1e-4:1e-1'}, 25, seed=1)
+    (sweep_id, exp_ids) = ddb.create_sweep('mnist', spec, configs)
+"""
+import itertools
+import json
+import math
+import random
+from typing import Any, Callable, Dict, List # pylint: disable=unused-import
+
+
+def parse_value(value):
+    # type: (str) -> Any
+    """A command line value, as JSON if it can be, and as a string otherwise"""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_grid(assignments):
+    # type: (List[str]) -> Dict[str, List[Any]]
+    """Parse NAME=V1,V2,... grid axes"""
+    grid = {}
+    for assignment in assignments:
+        (name, _, values) = assignment.partition('=')
+        grid[name] = [parse_value(value) for value in values.split(',')]
+    return grid
+
+
+def parse_distributions(assignments):
+    # type: (List[str]) -> Dict[str, str]
+    """Parse NAME=DISTRIBUTION assignments, checking the distributions"""
+    distributions = {}
+    for assignment in assignments:
+        (name, _, distribution) = assignment.partition('=')
+        _sampler(distribution)
+        distributions[name] = distribution
+    return distributions
+
+
+def _sampler(distribution):
+    # type: (str) -> Callable[[random.Random], Any]
+    (kind, _, args) = distribution.partition(':')
+    if kind == 'choice':
+        values = [parse_value(value) for value in args.split(',')]
+        return lambda rng: rng.choice(values)
+    (low, _, high) = args.partition(':')
+    if kind == 'uniform':
+        (low, high) = (float(low), float(high))
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'loguniform':
+        (low, high) = (math.log(float(low)), math.log(float(high)))
+        return lambda rng: math.exp(rng.uniform(low, high))
+    if kind == 'int':
+        (low, high) = (int(low), int(high))
+        return lambda rng: rng.randint(low, high)
+    raise ValueError('unknown distribution %s' % distribution)
+
+
+def expand(grid, distributions=None, samples=1, seed=0, base=None): # pylint: disable=too-many-arguments
+    # type: (Dict[str, List[Any]], Dict[str, str], int, int, Dict[str, Any]) -> List[Dict[str, Any]]
+    """The configurations of a sweep, in a deterministic order
+
+    Args:
+        grid: the values of each grid axis
+        distributions: the distribution of each sampled hyperparam
+        samples: the number of draws per grid point
+        seed: the seed of the draws
+        base: hyperparams shared by every configuration
+
+    Returns:
+        A list of hyperparams dicts
+    """
+    if distributions is None:
+        distributions = {}
+    rng = random.Random(seed)
+    samplers = [(name, _sampler(distribution))
+                for name, distribution in sorted(distributions.items())]
+    names = sorted(grid)
+    configs = []
+    for point in itertools.product(*[grid[name] for name in names]):
+        for _ in range(samples if samplers != [] else 1):
+            config = dict(base) if base is not None else {}
+            config.update(zip(names, point))
+            for (name, sampler) in samplers:
+                config[name] = sampler(rng)
+            configs.append(config)
+    return configs
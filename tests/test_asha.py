@@ -0,0 +1,85 @@
+"""
+Tests for asha.py
+"""
+import threading
+import unittest
+import uuid
+import os
+
+import asha
+import db
+
+DB_NAME = 'test.%s.db' % str(uuid.uuid4())
+
+class TestASHAPolicy(unittest.TestCase):
+    """Test corresponding to asha.ASHAPolicy"""
+    def test_rungs(self):
+        """Test that rungs are at min_epochs * reduction ** k epochs"""
+        policy = asha.ASHAPolicy(min_epochs=2, reduction=3, max_epochs=50)
+        self.assertEqual([(epoch, policy.rung(epoch)) for epoch in range(60)
+                          if policy.rung(epoch) is not None],
+                         [(2, 0), (6, 1), (18, 2)])
+        self.assertIsNone(asha.ASHAPolicy.from_hyperparams({}))
+        with self.assertRaises(ValueError):
+            asha.ASHAPolicy(action='kill')
+
+class TestASHA(unittest.TestCase):
+    """Test corresponding to asha.ASHA"""
+    def setUp(self):
+        self.ddb = db.DLEXDB(DB_NAME)
+        self.ddb.insert_definition('exp1', '/a/b/c')
+        self.stopped = []
+        self.resumed = []
+
+    def sweep(self, count, action='terminate'):
+        configs = [{'asha': {'min_epochs': 1, 'reduction': 2, 'action': action}}] * count
+        return self.ddb.create_sweep('exp1', {}, configs)[1]
+
+    def asha(self):
+        return asha.ASHA(
+            self.ddb, lambda exp_id, paused: self.stopped.append((exp_id, paused)),
+            lambda exp_id, priority: self.resumed.append((exp_id, priority)),
+            threading.Lock())
+
+    def test_terminate(self):
+        """Test that experiments outside the best half of a rung are stopped"""
+        exp_ids = self.sweep(4)
+        policy = self.asha()
+        decisions = [policy.epoch(exp_id, 1, loss)
+                     for exp_id, loss in zip(exp_ids, [0.5, 0.4, 0.9, 0.1])]
+        self.assertEqual(decisions, [
+            [(exp_ids[0], 'promote')], [(exp_ids[1], 'promote')],
+            [(exp_ids[2], 'terminate')], [(exp_ids[3], 'promote')]])
+        self.assertEqual(self.stopped, [(exp_ids[2], False)])
+        # no rung at epoch 3, and the rung at epoch 1 is recorded once
+        self.assertEqual(policy.epoch(exp_ids[0], 3, 0.1), [])
+        self.assertEqual(policy.epoch(exp_ids[0], 1, 0.1), [])
+        # experiments without an 'asha' hyperparam aren't early-stopped
+        other = self.ddb.create_experiment('exp1', {})
+        self.assertEqual(policy.epoch(other, 1, 10.0), [])
+
+    def test_pause_and_resume(self):
+        """Test that paused experiments are resumed when they become the best"""
+        exp_ids = self.sweep(8, 'pause')
+        policy = self.asha()
+        losses = [0.1, 0.2, 0.3, 0.4, 0.05, 0.9, 0.95]
+        for exp_id, loss in zip(exp_ids, losses):
+            policy.epoch(exp_id, 1, loss)
+        self.assertEqual(self.stopped, [(exp_ids[i], True) for i in [2, 3, 5, 6]])
+        # with 8 results, the best 4 include the paused 0.3
+        self.assertEqual(policy.epoch(exp_ids[7], 1, 0.99),
+                         [(exp_ids[7], 'pause'), (exp_ids[2], 'resume')])
+        self.assertEqual(self.resumed, [(exp_ids[2], 1)])
+
+        # the rungs are read back from the decision log
+        policy = self.asha()
+        key = ('sweep:1', 0)
+        self.assertEqual(policy.paused[key], {exp_ids[i] for i in [3, 5, 6, 7]})
+        self.assertEqual(policy.results[key], dict(zip(exp_ids, losses + [0.99])))
+        self.assertEqual([d['decision'] for d in self.ddb.get_asha_decisions('sweep:1')],
+                         ['promote', 'promote', 'pause', 'pause', 'promote', 'pause',
+                          'pause', 'pause', 'resume'])
+
+    def tearDown(self):
+        self.ddb.close()
+        os.remove(DB_NAME)
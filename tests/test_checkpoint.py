@@ -0,0 +1,61 @@
+"""
+Tests for checkpoint.py
+"""
+import unittest
+import uuid
+import array
+import os
+import shutil
+
+import checkpoint
+
+STORE_ROOT = 'test.%s.checkpoints' % str(uuid.uuid4())
+
+class TestCheckpoint(unittest.TestCase):
+    """Test corresponding to checkpoint.py"""
+    def setUp(self):
+        self.store = checkpoint.ChunkStore(STORE_ROOT, chunk_size=64)
+
+    def test_write_and_load(self):
+        """Test that a checkpoint loads back, and unchanged entries are deduplicated"""
+        weights = array.array('d', range(100))
+        state = {'frozen': weights, 'head': b'x' * 10, 'step_count': {'n': 3}}
+        first = checkpoint.write(self.store, 10, 1, 5, state)
+        self.assertEqual(first['size'], first['stored'])
+        state['head'] = b'y' * 10
+        second = checkpoint.write(self.store, 20, 1, 9, state)
+        self.assertEqual(second['stored'], 10)
+
+        (manifest, loaded) = checkpoint.load(second['manifest'])
+        self.assertEqual((manifest['step'], manifest['epoch'], manifest['position']), (20, 1, 9))
+        self.assertEqual(loaded['frozen'], weights.tobytes())
+        self.assertEqual(loaded['head'], b'y' * 10)
+        self.assertEqual(loaded['step_count'], {'n': 3})
+
+    def test_checkpointer(self):
+        """Test background writes and pruning old checkpoints"""
+        checkpointer = checkpoint.Checkpointer(self.store, keep=2)
+        checkpointer.start()
+        metas = []
+        for step in range(3):
+            checkpointer.wait()
+            self.assertTrue(checkpointer.submit(step, 0, step, {'value': bytes([step]) * 100}))
+            checkpointer.wait()
+            metas.extend(checkpointer.completed())
+        checkpointer.close()
+        self.assertEqual([meta['step'] for meta in metas], [0, 1, 2])
+        self.assertEqual(metas[2]['pruned'], [metas[0]['manifest']])
+        self.assertEqual(self.store.manifests(), [metas[1]['manifest'], metas[2]['manifest']])
+        self.assertRaises(FileNotFoundError, checkpoint.load, metas[0]['manifest'])
+        self.assertEqual(checkpoint.load(metas[1]['manifest'])[1]['value'], b'\x01' * 100)
+
+    def test_policy(self):
+        """Test the checkpoint schedule"""
+        self.assertIsNone(checkpoint.CheckpointPolicy.from_hyperparams({}))
+        policy = checkpoint.CheckpointPolicy.from_hyperparams(
+            {'checkpoint': {'every_steps': 100}})
+        self.assertTrue(policy.due(100, 0.0))
+        self.assertFalse(policy.due(99, 1000.0))
+
+    def tearDown(self):
+        shutil.rmtree(STORE_ROOT)
@@ -0,0 +1,69 @@
+"""
+Tests for codec.py
+"""
+import unittest
+import array
+import fractions
+
+import codec
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MESSAGES = [
+    None, True, False, 0, -1, 2 ** 70, 1.5, '', 'abc', 'héllo', b'\x00\x01',
+    [], [1, 'a', None], {'a': 1, 'b': [2.0, {'c': None}]},
+    ['rpc', 3, 'set_loss', [1, 0.25], {}],
+    [float(i) / 3 for i in range(100)],
+]
+
+class TestCodec(unittest.TestCase):
+    """Test corresponding to codec.py"""
+    def test_round_trip(self):
+        """Test that both codecs decode what they encode"""
+        for msg_codec in [codec.JSON, codec.BINARY]:
+            for msg in MESSAGES:
+                if msg_codec is codec.JSON and isinstance(msg, bytes):
+                    continue
+                decoded = msg_codec.decode(memoryview(msg_codec.encode(msg)))
+                self.assertEqual(decoded, msg)
+
+    def test_typed_arrays(self):
+        """Test that typed arrays are shipped as raw buffers"""
+        for typecode in 'bdfq':
+            values = array.array(typecode, range(50))
+            encoded = codec.BINARY.encode({'values': values})
+            self.assertLess(len(encoded), values.itemsize * len(values) + 32)
+            decoded = codec.BINARY.decode(encoded)['values']
+            self.assertEqual(decoded.typecode, typecode)
+            self.assertEqual(decoded, values)
+
+    def test_tuples_become_lists(self):
+        """Test that tuples decode as lists, like with JSON"""
+        self.assertEqual(codec.BINARY.decode(codec.BINARY.encode((1, 2))), [1, 2])
+
+    def test_numbers(self):
+        """Test that other numbers are sent as Python ints and floats"""
+        decoded = codec.BINARY.decode(codec.BINARY.encode([fractions.Fraction(1, 4)]))
+        self.assertEqual(decoded, [0.25])
+        self.assertIs(type(decoded[0]), float)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_scalars(self):
+        """Test that NumPy scalars don't come back as 1-element arrays"""
+        for (value, expected) in [
+                (numpy.int64(3), 3), (numpy.int32(-2), -2), (numpy.float32(0.5), 0.5),
+                (numpy.float64(1.5), 1.5), (numpy.bool_(True), True),
+                (numpy.array(7), 7)]:
+            decoded = codec.BINARY.decode(codec.BINARY.encode({'value': value}))['value']
+            self.assertEqual(decoded, expected)
+            self.assertIs(type(decoded), type(expected))
+        values = numpy.arange(4, dtype='float32')
+        decoded = codec.BINARY.decode(codec.BINARY.encode(values))
+        self.assertEqual(list(decoded), [0.0, 1.0, 2.0, 3.0])
+
+    def test_unknown_type(self):
+        """Test that unencodable values raise TypeError"""
+        self.assertRaises(TypeError, codec.BINARY.encode, object())
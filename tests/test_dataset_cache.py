@@ -0,0 +1,70 @@
+"""
+Tests for dataset_cache.py
+"""
+import unittest
+import uuid
+import os
+import shutil
+
+import db
+import dataset_cache
+
+DB_NAME = 'test.%s.db' % str(uuid.uuid4())
+DATA_DIR = 'test.%s.data' % str(uuid.uuid4())
+CACHE_ROOT = 'test.%s.cache' % str(uuid.uuid4())
+
+class TestDatasetCache(unittest.TestCase):
+    """Test corresponding to dataset_cache.py"""
+    def setUp(self):
+        os.makedirs(DATA_DIR)
+        for part in range(2):
+            with open(os.path.join(DATA_DIR, 'part%d.txt' % part), 'w') as data_file:
+                data_file.write(''.join('line %d.%d\n' % (part, i) for i in range(5)))
+        self.ddb = db.DLEXDB(DB_NAME)
+        self.ddb.insert_dataset('data', DATA_DIR)
+        self.cache = dataset_cache.DatasetCache(self.ddb, CACHE_ROOT)
+
+    def test_build_and_read(self):
+        """Test the .npy files and reading them back"""
+        cache_dir = self.cache.get('data')
+        with open(os.path.join(cache_dir, 'offsets.npy'), 'rb') as offsets_file:
+            (descr, shape, start) = dataset_cache.read_npy_header(offsets_file)
+        self.assertEqual((descr, shape, start % 64), ('<i8', [11], 0))
+        dataset = dataset_cache.CachedDataset(cache_dir)
+        self.assertEqual(len(dataset), 10)
+        self.assertEqual(bytes(dataset[0]), b'line 0.0')
+        self.assertEqual(bytes(dataset[-1]), b'line 1.4')
+        dataset.close()
+
+    def test_hits_and_invalidation(self):
+        """Test that caches are reused until their source changes"""
+        cache_dir = self.cache.get('data')
+        self.assertEqual(self.cache.get('data'), cache_dir)
+        stats = self.ddb.get_dataset('data')
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['size'], dataset_cache.disk_usage(cache_dir))
+
+        with open(os.path.join(DATA_DIR, 'part1.txt'), 'a') as data_file:
+            data_file.write('line 1.5 is longer\n')
+        self.cache.get('data')
+        self.assertEqual(self.ddb.get_dataset('data')['misses'], 2)
+        dataset = dataset_cache.CachedDataset(cache_dir)
+        self.assertEqual(len(dataset), 11)
+        dataset.close()
+
+    def test_lru_eviction(self):
+        """Test that the least recently used caches are evicted"""
+        self.ddb.insert_dataset('other', os.path.join(DATA_DIR, 'part0.txt'))
+        self.cache.get('data')
+        self.cache.max_bytes = self.ddb.get_dataset('data')['size']
+        self.cache.get('other')
+        self.assertIsNone(self.ddb.get_dataset('data')['fingerprint'])
+        self.assertFalse(os.path.exists(os.path.join(CACHE_ROOT, '1')))
+        self.assertTrue(self.cache.evict('other'))
+        self.assertFalse(self.cache.evict('other'))
+
+    def tearDown(self):
+        self.ddb.close()
+        os.remove(DB_NAME)
+        shutil.rmtree(DATA_DIR)
+        shutil.rmtree(CACHE_ROOT, ignore_errors=True)
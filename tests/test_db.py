@@ -4,6 +4,7 @@ Tests for db.py
 import unittest
 import uuid
 import os
+import sqlite3
 
 import db
 
@@ -18,6 +19,55 @@ class TestDLEXDB(unittest.TestCase):
         """Test that DLEXDB.__init__ created db file"""
         self.assertTrue(os.path.isfile(DB_NAME))
 
+    def test_schema_version(self):
+        """Test that a new database is migrated and in WAL mode"""
+        self.ddb.cursor.execute("PRAGMA user_version")
+        self.assertEqual(self.ddb.cursor.fetchone()[0], db.SCHEMA_VERSION)
+        self.ddb.cursor.execute("PRAGMA journal_mode")
+        self.assertEqual(self.ddb.cursor.fetchone()[0], 'wal')
+
+    def test_migrate_unversioned(self):
+        """Test upgrading a database created before schema versioning"""
+        name = 'test.%s.db' % str(uuid.uuid4())
+        conn = sqlite3.connect(name)
+        conn.execute(
+            "CREATE TABLE definitions ("
+            "  id INTEGER PRIMARY KEY, name TEXT UNIQUE, path TEXT)")
+        conn.execute("INSERT INTO definitions (name, path) VALUES ('old', '/a')")
+        conn.commit()
+        conn.close()
+        ddb = db.DLEXDB(name)
+        self.assertEqual(ddb.get_definition('old')['path'], '/a')
+        ddb.cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type='index' AND name='experiments_definition_id'")
+        self.assertEqual(len(ddb.cursor.fetchall()), 1)
+        ddb.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
+
+    def test_readonly(self):
+        """Test that a read-only DLEXDB reads and can't write, and that a
+        missing database is created instead"""
+        self.ddb.insert_definition('def', '/a')
+        reader = db.DLEXDB(DB_NAME, readonly=True)
+        self.assertTrue(reader.readonly)
+        self.assertEqual(reader.get_definition('def')['path'], '/a')
+        self.ddb.insert_definition('other', '/b')
+        self.assertEqual(len(reader.get_definitions()), 2)
+        self.assertRaises(sqlite3.OperationalError, reader.insert_definition, 'ro', '/c')
+        reader.close()
+
+        name = 'test.%s.db' % str(uuid.uuid4())
+        created = db.DLEXDB(name, readonly=True)
+        self.assertFalse(created.readonly)
+        self.assertEqual(created.get_definitions(), [])
+        created.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
+
     def test_definition_crud(self):
         """Tests for basic definition CRUD."""
         self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
@@ -44,6 +94,17 @@ class TestDLEXDB(unittest.TestCase):
         self.assertTrue(self.ddb.delete_definition('exp3'))
         self.assertFalse(self.ddb.get_definition('exp3'))
 
+    def test_definition_cache(self):
+        """Test storing the compiled cache of a definition"""
+        def_id = self.ddb.insert_definition('exp1', '/a/b/c', 'abc', 'Mnist', b'\x00code')
+        self.assertEqual(self.ddb.get_definition_cache(def_id), {
+            'source_hash': 'abc', 'class_name': 'Mnist', 'bytecode': b'\x00code'})
+        self.assertTrue(self.ddb.set_definition_cache(def_id, 'def', 'Mnist', b'new'))
+        self.assertEqual(self.ddb.get_definition_cache(def_id)['bytecode'], b'new')
+        self.assertEqual(self.ddb.get_definitions(), [
+            {'id': def_id, 'name': 'exp1', 'path': '/a/b/c'}])
+        self.assertIsNone(self.ddb.get_definition_cache(def_id + 1))
+
     def test_experiment_crud(self):
         self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
         exp_id = self.ddb.create_experiment('exp1', {'k1': 'v1'})
@@ -53,6 +114,78 @@ class TestDLEXDB(unittest.TestCase):
         self.assertTrue(self.ddb.delete_experiment(exp_id))
         self.assertIsNone(self.ddb.get_experiment(exp_id))
 
+    def test_copy_experiment(self):
+        """Test copying an experiment with hyperparam overrides"""
+        self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
+        exp_id = self.ddb.create_experiment('exp1', {'lr': 0.1, 'batch': 32})
+        copy_id = self.ddb.copy_experiment(exp_id, {'lr': 0.01})
+        copy = self.ddb.get_experiment(copy_id)
+        self.assertEqual(copy['hyperparams'], {'lr': 0.01, 'batch': 32})
+        self.assertEqual((copy['def_path'], copy['parent_id']), ('/a/b/c', exp_id))
+        self.assertIsNone(self.ddb.copy_experiment(copy_id + 1, {}))
+
+    def test_sweeps(self):
+        """Test creating a sweep and counting its experiments by state"""
+        self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
+        configs = [{'lr': 0.1}, {'lr': 0.01}, {'lr': 0.001}]
+        (sweep_id, exp_ids) = self.ddb.create_sweep('exp1', {'grid': {}}, configs, 1.0)
+        self.assertEqual([self.ddb.get_experiment(exp_id)['hyperparams']
+                          for exp_id in exp_ids], configs)
+        self.ddb.enqueue_experiments(exp_ids[:2])
+        self.ddb.set_job_state(exp_ids[0], 'running', 2.0, [0])
+        sweep = self.ddb.get_sweep(sweep_id)
+        self.assertEqual((sweep['name'], sweep['spec'], sweep['created']),
+                         ('exp1', {'grid': {}}, 1.0))
+        self.assertEqual(sweep['states'], {'new': 1, 'queued': 1, 'running': 1})
+        self.assertEqual([s['id'] for s in self.ddb.get_sweeps()], [sweep_id])
+        self.assertIsNone(self.ddb.get_sweep(sweep_id + 1))
+        self.assertIsNone(self.ddb.create_sweep('exp2', {}, configs))
+
+    def test_metrics(self):
+        """Tests for storing and reading metrics."""
+        self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
+        exp_id = self.ddb.create_experiment('exp1', {})
+        self.ddb.insert_metrics([
+            (exp_id, 'loss', step, 0, 100.0 + step, 1.0 / (step + 1))
+            for step in range(10)])
+        self.ddb.insert_metrics([(exp_id, 'epoch', 0, 0, 100.0, 0)])
+        losses = self.ddb.get_metrics(exp_id, 'loss')
+        self.assertEqual([m['step'] for m in losses], list(range(10)))
+        self.assertEqual(losses[1]['value'], 0.5)
+        self.assertEqual(len(self.ddb.get_metrics(exp_id, 'loss', 3, 5)), 3)
+        self.assertEqual(len(self.ddb.get_metrics(exp_id, 'epoch')), 1)
+
+    def test_datasets(self):
+        """Tests for registering datasets and recording their caches."""
+        dataset_id = self.ddb.insert_dataset('d1', '/a/b')
+        self.assertTrue(dataset_id)
+        self.assertFalse(self.ddb.insert_dataset('d1', '/c/d'))
+        self.assertIsNone(self.ddb.get_dataset('d1')['size'])
+        self.ddb.set_dataset_cache(dataset_id, 'f', 'c', 100, 1.0)
+        self.ddb.touch_dataset_cache(dataset_id, 2.0)
+        [dataset] = self.ddb.get_datasets()
+        self.assertEqual(
+            (dataset['size'], dataset['hits'], dataset['misses'], dataset['last_used']),
+            (100, 1, 1, 2.0))
+        self.assertTrue(self.ddb.clear_dataset_cache(dataset_id))
+        self.assertIsNone(self.ddb.get_dataset('d1')['fingerprint'])
+        self.assertEqual(self.ddb.get_dataset('d1')['hits'], 1)
+
+    def test_checkpoints(self):
+        """Tests for recording checkpoints."""
+        self.assertTrue(self.ddb.insert_definition('exp1', '/a/b/c'))
+        exp_id = self.ddb.create_experiment('exp1', {})
+        self.assertIsNone(self.ddb.get_latest_checkpoint(exp_id))
+        for step in [10, 20]:
+            self.ddb.insert_checkpoint(exp_id, {
+                'step': step, 'epoch': 0, 'position': [step, 0],
+                'manifest': '/m/%d' % step, 'size': 100, 'stored': 10,
+                'duration': 0.5, 'created': 1.0})
+        latest = self.ddb.get_latest_checkpoint(exp_id)
+        self.assertEqual((latest['step'], latest['position']), (20, [20, 0]))
+        self.ddb.delete_checkpoints(['/m/10'])
+        self.assertEqual([c['step'] for c in self.ddb.get_checkpoints(exp_id)], [20])
+
     def tearDown(self):
         self.ddb.close()
         os.remove(DB_NAME)
@@ -0,0 +1,75 @@
+"""
+Tests for definitions.py
+"""
+import unittest
+import uuid
+import os
+
+import definitions
+
+DEF_NAME = 'test_%s.py' % str(uuid.uuid4()).replace('-', '_')
+
+SOURCE = '''
+from dlex import Experiment
+
+class Helper(object):
+    pass
+
+class %s(Experiment):
+    def __init__(self):
+        super(%s, self).__init__(None, None, None)
+'''
+
+class TestDefinitions(unittest.TestCase):
+    """Test corresponding to definitions.py"""
+    def write(self, source):
+        with open(DEF_NAME, 'w') as def_file:
+            def_file.write(source)
+
+    def test_inspect(self):
+        """Test that a definition's experiment class is found and cached"""
+        self.write(SOURCE % ('Mnist', 'Mnist'))
+        cache = definitions.inspect(DEF_NAME)
+        self.assertEqual(cache['class_name'], 'Mnist')
+        self.assertEqual(cache['source_hash'], definitions.source_hash(DEF_NAME))
+        self.assertEqual(definitions.load(DEF_NAME, cache).__name__, 'Mnist')
+
+    def test_invalid(self):
+        """Test that invalid definitions are rejected"""
+        self.write('class Mnist(object):\n    pass\n')
+        with self.assertRaises(definitions.DefinitionError):
+            definitions.inspect(DEF_NAME)
+        self.write('class Mnist(:\n')
+        with self.assertRaises(definitions.DefinitionError):
+            definitions.inspect(DEF_NAME)
+        self.write('import no_such_module\n')
+        with self.assertRaises(definitions.DefinitionError):
+            definitions.inspect(DEF_NAME)
+        with self.assertRaises(definitions.DefinitionError):
+            definitions.inspect(DEF_NAME + '.missing')
+
+    def test_load_from_cache(self):
+        """Test that runners use the cached bytecode until the source changes"""
+        self.write(SOURCE % ('Mnist', 'Mnist'))
+        cache = definitions.inspect(DEF_NAME)
+        self.assertIsNone(definitions.refresh(DEF_NAME, cache))
+        self.write(SOURCE % ('Cifar', 'Cifar'))
+        # the cache is trusted: the old code runs
+        self.assertEqual(definitions.load(DEF_NAME, cache).__name__, 'Mnist')
+        fresh = definitions.refresh(DEF_NAME, cache)
+        self.assertEqual(fresh['source_hash'], definitions.source_hash(DEF_NAME))
+        # the class was renamed, so it is found by a scan
+        self.assertEqual(definitions.load(DEF_NAME, fresh).__name__, 'Cifar')
+
+    def test_stale_bytecode(self):
+        """Test that bytecode from another Python version is recompiled"""
+        self.write(SOURCE % ('Mnist', 'Mnist'))
+        cache = definitions.inspect(DEF_NAME)
+        cache['bytecode'] = b'\0\0\0\0' + cache['bytecode'][4:]
+        self.assertIsNone(definitions.load_code(cache['bytecode']))
+        self.assertIsNotNone(definitions.refresh(DEF_NAME, cache))
+        self.assertEqual(definitions.load(DEF_NAME, cache).__name__, 'Mnist')
+
+    def tearDown(self):
+        if os.path.exists(DEF_NAME):
+            os.remove(DEF_NAME)
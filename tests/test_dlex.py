@@ -0,0 +1,77 @@
+"""
+Tests for dlex.py
+"""
+import unittest
+import uuid
+import os
+
+import dlex
+
+DATA_NAME = 'test.%s.txt' % str(uuid.uuid4())
+
+class TestMappedDataset(unittest.TestCase):
+    """Test corresponding to dlex.MappedDataset"""
+    def setUp(self):
+        with open(DATA_NAME, 'w') as data_file:
+            data_file.write(''.join('line %d\n' % i for i in range(10)))
+        self.dataset = dlex.MappedDataset(DATA_NAME)
+
+    def test_random_access(self):
+        """Test indexing samples"""
+        self.assertEqual(len(self.dataset), 10)
+        self.assertEqual(bytes(self.dataset[0]), b'line 0')
+        self.assertEqual(bytes(self.dataset[-1]), b'line 9')
+        self.assertIsInstance(self.dataset[3], memoryview)
+        self.assertRaises(IndexError, lambda: self.dataset[10])
+
+    def test_close_with_samples(self):
+        """Test closing while samples still point into the mapping"""
+        sample = self.dataset[2]
+        self.dataset.close()
+        self.assertTrue(self.dataset.file.closed)
+        self.assertEqual(bytes(sample), b'line 2')
+        self.dataset.close()
+
+    def test_index_cache(self):
+        """Test that the line index is cached and invalidated"""
+        self.assertTrue(os.path.exists(DATA_NAME + '.idx'))
+        self.dataset.close()
+        self.dataset = dlex.MappedDataset(DATA_NAME)
+        self.assertEqual(len(self.dataset), 10)
+        self.dataset.close()
+        with open(DATA_NAME, 'a') as data_file:
+            data_file.write('line 10')
+        self.dataset = dlex.MappedDataset(DATA_NAME)
+        self.assertEqual(len(self.dataset), 11)
+        self.assertEqual(bytes(self.dataset[10]), b'line 10')
+
+    def test_next(self):
+        """Test sequential batches, as with Dataset.next"""
+        self.assertEqual([bytes(s) for s in self.dataset.next(4)],
+                         [b'line 0', b'line 1', b'line 2', b'line 3'])
+        self.assertEqual(len(self.dataset.next(4)), 4)
+        self.assertEqual(len(self.dataset.next(4)), 2)
+        self.assertIsNone(self.dataset.next(4))
+
+    def test_shuffled_epochs_and_resume(self):
+        """Test that shuffled epochs are reproducible and resumable"""
+        first = [bytes(s) for b in self.dataset.batches(3, shuffle=True, seed=1) for s in b]
+        self.assertEqual(sorted(first), sorted(bytes(self.dataset[i]) for i in range(10)))
+        self.assertEqual(self.dataset.state(), {'epoch': 1, 'position': 0})
+        second = [bytes(s) for b in self.dataset.batches(3, shuffle=True, seed=1) for s in b]
+        self.assertNotEqual(first, second)
+
+        batches = self.dataset.batches(3, shuffle=True, seed=1)
+        next(batches)
+        state = self.dataset.state()
+        rest = [bytes(s) for b in batches for s in b]
+        resumed = dlex.MappedDataset(DATA_NAME)
+        resumed.resume(state)
+        self.assertEqual([bytes(s) for b in resumed.batches(3, shuffle=True, seed=1) for s in b],
+                         rest)
+        resumed.close()
+
+    def tearDown(self):
+        self.dataset.close()
+        os.remove(DATA_NAME)
+        os.remove(DATA_NAME + '.idx')
@@ -0,0 +1,190 @@
+"""
+Tests for dlexd
+"""
+import importlib.machinery
+import importlib.util
+import os
+import threading
+import time
+import unittest
+import uuid
+
+import asha
+import db
+import metrics
+import scheduler
+import shm_ring
+import unix_rpc
+
+DB_NAME = 'test.%s.db' % str(uuid.uuid4())
+
+def _load_dlexd():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dlexd')
+    loader = importlib.machinery.SourceFileLoader('dlexd', path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader('dlexd', loader))
+    loader.exec_module(module)
+    return module
+
+dlexd = _load_dlexd()
+
+class Connection(object):
+    """A spawner's connection to dlexd"""
+    def __init__(self):
+        self.pushed = []
+        self.callbacks = []
+
+    def push(self, *msg):
+        self.pushed.append(msg)
+        return True
+
+    def on_close(self, callback):
+        self.callbacks.append(callback)
+
+    def close(self):
+        for callback in self.callbacks:
+            callback()
+
+class TestTracker(unittest.TestCase):
+    """Test corresponding to dlexd.Tracker"""
+    def setUp(self):
+        self.tracker = dlexd.Tracker(DB_NAME)
+        self.tracker.ddb.insert_definition('exp1', '/a/b/c')
+        self.launched = []
+        self.tracker.scheduler = scheduler.Scheduler(
+            self.tracker.ddb, lambda exp_id, cores: self.launched.append(exp_id),
+            scheduler.Limits(max_runs=1, cores=[0]), self.tracker.ddb_lock)
+
+    def test_lost_runner(self):
+        """Test that a spawner closing its connection without calling done
+        frees its slot for the next queued experiment"""
+        exp_ids = [self.tracker.ddb.create_experiment('exp1', {}) for _ in range(2)]
+        self.tracker.submit(exp_ids)
+        self.assertEqual(self.launched, exp_ids[:1])
+        conn = Connection()
+        self.tracker.running(conn, exp_ids[0], 1234)
+        conn.close()
+        self.assertEqual(self.launched, exp_ids)
+        self.assertEqual(self.tracker.get_status(exp_ids[0]), 'failed')
+        self.assertIsNone(self.tracker.status[exp_ids[0]]['pid'])
+        self.assertNotIn(exp_ids[0], self.tracker.spawners)
+        states = {job['id']: job['state'] for job in self.tracker.ddb.get_jobs(['failed'])}
+        self.assertEqual(states, {exp_ids[0]: 'failed'})
+
+        # a runner that called done isn't lost when its spawner disconnects
+        conn = Connection()
+        self.tracker.running(conn, exp_ids[1], 5678)
+        self.tracker.done(exp_ids[1], 5678)
+        conn.close()
+        self.assertNotEqual(self.tracker.get_status(exp_ids[1]), 'failed')
+
+    def test_history(self):
+        """Test that a stopped experiment's history is read from the DB"""
+        exp_id = self.tracker.ddb.create_experiment('exp1', {})
+        self.tracker.submit([exp_id])
+        self.tracker.running(Connection(), exp_id, 1234)
+        self.tracker.set_epoch(exp_id, 0)
+        for step in range(3):
+            self.tracker.set_loss(exp_id, float(step), step)
+        self.assertEqual(self.tracker.get_history(exp_id)['mean'], [0.0, 1.0, 2.0])
+        self.tracker.ddb.insert_metrics([
+            (exp_id, 'loss', step, 0, 0.0, float(step)) for step in range(3)])
+        self.tracker.done(exp_id, 1234)
+        self.assertEqual(self.tracker.history.metrics(exp_id), [])
+        history = self.tracker.get_history(exp_id, start_step=1)
+        self.assertEqual(history['first_step'], [1, 2])
+        self.assertEqual(history['mean'], [1.0, 2.0])
+        self.assertIsNone(self.tracker.get_history(exp_id, 'other'))
+
+    def test_history_of_resumed_experiment(self):
+        """Test that the history of an experiment resumed before its metrics
+        were written is kept"""
+        self.tracker.writer = metrics.MetricWriter(DB_NAME)
+        exp_id = self.tracker.ddb.create_experiment('exp1', {})
+        self.tracker.submit([exp_id])
+        self.tracker.running(Connection(), exp_id, 1234)
+        self.tracker.set_epoch(exp_id, 0)
+        self.tracker.set_loss(exp_id, 1.0, 0)
+        self.tracker.done(exp_id, 1234)
+        self.assertEqual(self.tracker.history.metrics(exp_id), ['loss'])
+        self.tracker.running(Connection(), exp_id, 5678)
+        self.tracker.writer.flush(self.tracker.ddb)
+        self.assertEqual(self.tracker.history.metrics(exp_id), ['loss'])
+        self.tracker.done(exp_id, 5678)
+        self.tracker.writer.flush(self.tracker.ddb)
+        self.assertEqual(self.tracker.history.metrics(exp_id), [])
+
+    def test_report_metrics(self):
+        """Test that reported steps are numbered like set_loss's"""
+        exp_id = self.tracker.ddb.create_experiment('exp1', {})
+        self.tracker.submit([exp_id])
+        self.tracker.running(Connection(), exp_id, 1234)
+        loss = {'last': 0.5, 'mean': 0.5, 'min': 0.5, 'max': 0.5, 'count': 2}
+        self.tracker.report_metrics(exp_id, {'step': 1, 'loss': loss, 'position': 0})
+        self.tracker.report_metrics(exp_id, {'step': 3, 'loss': loss, 'position': 0})
+        self.assertEqual(self.tracker.get_history(exp_id)['first_step'], [0, 2])
+
+    def test_positions(self):
+        """Test that a position is recorded the same way whether it came
+        through RPC or the shared-memory ring"""
+        exp_id = self.tracker.ddb.create_experiment('exp1', {})
+        self.tracker.submit([exp_id])
+        self.tracker.running(Connection(), exp_id, 1234)
+        loss = {'last': 0.5, 'mean': 0.5, 'min': 0.5, 'max': 0.5, 'count': 1}
+        for position in [3, 3.0, 2.5, 'a']:
+            self.tracker.report_metrics(exp_id, {'step': 1, 'loss': loss, 'position': position})
+            reported = self.tracker.status[exp_id]['position']
+            if isinstance(position, float):
+                self.tracker.apply_records(exp_id, [(shm_ring.POSITION, 1, 0, position, 0.0)])
+            else:
+                self.tracker.set_position(exp_id, position)
+            self.assertEqual(self.tracker.status[exp_id]['position'], reported)
+            self.assertEqual(type(self.tracker.status[exp_id]['position']), type(reported))
+        self.assertEqual(self.tracker.status[exp_id]['position'], 'a')
+
+    def test_asha_epoch_loss(self):
+        """Test that rung decisions use the mean loss of the epoch, and are
+        logged by the writer"""
+        self.tracker.writer = metrics.MetricWriter(DB_NAME)
+        self.tracker.writer.start()
+        self.tracker.asha = asha.ASHA(
+            self.tracker.ddb, self.tracker.stop, lambda exp_id, priority: None,
+            self.tracker.ddb_lock, self.tracker.writer)
+        exp_id = self.tracker.ddb.create_experiment('exp1', {'asha': {'min_epochs': 1}})
+        self.tracker.submit([exp_id])
+        self.tracker.running(Connection(), exp_id, 1234)
+        self.tracker.set_epoch(exp_id, 0)
+        for (step, loss) in enumerate([4.0, 2.0, 3.0]):
+            self.tracker.set_loss(exp_id, loss, step)
+        self.tracker.set_epoch(exp_id, 1)
+        self.tracker.writer.close()
+        decisions = self.tracker.ddb.get_asha_decisions()
+        self.assertEqual([(d['exp_id'], d['rung'], d['loss'], d['decision']) for d in decisions],
+                         [(exp_id, 0, 3.0, 'promote')])
+
+    def test_blocking_handlers(self):
+        """Test the handlers that read DLEXDB on the server's thread pool"""
+        exp_id = self.tracker.ddb.create_experiment('exp1', {})
+        self.tracker.set_status(exp_id, 'queued')
+        path = '%s.sock' % DB_NAME
+        server = unix_rpc.AsyncServer(path)
+        self.tracker.server = server
+        server.register('experiments', self.tracker.experiments, blocking=True)
+        server.register('get_history', self.tracker.get_history, blocking=True)
+        server.register('set_loss', self.tracker.set_loss)
+        threading.Thread(target=server.start, daemon=True).start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        client = unix_rpc.Client(path)
+        self.tracker.status[exp_id]['epoch'] = 0
+        client.set_loss(exp_id, 0.5, 0)
+        [experiment] = client.experiments(['status', 'loss'])
+        self.assertEqual((experiment['status'], experiment['loss']), ('queued', 0.5))
+        self.assertEqual(client.get_history(exp_id)['mean'], [0.5])
+        client.close()
+        os.remove(path)
+
+    def tearDown(self):
+        self.tracker.ddb.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(DB_NAME + suffix):
+                os.remove(DB_NAME + suffix)
@@ -0,0 +1,125 @@
+"""
+Tests for loader.py
+"""
+import threading
+import time
+import unittest
+import uuid
+import os
+
+import dlex
+import loader
+
+DATA_NAME = 'test.%s.txt' % str(uuid.uuid4())
+
+def _lengths(samples):
+    return [len(sample) for sample in samples]
+
+def _fail_on_line_5(samples):
+    if b'line 5' in samples:
+        raise ValueError('bad sample')
+    return samples
+
+def _large(samples):
+    # more than a pipe's buffer (64KB on Linux)
+    return b'x' * (256 * 1024 * len(samples))
+
+class TestBatchLoader(unittest.TestCase):
+    """Test corresponding to loader.BatchLoader"""
+    def setUp(self):
+        with open(DATA_NAME, 'w') as data_file:
+            data_file.write(''.join('line %d\n' % i for i in range(25)))
+        self.dataset = dlex.MappedDataset(DATA_NAME)
+
+    def expected(self, epoch, shuffle=False, seed=0):
+        order = self.dataset.order(epoch, shuffle, seed)
+        return [[bytes(self.dataset[i]) for i in order[k:k + 4]]
+                for k in range(0, len(order), 4)]
+
+    def test_thread_workers(self):
+        """Test that thread workers keep the single-reader batch order"""
+        batch_loader = loader.BatchLoader(DATA_NAME, 4, workers=3, shuffle=True, seed=7)
+        self.assertEqual(len(batch_loader), 7)
+        for epoch in range(2):
+            batches = [[bytes(s) for s in batch] for batch in batch_loader]
+            self.assertEqual(batches, self.expected(epoch, True, 7))
+        batches = None
+        batch_loader.close()
+
+    def test_process_workers(self):
+        """Test decoding in worker processes"""
+        batch_loader = loader.BatchLoader(
+            DATA_NAME, 4, decode=_lengths, workers=2, mode='process')
+        self.assertEqual(list(batch_loader),
+                         [[len(s) for s in batch] for batch in self.expected(0)])
+        batch_loader.close()
+
+    def test_worker_errors(self):
+        """Test that a worker's error is raised in the consumer"""
+        for mode in ['thread', 'process']:
+            batch_loader = loader.BatchLoader(
+                DATA_NAME, 4, decode=_fail_on_line_5, workers=2, mode=mode)
+            batches = iter(batch_loader)
+            self.assertEqual(len(next(batches)), 4)
+            with self.assertRaises(loader.WorkerError) as raised:
+                next(batches)
+            self.assertIn('ValueError: bad sample', str(raised.exception))
+            batch_loader.close()
+
+    def test_worker_exits(self):
+        """Test that a worker process that dies doesn't hang the consumer"""
+        batch_loader = loader.BatchLoader(DATA_NAME, 4, workers=2, mode='process')
+        batch_loader.threads[0].kill()
+        batch_loader.threads[0].join()
+        with self.assertRaises(loader.WorkerError):
+            list(batch_loader)
+        batch_loader.close()
+
+    def test_close_process_workers(self):
+        """Test closing process workers blocked on batches larger than a
+        pipe's buffer"""
+        for _ in range(5):
+            batch_loader = loader.BatchLoader(
+                DATA_NAME, 4, decode=_large, workers=2, prefetch=2, mode='process')
+            self.assertEqual(len(next(iter(batch_loader))), 4 * 256 * 1024)
+            # let the workers fill their queues and block
+            time.sleep(0.2)
+            closing = threading.Thread(target=batch_loader.close, daemon=True)
+            closing.start()
+            closing.join(10)
+            self.assertFalse(closing.is_alive())
+
+    def test_pause_and_resume_state(self):
+        """Test pausing and resuming a loader from its state"""
+        batch_loader = loader.BatchLoader(DATA_NAME, 4, shuffle=True, seed=3)
+        batch_loader.pause()
+        batch_loader.resume()
+        batches = iter(batch_loader)
+        next(batches)
+        next(batches)
+        state = batch_loader.state()
+        self.assertEqual(state, {'epoch': 0, 'position': 8})
+        batches = None
+        batch_loader.close()
+
+        resumed = loader.BatchLoader(DATA_NAME, 4, shuffle=True, seed=3, state=state)
+        self.assertEqual([[bytes(s) for s in batch] for batch in resumed],
+                         self.expected(0, True, 3)[2:])
+        resumed.close()
+
+    def test_restart(self):
+        """Test that restarted workers continue from the current batch"""
+        batch_loader = loader.BatchLoader(DATA_NAME, 4, workers=2, shuffle=True, seed=5)
+        batches = iter(batch_loader)
+        first = [[bytes(s) for s in next(batches)]]
+        # after a real fork, the old workers don't exist in this process
+        batch_loader.stopped.set()
+        batch_loader.restart()
+        rest = [[bytes(s) for s in batch] for batch in batches]
+        self.assertEqual(first + rest, self.expected(0, True, 5))
+        batch_loader.close()
+
+    def tearDown(self):
+        self.dataset.close()
+        os.remove(DATA_NAME)
+        os.remove(DATA_NAME + '.idx')
@@ -0,0 +1,140 @@
+"""
+Tests for metrics.py
+"""
+import threading
+import unittest
+import uuid
+import os
+
+import db
+import metrics
+
+DB_NAME = 'test.%s.db' % str(uuid.uuid4())
+
+class TestMetricSeries(unittest.TestCase):
+    """Test corresponding to metrics.MetricSeries"""
+    def test_full_resolution(self):
+        """Test that recent points are kept as they are"""
+        series = metrics.MetricSeries(capacity=8, factor=2, levels=2)
+        for step in range(5):
+            series.append(step, 0, float(step), timestamp=100.0 + step)
+        history = series.query()
+        self.assertEqual(history['first_step'], [0, 1, 2, 3, 4])
+        self.assertEqual(history['mean'], [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(history['count'], [1] * 5)
+        self.assertEqual(history['timestamp'][-1], 104.0)
+
+    def test_downsampling(self):
+        """Test that old points are folded into min/mean/max buckets"""
+        series = metrics.MetricSeries(capacity=4, factor=2, levels=2)
+        for step in range(8):
+            series.append(step, step // 4, float(step))
+        history = series.query()
+        self.assertEqual(history['first_step'], [0, 2, 4, 5, 6, 7])
+        self.assertEqual(history['last_step'], [1, 3, 4, 5, 6, 7])
+        self.assertEqual(history['min'][:2], [0.0, 2.0])
+        self.assertEqual(history['mean'][:2], [0.5, 2.5])
+        self.assertEqual(history['max'][:2], [1.0, 3.0])
+        self.assertEqual(history['count'], [2, 2, 1, 1, 1, 1])
+        self.assertEqual(sum(history['count']), 8)
+
+    def test_bounded_memory(self):
+        """Test that memory grows with the first points only"""
+        series = metrics.MetricSeries(capacity=16, factor=4, levels=3)
+        self.assertEqual(series.nbytes(), 0)
+        series.append(0, 0, 1.0)
+        self.assertEqual(series.nbytes(), 64)
+        # until every level is full
+        for step in range(1, 16 * (1 + 4 + 16)):
+            series.append(step, 0, 1.0)
+        nbytes = series.nbytes()
+        self.assertEqual(nbytes, 3 * 16 * 64)
+        for step in range(16 * (1 + 4 + 16), 100000):
+            series.append(step, 0, 1.0)
+        self.assertEqual(series.nbytes(), nbytes)
+        history = series.query()
+        self.assertEqual(history['last_step'][-1], 99999)
+        self.assertLessEqual(len(history['count']), 3 * 16 + 2)
+        # the last level holds buckets of 4 * 4 points and drops the oldest
+        self.assertEqual(history['count'][0], 16)
+        self.assertLess(sum(history['count']), 100000)
+
+    def test_epoch_mean(self):
+        """Test the mean of an epoch, at full resolution and folded"""
+        series = metrics.MetricSeries(capacity=4, factor=2, levels=2)
+        series.append_summary(0, 1, 0, {'min': 1.0, 'mean': 2.0, 'max': 3.0, 'count': 2})
+        for step in range(2, 8):
+            series.append(step, step // 4, float(step))
+        self.assertEqual(series.epoch_mean(0), (2 * 2.0 + 2.0 + 3.0) / 4)
+        self.assertEqual(series.epoch_mean(1), 5.5)
+        self.assertIsNone(series.epoch_mean(2))
+
+    def test_range_query(self):
+        """Test querying a range of steps"""
+        series = metrics.MetricSeries(capacity=4, factor=2, levels=2)
+        for step in range(8):
+            series.append(step, 0, float(step))
+        history = series.query(start_step=3, end_step=5)
+        self.assertEqual(history['first_step'], [2, 4, 5])
+
+class TestMetricStore(unittest.TestCase):
+    """Test corresponding to metrics.MetricStore"""
+    def test_store(self):
+        """Test recording several experiments and metrics"""
+        store = metrics.MetricStore(max_metrics=2, capacity=4)
+        store.append(1, 'loss', 0, 0, 0.5)
+        store.append(1, 'accuracy', 0, 0, 0.9)
+        store.append(2, 'loss', 0, 0, 0.7)
+        self.assertEqual(store.metrics(1), ['accuracy', 'loss'])
+        self.assertEqual(store.query(2, 'loss')['mean'], [0.7])
+        self.assertIsNone(store.query(3, 'loss'))
+        self.assertRaises(ValueError, store.append, 1, 'other', 0, 0, 1.0)
+        store.remove(1)
+        self.assertEqual(store.metrics(1), [])
+
+class TestMetricWriter(unittest.TestCase):
+    """Test corresponding to metrics.MetricWriter"""
+    def setUp(self):
+        self.ddb = db.DLEXDB(DB_NAME)
+
+    def test_flush_on_size_and_close(self):
+        """Test that rows are written in batches and on close"""
+        writer = metrics.MetricWriter(DB_NAME, max_rows=10, max_delay=60)
+        writer.start()
+        for step in range(25):
+            writer.write(1, 'loss', step, 0, float(step))
+        writer.close()
+        self.assertEqual(writer.written, 25)
+        self.assertEqual(len(self.ddb.get_metrics(1, 'loss')), 25)
+
+    def test_after_write(self):
+        """Test that callbacks run once the rows before them are written"""
+        writer = metrics.MetricWriter(DB_NAME, max_rows=10, max_delay=60)
+        writer.start()
+        written = []
+        writer.write(1, 'loss', 0, 0, 0.5)
+        writer.after_write(lambda ddb: written.append(len(ddb.get_metrics(1, 'loss'))))
+        writer.close()
+        self.assertEqual(written, [1])
+
+    def test_errors(self):
+        """Test that failed inserts and callbacks don't stop the writer"""
+        writer = metrics.MetricWriter(DB_NAME, max_rows=10, max_delay=60)
+        writer.start()
+        written = []
+        # a list can't be bound as a value
+        writer.write(1, 'loss', 0, 0, [0.5])
+        writer.after_write(lambda ddb: 1 / 0)
+        writer.after_write(lambda ddb: written.append(True))
+        flushed = threading.Event()
+        writer.after_write(lambda ddb: flushed.set())
+        flushed.wait()
+        writer.write(1, 'loss', 1, 0, 0.25)
+        writer.close()
+        self.assertEqual((writer.written, writer.dropped), (1, 1))
+        self.assertEqual(written, [True])
+        self.assertEqual([row['value'] for row in self.ddb.get_metrics(1, 'loss')], [0.25])
+
+    def tearDown(self):
+        self.ddb.close()
+        os.remove(DB_NAME)
@@ -0,0 +1,72 @@
+"""
+Tests for procstat.py
+"""
+import os
+import signal
+import subprocess
+import time
+import unittest
+
+import procstat
+
+class TestSampler(unittest.TestCase):
+    """Test corresponding to procstat.Sampler"""
+    def setUp(self):
+        # a shell with two children: one sleeping, one using a core
+        self.process = subprocess.Popen(
+            ['sh', '-c', 'sleep 30 & while :; do :; done & wait'], start_new_session=True)
+        self.sampler = procstat.Sampler(history=3)
+        deadline = time.monotonic() + 5
+        while len(self.children()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def children(self):
+        return self.sampler.children().get(self.process.pid, [])
+
+    def test_sample_tree(self):
+        """Test that the whole tree is sampled, and that the series is
+        bounded"""
+        self.sampler.sample({1: self.process.pid})
+        self.assertIsNone(self.sampler.latest(1)['cpu'])
+        for _ in range(3):
+            time.sleep(0.2)
+            self.sampler.sample({1: self.process.pid})
+        latest = self.sampler.latest(1)
+        self.assertEqual(latest['processes'], 3)
+        self.assertGreater(latest['cpu'], 10)
+        self.assertGreater(latest['rss'], 0)
+        self.assertGreater(latest['minflt'], 0)
+        self.assertEqual(len(self.sampler.series(1)), 3)
+        self.assertEqual(self.sampler.series(1)[-1], latest)
+
+    def test_scan(self):
+        """Test finding children by scanning /proc, as without children
+        files"""
+        has_children_files = procstat.HAS_CHILDREN_FILES
+        procstat.HAS_CHILDREN_FILES = False
+        try:
+            self.sampler.sample({1: self.process.pid})
+            self.assertEqual(self.sampler.latest(1)['processes'], 3)
+        finally:
+            procstat.HAS_CHILDREN_FILES = has_children_files
+
+    def test_exited(self):
+        """Test that exited processes are dropped without losing their
+        counts, and that stopped experiments are forgotten"""
+        self.sampler.sample({1: self.process.pid})
+        minflt = self.sampler.latest(1)['minflt']
+        os.killpg(self.process.pid, signal.SIGKILL)
+        self.process.wait()
+        self.sampler.sample({1: self.process.pid})
+        latest = self.sampler.latest(1)
+        self.assertEqual(latest['processes'], 0)
+        self.assertEqual(latest['minflt'], minflt)
+        self.sampler.sample({})
+        self.assertIsNone(self.sampler.latest(1))
+        self.assertEqual(self.sampler.series(1), [])
+
+    def tearDown(self):
+        self.sampler.close()
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
@@ -0,0 +1,82 @@
+"""
+Tests for profiling.py
+"""
+import os
+import pstats
+import tempfile
+import unittest
+
+import profiling
+
+class TestStepHistogram(unittest.TestCase):
+    """Test corresponding to profiling.StepHistogram"""
+    def test_percentiles(self):
+        """Test that percentiles are within a bucket of the exact ones"""
+        histogram = profiling.StepHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['mean'], 0.0505)
+        self.assertEqual(summary['max'], 0.1)
+        for (percent, exact) in [(50, 0.05), (95, 0.095), (99, 0.099)]:
+            self.assertGreaterEqual(summary['p%d' % percent], exact)
+            self.assertLessEqual(summary['p%d' % percent], exact * histogram.ratio)
+        histogram.add(0.0)
+        self.assertLessEqual(histogram.percentile(0.5), histogram.min_time * histogram.ratio)
+
+class TestProfile(unittest.TestCase):
+    """Test corresponding to profiling.Profile"""
+    def test_summary(self):
+        """Test phases, overheads and the running phase in the summary"""
+        profile = profiling.Profile(interval=0)
+        with profile.phase('init'):
+            pass
+        profile.add_phase('init', 1.0, 0.5)
+        profile.add_overhead('select', 0.25)
+        train = profile.phase('train').start()
+        summary = profile.summary(train, {'data_wait': 2.0})
+        self.assertGreaterEqual(summary['phases']['init']['wall'], 1.0)
+        self.assertIn('train', summary['phases'])
+        self.assertEqual(summary['overhead']['select'], {'seconds': 0.25, 'calls': 1})
+        self.assertEqual(summary['overhead']['data_wait'], {'seconds': 2.0, 'calls': None})
+        self.assertEqual(summary['steps']['count'], 0)
+        self.assertTrue(profile.due())
+        train.stop()
+        self.assertIn('train', profile.phases)
+
+class TestProfiler(unittest.TestCase):
+    """Test corresponding to profiling.Profiler"""
+    def test_stats_file(self):
+        """Test that a profile is written once its time is up"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'stats', 'run.prof')
+        profiler = profiling.Profiler()
+        self.assertIsNone(profiler.check())
+        self.assertIsNone(profiler.start(0, path))
+        sum(range(1000))
+        self.assertEqual(profiler.check(), path)
+        self.assertIsNone(profiler.stop())
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+        profiler.start(60, os.path.join(directory, 'discarded.prof'))
+        profiler.discard()
+        self.assertIsNone(profiler.stop())
+        self.assertFalse(os.path.exists(os.path.join(directory, 'discarded.prof')))
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        os.rmdir(directory)
+
+    def test_unwritable_stats_file(self):
+        """Test that a stats file that can't be written is reported, not
+        raised"""
+        with tempfile.NamedTemporaryFile() as not_a_directory:
+            path = os.path.join(not_a_directory.name, 'run.prof')
+            profiler = profiling.Profiler()
+            profiler.start(0, path)
+            self.assertEqual(profiler.check(), path)
+            self.assertIn(not_a_directory.name, profiler.error)
+            profiler.start(0, '\0')
+            self.assertEqual(profiler.stop(), '\0')
+            self.assertIsNotNone(profiler.error)
+            self.assertIsNone(profiler.stop())
@@ -0,0 +1,121 @@
+"""
+Tests for runner.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import checkpoint
+import runner
+import shm_ring
+
+class ListPipe(object):
+    """Collects what is written to it"""
+    def __init__(self):
+        self.messages = []
+
+    def write(self, msg):
+        self.messages.append(msg)
+
+class TestReporter(unittest.TestCase):
+    """Test corresponding to runner.Reporter and runner.ReportPolicy"""
+    def test_every_step(self):
+        """Test that the default policy reports every step"""
+        pipe = ListPipe()
+        reporter = runner.Reporter(pipe, runner.ReportPolicy())
+        reporter.add(0.5, 1)
+        reporter.add(0.25, 2)
+        self.assertEqual(len(pipe.messages), 2)
+        self.assertEqual(pipe.messages[1], ['metrics', {
+            'step': 2,
+            'loss': {'last': 0.25, 'mean': 0.25, 'min': 0.25, 'max': 0.25, 'count': 1},
+            'position': 2}])
+
+    def test_every_n_steps(self):
+        """Test that losses are aggregated between reports"""
+        pipe = ListPipe()
+        reporter = runner.Reporter(pipe, runner.ReportPolicy(every_steps=4))
+        for step, loss in enumerate([4.0, 1.0, 3.0, 2.0, 5.0]):
+            reporter.add(loss, step)
+        self.assertEqual(len(pipe.messages), 1)
+        self.assertEqual(pipe.messages[0][1]['loss'], {
+            'last': 2.0, 'mean': 2.5, 'min': 1.0, 'max': 4.0, 'count': 4})
+        reporter.flush()
+        self.assertEqual(pipe.messages[1][1]['step'], 5)
+        self.assertEqual(pipe.messages[1][1]['loss']['count'], 1)
+        reporter.flush()
+        self.assertEqual(len(pipe.messages), 2)
+
+    def test_threshold(self):
+        """Test reporting on a change beyond a threshold"""
+        pipe = ListPipe()
+        policy = runner.ReportPolicy(threshold=0.5)
+        reporter = runner.Reporter(pipe, policy)
+        for loss in [2.0, 1.9, 1.8, 1.2, 1.1]:
+            reporter.add(loss, 0)
+        self.assertEqual([m[1]['loss']['last'] for m in pipe.messages], [2.0, 1.2])
+
+    def test_from_hyperparams(self):
+        """Test reading the policy from the hyperparams"""
+        policy = runner.ReportPolicy.from_hyperparams({'report': {'every_ms': 100}})
+        self.assertEqual(policy.every_ms, 100)
+        self.assertTrue(policy.due(1, 0.2, 0.0, 0.0))
+        self.assertFalse(policy.due(5, 0.05, 0.0, 0.0))
+
+class TestShmReporter(unittest.TestCase):
+    """Test corresponding to runner.ShmReporter"""
+    def test_positions(self):
+        """Test that numeric positions go through the ring, and the others
+        through the pipe when they change"""
+        pipe = ListPipe()
+        reporter = runner.ShmReporter(pipe, 'test_%d' % os.getpid(), capacity=16)
+        for position in [3, 'a', 'a', 'b', 4.5]:
+            reporter.add(0.5, position)
+        self.assertEqual(pipe.messages[1:], [['position', 'a'], ['position', 'b']])
+        ring = shm_ring.MetricRing.attach(reporter.ring.name)
+        positions = [record[3] for record in ring.drain() if record[0] == shm_ring.POSITION]
+        self.assertEqual(positions, [3.0, 4.5])
+        reporter.close()
+        ring.close(unlink=True)
+
+class Experiment(object):
+    """The parts of an experiment Checkpoints uses"""
+    current_epoch = 0
+
+    def checkpoint(self):
+        return {'weights': b'x' * 100}
+
+class TestCheckpoints(unittest.TestCase):
+    """Test corresponding to runner.Checkpoints"""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def test_unwritable_store(self):
+        """Test that a failed checkpoint is reported and training goes on"""
+        pipe = ListPipe()
+        checkpoints = runner.Checkpoints(
+            pipe, checkpoint.CheckpointPolicy(every_steps=1, root=self.root), 1)
+        # manifests can't be created in a file, even by root
+        manifests = os.path.join(self.root, '1', 'manifests')
+        os.rmdir(manifests)
+        open(manifests, 'w').close()
+        experiment = Experiment()
+        checkpoints.step(experiment, 1)
+        checkpoints.checkpointer.wait()
+        checkpoints.step(experiment, 2)
+        checkpoints.close(experiment, 3)
+        self.assertEqual([msg[0] for msg in pipe.messages], ['checkpoint_error'] * 3)
+        self.assertTrue(pipe.messages[0][1].startswith('step 1: NotADirectoryError'))
+
+        # and goes back to reporting checkpoints once they can be written
+        os.remove(manifests)
+        os.mkdir(manifests)
+        pipe.messages = []
+        checkpoints = runner.Checkpoints(
+            pipe, checkpoint.CheckpointPolicy(every_steps=1, root=self.root), 1)
+        checkpoints.close(experiment, 4)
+        self.assertEqual([msg[0] for msg in pipe.messages], ['checkpoint'])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
@@ -0,0 +1,93 @@
+"""
+Tests for scheduler.py
+"""
+import unittest
+import uuid
+import os
+
+import db
+import scheduler
+
+DB_NAME = 'test.%s.db' % str(uuid.uuid4())
+
+class TestScheduler(unittest.TestCase):
+    """Test corresponding to scheduler.py"""
+    def setUp(self):
+        self.ddb = db.DLEXDB(DB_NAME)
+        self.ddb.insert_definition('exp1', '/a/b/c')
+        self.launched = []
+        self.limits = scheduler.Limits(max_runs=3, cores=[0, 1, 2, 3], memory=100)
+
+    def make(self, resources=None):
+        hyperparams = {'resources': resources} if resources is not None else {}
+        return self.ddb.create_experiment('exp1', hyperparams)
+
+    def scheduler(self):
+        return scheduler.Scheduler(
+            self.ddb, lambda exp_id, cores: self.launched.append((exp_id, cores)),
+            self.limits)
+
+    def test_limits(self):
+        """Test that experiments start within the run, core and memory limits"""
+        sched = self.scheduler()
+        big = self.make({'cores': 2, 'memory': 60})
+        small = [self.make() for _ in range(3)]
+        hungry = self.make({'memory': 50})
+        sched.submit([big] + small + [hungry])
+        self.assertEqual(self.launched, [(big, [0, 1]), (small[0], [2]), (small[1], [3])])
+
+        sched.finished(small[0])
+        self.assertEqual(self.launched[-1], (small[2], [2]))
+        # the next one doesn't fit in memory, and blocks the queue
+        sched.finished(small[1])
+        self.assertEqual(len(self.launched), 4)
+        sched.finished(big)
+        self.assertEqual(self.launched[-1], (hungry, [0]))
+        states = {job['id']: job['state'] for job in self.ddb.get_jobs(['done', 'running'])}
+        self.assertEqual(states[big], 'done')
+        self.assertEqual(states[hungry], 'running')
+
+    def test_shared_cores(self):
+        """Test that cores are given to `share` experiments, least used
+        first"""
+        self.limits = scheduler.Limits(cores=[0, 1], memory=100, share=2)
+        sched = self.scheduler()
+        exps = [self.make() for _ in range(5)]
+        sched.submit(exps)
+        self.assertEqual(self.launched, [
+            (exps[0], [0]), (exps[1], [1]), (exps[2], [0]), (exps[3], [1])])
+        sched.finished(exps[1])
+        self.assertEqual(self.launched[-1], (exps[4], [1]))
+
+    def test_priorities_and_persistence(self):
+        """Test priority and FIFO order, and reloading the queue from the DB"""
+        self.limits.max_runs = 0
+        sched = self.scheduler()
+        low = [self.make() for _ in range(2)]
+        high = self.make()
+        sched.submit(low)
+        sched.submit([high], priority=1)
+        info = sched.queue_info()
+        self.assertEqual([info[exp_id]['queue_position'] for exp_id in [high] + low], [1, 2, 3])
+        self.assertIsNone(info[high]['estimated_start'])
+        self.assertEqual(sched.cancel([low[1]]), [low[1]])
+
+        self.limits.max_runs = 3
+        self.scheduler().schedule()
+        self.assertEqual([exp_id for (exp_id, _) in self.launched], [high, low[0]])
+
+    def test_estimated_start(self):
+        """Test start estimates from the duration of past runs"""
+        self.limits.max_runs = 1
+        sched = self.scheduler()
+        first, second, third = self.make(), self.make(), self.make()
+        sched.submit([first, second, third])
+        sched.durations.append(100.0)
+        now = sched.running[first]['started_at']
+        info = sched.queue_info(now)
+        self.assertAlmostEqual(info[second]['estimated_start'], now + 100.0)
+        self.assertAlmostEqual(info[third]['estimated_start'], now + 200.0)
+
+    def tearDown(self):
+        self.ddb.close()
+        os.remove(DB_NAME)
@@ -0,0 +1,57 @@
+"""
+Tests for shm_ring.py
+"""
+import os
+import subprocess
+import tempfile
+import unittest
+import uuid
+
+import shm_ring
+
+class TestMetricRing(unittest.TestCase):
+    """Test corresponding to shm_ring.py"""
+    def setUp(self):
+        self.name = 'dlex_test_%s' % uuid.uuid4().hex[:16]
+        self.producer = shm_ring.MetricRing.create(self.name, capacity=4)
+        self.consumer = shm_ring.MetricRing.attach(self.name)
+
+    def test_put_and_drain(self):
+        """Test that records written by the producer reach the consumer"""
+        self.assertTrue(self.producer.put(shm_ring.LOSS, 1, 0, 0.5, timestamp=10.0))
+        self.assertTrue(self.producer.put(shm_ring.POSITION, 1, 0, 32, timestamp=10.0))
+        self.assertEqual(self.consumer.drain(), [
+            (shm_ring.LOSS, 1, 0, 0.5, 10.0),
+            (shm_ring.POSITION, 1, 0, 32.0, 10.0)])
+        self.assertEqual(self.consumer.drain(), [])
+
+    def test_full_ring_drops(self):
+        """Test that a full ring drops new records instead of blocking"""
+        for step in range(6):
+            self.producer.put(shm_ring.LOSS, step, 0, float(step))
+        self.assertEqual(self.consumer.dropped(), 2)
+        self.assertEqual([r[1] for r in self.consumer.drain()], [0, 1, 2, 3])
+        # wrapping around after a drain
+        for step in range(6, 9):
+            self.producer.put(shm_ring.LOSS, step, 0, float(step))
+        self.assertEqual([r[1] for r in self.consumer.drain()], [6, 7, 8])
+
+    def tearDown(self):
+        self.producer.close()
+        self.consumer.close(unlink=True)
+
+class TestSweep(unittest.TestCase):
+    """Test corresponding to shm_ring.sweep"""
+    def test_sweep(self):
+        """Test that only the segments of exited producers are removed"""
+        directory = tempfile.mkdtemp()
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        names = ['dlex_1_%d' % exited.pid, 'dlex_2_%d' % os.getpid(), 'dlex_test', 'other_3_1']
+        for name in names:
+            open(os.path.join(directory, name), 'w').close()
+        self.assertEqual(shm_ring.sweep(directory=directory), names[:1])
+        self.assertEqual(sorted(os.listdir(directory)), sorted(names[1:]))
+        for name in names[1:]:
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
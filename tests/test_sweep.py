@@ -0,0 +1,41 @@
+"""
+Tests for sweep.py
+"""
+import unittest
+
+import sweep
+
+class TestSweep(unittest.TestCase):
+    """Test corresponding to sweep.py"""
+    def test_parse(self):
+        """Test parsing grid axes and distributions from the command line"""
+        self.assertEqual(sweep.parse_grid(['batch=32,64', 'opt=sgd,adam']),
+                         {'batch': [32, 64], 'opt': ['sgd', 'adam']})
+        self.assertEqual(sweep.parse_distributions(['lr=loguniform:1e-4:1e-1']),
+                         {'lr': 'loguniform:1e-4:1e-1'})
+        with self.assertRaises(ValueError):
+            sweep.parse_distributions(['lr=normal:0:1'])
+
+    def test_grid(self):
+        """Test that a grid expands to the cartesian product of its axes"""
+        configs = sweep.expand({'opt': ['sgd', 'adam'], 'batch': [32, 64]},
+                               base={'epochs': 3})
+        self.assertEqual(configs, [
+            {'epochs': 3, 'batch': 32, 'opt': 'sgd'},
+            {'epochs': 3, 'batch': 32, 'opt': 'adam'},
+            {'epochs': 3, 'batch': 64, 'opt': 'sgd'},
+            {'epochs': 3, 'batch': 64, 'opt': 'adam'}])
+
+    def test_random(self):
+        """Test that random draws are within range and reproducible"""
+        distributions = {'lr': 'loguniform:1e-4:1e-1', 'layers': 'int:2:6',
+                         'act': 'choice:relu,tanh', 'dropout': 'uniform:0:0.5'}
+        configs = sweep.expand({'batch': [32, 64]}, distributions, 50, seed=3)
+        self.assertEqual(len(configs), 100)
+        self.assertEqual(configs, sweep.expand({'batch': [32, 64]}, distributions, 50, seed=3))
+        self.assertNotEqual(configs, sweep.expand({'batch': [32, 64]}, distributions, 50, seed=4))
+        for config in configs:
+            self.assertTrue(1e-4 <= config['lr'] <= 1e-1)
+            self.assertIn(config['layers'], range(2, 7))
+            self.assertIn(config['act'], ['relu', 'tanh'])
+            self.assertTrue(0 <= config['dropout'] <= 0.5)
@@ -0,0 +1,64 @@
+"""
+Tests for timeslice.py
+"""
+import unittest
+
+import timeslice
+
+class TestTimeSlicer(unittest.TestCase):
+    """Test corresponding to timeslice.TimeSlicer"""
+    def setUp(self):
+        self.calls = []
+        self.slicer = timeslice.TimeSlicer(
+            lambda exp_id: self.calls.append(('pause', exp_id)),
+            lambda exp_id: self.calls.append(('unpause', exp_id)), quantum=1.0)
+
+    def running(self):
+        return sorted(exp_id for (exp_id, piece) in self.slicer.slices.items() if piece.running)
+
+    def test_rotation(self):
+        """Test that experiments on a core take turns, in proportion to their
+        weights"""
+        self.assertTrue(self.slicer.add(1, [0], 1.0, now=0.0))
+        self.assertFalse(self.slicer.add(2, [0], 2.0, now=0.0))
+        self.assertTrue(self.slicer.add(3, [1], 1.0, now=0.0))
+        self.assertEqual(self.calls, [('pause', 2)])
+        for now in range(1, 31):
+            self.slicer.tick(now=float(now))
+        shares = self.slicer.shares(now=30.0)
+        self.assertEqual((shares[1]['target'], shares[3]['target']), (1 / 3, 1.0))
+        self.assertAlmostEqual(shares[1]['achieved'], 1 / 3, delta=0.05)
+        self.assertAlmostEqual(shares[2]['achieved'], 2 / 3, delta=0.05)
+        self.assertEqual(shares[3]['achieved'], 1.0)
+        self.assertNotIn(('pause', 3), self.calls)
+        # a pause is always followed by the unpause of another experiment
+        self.assertEqual(len(self.running()), 2)
+
+    def test_join_and_leave(self):
+        """Test that a late experiment starts from the others' time, and that
+        one leaving frees its core right away"""
+        self.slicer.add(1, [0], now=0.0)
+        self.slicer.add(2, [0], now=0.0)
+        for now in range(1, 11):
+            self.slicer.tick(now=float(now))
+        self.slicer.add(3, [0], now=10.0)
+        self.slicer.tick(now=11.0)
+        self.slicer.tick(now=12.0)
+        self.slicer.tick(now=13.0)
+        self.assertEqual(self.slicer.shares(now=13.0)[3]['run_time'], 1.0)
+        del self.calls[:]
+        [running] = self.running()
+        self.slicer.remove(running, now=13.5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0][0], 'unpause')
+        self.slicer.remove(self.calls[0][1], now=13.5)
+        self.slicer.remove(self.running()[0], now=13.5)
+        self.assertEqual(self.slicer.slices, {})
+
+    def test_add_paused(self):
+        """Test adding an experiment that is paused"""
+        self.assertTrue(self.slicer.add(1, [0], running=False, now=0.0))
+        self.assertFalse(self.slicer.add(2, [0, 1], running=False, now=0.0))
+        self.assertEqual(self.calls, [('unpause', 1)])
+        self.assertEqual(timeslice.weight_of({'resources': {'weight': 3}}), 3.0)
+        self.assertEqual(timeslice.weight_of({}), 1.0)
@@ -0,0 +1,159 @@
+"""
+Tests for unix_rpc.py
+"""
+import unittest
+import uuid
+import os
+import select
+import threading
+import time
+import array
+
+import codec
+import unix_rpc
+
+class TestUnixRPC(unittest.TestCase):
+    """Test corresponding to unix_rpc.py"""
+    server_class = unix_rpc.Server
+    socket_path = '/tmp/test.%s.sock' % str(uuid.uuid4())
+
+    @classmethod
+    def setUpClass(cls):
+        server = cls.server_class(cls.socket_path)
+        server.register('add', lambda a, b: a + b)
+        server.register('echo', lambda value=None: value)
+        server.register('fail', lambda: 1 / 0)
+        server.register('sleep', time.sleep, blocking=True)
+        cls.ticks = []
+        server.call_every(0.01, lambda: cls.ticks.append(time.time()))
+        server.register('ticks', lambda: len(cls.ticks))
+
+        def push_back(conn, count):
+            for i in range(count):
+                conn.push('pushed', i)
+        server.register('push_back', push_back, pass_connection=True)
+
+        def push_large(conn, count, size):
+            for _ in range(count):
+                conn.push('pushed', 'x' * size)
+        server.register('push_large', push_large, pass_connection=True)
+        thread = threading.Thread(target=server.start, daemon=True)
+        thread.start()
+        while not os.path.exists(cls.socket_path):
+            time.sleep(0.01)
+
+    def setUp(self):
+        self.client = unix_rpc.Client(self.socket_path)
+
+    def test_call(self):
+        """Test a synchronous call and its error cases"""
+        self.assertEqual(self.client.add(1, 2), 3)
+        self.assertEqual(self.client.echo(value='x'), 'x')
+        self.assertRaises(unix_rpc.UnknownRPCError, self.client.missing)
+        self.assertRaises(unix_rpc.RPCError, self.client.fail)
+
+    def test_pipelined_calls(self):
+        """Test that many calls can be in flight at once"""
+        futures = [self.client.add.call_async(i, i) for i in range(100)]
+        self.assertEqual(self.client.add(1, 1), 2)
+        self.client.wait(futures)
+        self.assertEqual([f.result() for f in futures], [2 * i for i in range(100)])
+
+    def test_batch(self):
+        """Test sending several calls in one frame"""
+        futures = self.client.batch([
+            ('add', [1, 2], {}),
+            ('fail', [], {}),
+            ('echo', [], {'value': 'y'})])
+        self.client.wait()
+        self.assertEqual(futures[0].result(), 3)
+        self.assertRaises(unix_rpc.RPCError, futures[1].result)
+        self.assertEqual(futures[2].result(), 'y')
+
+    def test_notify(self):
+        """Test that notifications get no reply"""
+        self.client.echo.notify('ignored')
+        self.assertEqual(self.client.echo(value=1), 1)
+
+    def test_call_every(self):
+        """Test that periodic callbacks run"""
+        ticks = self.client.ticks()
+        time.sleep(0.1)
+        self.assertGreater(self.client.ticks(), ticks)
+
+    def test_push(self):
+        """Test that the server can push calls to the client"""
+        pushed = []
+        client = unix_rpc.Client(self.socket_path, handlers={'pushed': pushed.append})
+        self.assertIsNone(client.push_back(3))
+        while len(pushed) < 3:
+            client.handle_message()
+        self.assertEqual(pushed, [0, 1, 2])
+        client.close()
+
+    def test_slow_reader(self):
+        """Test that a client that doesn't read what is pushed to it doesn't
+        hold up the others"""
+        slow = unix_rpc.Client(self.socket_path)
+        slow.push_large.notify(64, 256 * 1024)
+        time.sleep(0.2)
+        future = self.client.add.call_async(1, 2)
+        (readable, _, _) = select.select([self.client], [], [], 2)
+        slow.close()
+        self.assertEqual(readable, [self.client])
+        self.client.wait([future])
+        self.assertEqual(future.result(), 3)
+
+    def test_push_queue_drops_oldest(self):
+        """Test that a full push queue drops the oldest calls"""
+        conn = unix_rpc.Connection(max_queued=2)
+        for i in range(5):
+            conn.push('pushed', i)
+        self.assertEqual([msg[3] for msg in conn.queue], [[3], [4]])
+        self.assertEqual(conn.dropped, 3)
+        closed = []
+        conn.on_close(lambda: closed.append(True))
+        conn.closing()
+        self.assertEqual(closed, [True])
+        self.assertFalse(conn.push('pushed', 5))
+
+    def test_binary_codec(self):
+        """Test that a binary client gets binary replies"""
+        client = unix_rpc.Client(self.socket_path, msg_codec=codec.BINARY)
+        values = array.array('d', range(10))
+        self.assertEqual(client.echo(value=values), values)
+        self.assertEqual(client.add(1, 2), 3)
+        client.close()
+
+    def test_large_frame(self):
+        """Test frames bigger than the receive buffer"""
+        value = 'x' * (3 * 1024 * 1024)
+        self.assertEqual(self.client.echo(value=value), value)
+
+    def tearDown(self):
+        self.client.close()
+
+
+class TestAsyncServer(TestUnixRPC):
+    """Test corresponding to unix_rpc.AsyncServer"""
+    server_class = unix_rpc.AsyncServer
+    socket_path = '/tmp/test.%s.sock' % str(uuid.uuid4())
+
+    def test_blocking_handler(self):
+        """Test that a blocking handler doesn't delay other replies"""
+        slow = self.client.sleep.call_async(0.5)
+        start = time.time()
+        self.assertEqual(self.client.add(1, 2), 3)
+        self.assertLess(time.time() - start, 0.25)
+        self.assertFalse(slow.done())
+        self.client.wait([slow])
+        self.assertIsNone(slow.result())
+
+    def test_concurrent_clients(self):
+        """Test many connections at once"""
+        clients = [unix_rpc.Client(self.socket_path) for _ in range(50)]
+        futures = [client.add.call_async(i, 1) for i, client in enumerate(clients)]
+        for client, future in zip(clients, futures):
+            client.wait([future])
+            self.assertEqual(future.result(), futures.index(future) + 1)
+            client.close()
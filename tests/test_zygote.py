@@ -0,0 +1,23 @@
+"""
+Tests for zygote.py
+"""
+import sys
+import unittest
+
+import zygote
+
+class TestZygote(unittest.TestCase):
+    """Test corresponding to zygote.py"""
+    def test_preload(self):
+        """Test that modules that can't be imported are skipped"""
+        self.assertEqual(zygote.preload(['colorsys', 'no_such_module']), ['colorsys'])
+        self.assertIn('colorsys', sys.modules)
+
+    def test_pool_lifecycle(self):
+        """Test that zygotes are started, and exit when the pool is closed"""
+        pool = zygote.ZygotePool('test.db', '/tmp/sock_path', size=2)
+        pool.start()
+        zygotes = [process for (process, _) in pool.zygotes]
+        self.assertTrue(all(process.is_alive() for process in zygotes))
+        pool.close()
+        self.assertEqual([process.exitcode for process in zygotes], [0, 0])
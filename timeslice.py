@@ -0,0 +1,183 @@
+"""Fair-share time slicing of experiments that share cores
+
+With `dlexd --share N`, the scheduler gives each core to up to N experiments
+at once (see scheduler.Limits). The TimeSlicer then lets only one of the
+experiments of a core run at a time: every `quantum` seconds, it pauses and
+unpauses runners (between their steps, see Runner.run) so that each
+experiment gets CPU time in proportion to its weight, e.g.
+{'resources': {'cores': 1, 'weight': 2}} gets twice the time of the weight 1
+experiments it shares its core with. Quanta are long enough (seconds) that a
+runner finds its caches warm, and paused runners keep their state in memory,
+without a checkpoint.
+
+As in a fair-share scheduler, the experiments with the least run time per
+unit of weight go first, as long as none of their cores is taken. An
+experiment that joins starts at the least run time per weight of the ones it
+competes with, so that it doesn't run alone until it has caught up.
+Experiments that aren't pinned to cores aren't time-sliced.
+
+example:
+    slicer = TimeSlicer(pause, unpause, quantum=30)
+    slicer.add(exp_id, [0], weight=1)  # pause(exp_id) if core 0 is taken
+    slicer.tick()                      # every quantum
+    slicer.shares()                    # {exp_id: {'target', 'achieved', ...}}
+    slicer.remove(exp_id)              # unpause(...) the ones that now fit
+"""
+import time
+from typing import Any, Callable, Dict, List, Union # pylint: disable=unused-import
+
+
+def weight_of(hyperparams):
+    # type: (Dict[str, Any]) -> float
+    """The weight an experiment asks for, in its 'resources' hyperparam"""
+    return float(hyperparams.get('resources', {}).get('weight', 1))
+
+
+class Slice(object):
+    """The time an experiment ran for, as seen by a TimeSlicer"""
+    def __init__(self, cores, weight, added, virtual_time):
+        self.cores = set(cores)
+        self.weight = weight
+        self.added = added
+        # the run time divided by the weight, plus where it started
+        self.virtual_time = virtual_time
+        self.run_time = 0.0
+        self.running = False
+        # when `run_time` was last brought up to date
+        self.since = added
+
+
+class TimeSlicer(object):
+    """Pauses and unpauses the experiments that share cores in rotation
+
+    Args:
+        pause: called as pause(exp_id) to pause an experiment
+        unpause: called as unpause(exp_id) to resume it
+        quantum: how long an experiment runs before the others of its
+            cores may take over, in seconds (see `tick`)
+    """
+    def __init__(self, pause, unpause, quantum=30.0):
+        self.pause = pause
+        self.unpause = unpause
+        self.quantum = quantum
+        self.slices = {} # type: Dict[int, Slice]
+
+    def _account(self, now):
+        for piece in self.slices.values():
+            if piece.running:
+                piece.run_time += now - piece.since
+                piece.virtual_time += (now - piece.since) / piece.weight
+            piece.since = now
+
+    def _competitors(self, cores, exp_id=None):
+        return [piece for (other_id, piece) in self.slices.items()
+                if other_id != exp_id and piece.cores & set(cores)]
+
+    def add(self, exp_id, cores, weight=1.0, running=True, now=None): # pylint: disable=too-many-arguments
+        # type: (int, List[int], float, bool, Union[None, float]) -> bool
+        """Time-slice an experiment, which runs on `cores`
+
+        It runs now if none of its cores is taken, and is paused (or stays
+        paused, if not `running`) otherwise.
+
+        Returns:
+            Whether it runs
+        """
+        if now is None:
+            now = time.monotonic()
+        self._account(now)
+        competitors = self._competitors(cores, exp_id)
+        piece = Slice(cores, weight, now, min(
+            [other.virtual_time for other in competitors], default=0.0))
+        piece.running = not any(other.running for other in competitors)
+        self.slices[exp_id] = piece
+        if running and not piece.running:
+            self.pause(exp_id)
+        elif piece.running and not running:
+            self.unpause(exp_id)
+        return piece.running
+
+    def remove(self, exp_id, now=None):
+        # type: (int, Union[None, float]) -> None
+        """Stop time-slicing an experiment (e.g. it ended), and run the ones
+        that now fit"""
+        if now is None:
+            now = time.monotonic()
+        self._account(now)
+        if self.slices.pop(exp_id, None) is None:
+            return
+        (_, started) = self._schedule(preempt=False)
+        for started_id in started:
+            self.unpause(started_id)
+
+    def tick(self, now=None):
+        # type: (Union[None, float]) -> None
+        """Give the cores to the experiments that are furthest behind their
+        share, at the end of a quantum"""
+        if now is None:
+            now = time.monotonic()
+        self._account(now)
+        (stopped, started) = self._schedule(preempt=True)
+        # pause first, so that the cores are free for the started ones
+        for exp_id in stopped:
+            self.pause(exp_id)
+        for exp_id in started:
+            self.unpause(exp_id)
+
+    def _schedule(self, preempt):
+        """Decide which experiments run: with `preempt`, the ones with the
+        least virtual time, else also the running ones
+
+        Returns:
+            (the IDs of the experiments to pause, of the ones to unpause)
+        """
+        taken = set()
+        if not preempt:
+            for piece in self.slices.values():
+                if piece.running:
+                    taken.update(piece.cores)
+        chosen = set()
+        # the running ones first among equals, to switch less
+        for (exp_id, piece) in sorted(
+                self.slices.items(),
+                key=lambda item: (item[1].virtual_time, not item[1].running, item[0])):
+            if (preempt or not piece.running) and not piece.cores & taken:
+                taken.update(piece.cores)
+                chosen.add(exp_id)
+        stopped = []
+        started = []
+        for (exp_id, piece) in sorted(self.slices.items()):
+            if preempt and piece.running and exp_id not in chosen:
+                piece.running = False
+                stopped.append(exp_id)
+            elif exp_id in chosen and not piece.running:
+                piece.running = True
+                started.append(exp_id)
+        return (stopped, started)
+
+    def shares(self, now=None):
+        # type: (Union[None, float]) -> Dict[int, Dict[str, Any]]
+        """The share of time each experiment got since it was added, and the
+        share it is due: its weight over the weight of all the experiments of
+        its busiest core
+
+        Returns:
+            {exp_id: {'target': share, 'achieved': share, 'running': bool,
+                      'run_time': seconds}}
+        """
+        if now is None:
+            now = time.monotonic()
+        self._account(now)
+        core_weights = {} # type: Dict[int, float]
+        for piece in self.slices.values():
+            for core in piece.cores:
+                core_weights[core] = core_weights.get(core, 0.0) + piece.weight
+        shares = {}
+        for (exp_id, piece) in self.slices.items():
+            total = max([core_weights[core] for core in piece.cores], default=piece.weight)
+            shares[exp_id] = {
+                'target': piece.weight / total,
+                'achieved': piece.run_time / (now - piece.added) if now > piece.added else None,
+                'running': piece.running,
+                'run_time': piece.run_time}
+        return shares
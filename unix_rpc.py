@@ -1,35 +1,103 @@
+"""A small RPC protocol over UNIX domain sockets
+
+Every frame is an 8 byte header (protocol version, payload codec, payload
+length) followed by the payload, encoded with one of the codecs in codec.py.
+Requests carry an ID, so a client can have many calls in flight on one socket
+and a server is free to answer them in any order:
+
+    ['rpc', req_id, method, args, kwargs]      a single call
+    ['batch', [[req_id, method, args, kwargs], ...]]
+                                               several calls in one frame
+    ['return', req_id, value]                  a successful reply
+    ['error', req_id, message]                 a failed reply
+    ['replies', [[msg_type, req_id, value], ...]]
+                                               the replies to a batch
+
+A request whose ID is None is a notification and never gets a reply. Replies
+are encoded with the codec the request was encoded with.
+
+Servers can also push notifications to a client, which the client serves
+with its `handlers`, on connections kept by functions registered with
+`pass_connection=True` (see Connection).
+"""
+import collections
+import functools
 import socket
 import select
+import selectors
 import struct
-import json
 import os
+import itertools
+import time
 
-RPC_VERSION = 1
+import codec
 
-def msg_send(sock, msg):
-    j = json.dumps(msg)
-    header = struct.pack('!LL', RPC_VERSION, len(j))
-    sock.sendall(b'%b%b' % (header, j.encode('utf-8')))
+# asyncio, concurrent.futures and traceback are imported where they are used,
+# by servers, so that a CLI making a few calls doesn't pay for importing them
 
-def msg_recv(sock):
-    buff = sock.recv(1024)
-    if buff == b'':
-        return None
+RPC_VERSION = 3
+
+HEADER = struct.Struct('!HHL')
 
-    while len(buff) < 8:
-        buff += sock.recv(1024)
+# payloads at least this large are sent without copying them behind the header
+_SEPARATE_SEND_MIN = 65536
 
-    (version, length) = struct.unpack('!LL', buff[0:8])
-    assert RPC_VERSION == version
+def _frame(msg, msg_codec):
+    # type: (Any, Any) -> Tuple[bytes, bytes]
+    """Encode `msg` and return the (header, payload) of its frame."""
+    payload = msg_codec.encode(msg)
+    return (HEADER.pack(RPC_VERSION, msg_codec.codec_id, len(payload)), payload)
 
-    buff = buff[8:]
+def msg_send(sock, msg, msg_codec=codec.JSON):
+    (header, payload) = _frame(msg, msg_codec)
+    if len(payload) < _SEPARATE_SEND_MIN:
+        sock.sendall(header + payload)
+    else:
+        sock.sendall(header)
+        sock.sendall(payload)
 
-    while len(buff) < length:
-        buff += sock.recv(1024)
+class FrameReader(object):
+    """Reads frames from a socket into a reusable buffer
 
-    assert len(buff) == length
+    Frames are read with `recv_into` straight into a preallocated bytearray,
+    which only grows (by doubling) when a frame doesn't fit. `codec` is the
+    codec of the last frame read, which is the one to reply with.
+    """
+    def __init__(self, sock, size=65536):
+        self.sock = sock
+        self.buff = bytearray(size)
+        self.view = memoryview(self.buff)
+        self.codec = codec.JSON
+
+    def _fill(self, length):
+        # type: (int) -> bool
+        """Read exactly `length` bytes into the start of the buffer."""
+        if length > len(self.buff):
+            self.view.release()
+            self.buff = bytearray(max(length, 2 * len(self.buff)))
+            self.view = memoryview(self.buff)
+        received = 0
+        while received < length:
+            count = self.sock.recv_into(self.view[received:length])
+            if count == 0:
+                return False
+            received += count
+        return True
+
+    def read(self):
+        # type: () -> Any
+        """Read one message, or return None if the peer closed the socket."""
+        if not self._fill(HEADER.size):
+            return None
+        (version, codec_id, length) = HEADER.unpack_from(self.buff)
+        assert RPC_VERSION == version
+        if not self._fill(length):
+            return None
+        self.codec = codec.CODECS[codec_id]
+        return self.codec.decode(self.view[:length])
 
-    return json.loads(buff.decode('utf-8'))
+def msg_recv(sock):
+    return FrameReader(sock, 1024).read()
 
 class UnknownRPCError(Exception):
     pass
@@ -37,63 +105,258 @@ class UnknownRPCError(Exception):
 class RPCError(Exception):
     pass
 
+class Reply(object):
+    """The reply to an asynchronous call, resolved by the Client that made it
+
+    It has the done/result/exception interface of concurrent.futures.Future,
+    but as a Client is only used from one thread, `result` doesn't wait: it
+    raises RPCError if the reply hasn't been read yet (see Client.wait).
+    """
+    __slots__ = ['_done', '_value', '_error']
+
+    def __init__(self):
+        self._done = False
+        self._value = None
+        self._error = None
+
+    def done(self):
+        # type: () -> bool
+        return self._done
+
+    def set_result(self, value):
+        self._value = value
+        self._done = True
+
+    def set_exception(self, error):
+        self._error = error
+        self._done = True
+
+    def exception(self):
+        if not self._done:
+            raise RPCError('no reply yet')
+        return self._error
+
+    def result(self):
+        if self.exception() is not None:
+            raise self._error
+        return self._value
+
+def _error(message):
+    """Build the exception corresponding to an 'error' reply."""
+    if message == 'UnknownRPCError':
+        return UnknownRPCError()
+    return RPCError(message)
+
+class _WithConnection(object):
+    """A function registered with pass_connection=True"""
+    def __init__(self, function):
+        self.function = function
+
+def _dispatch(funs, method, args, kwargs, connection=None):
+    """Run `method` from `funs` and return a (msg_type, value) reply pair."""
+    if method not in funs:
+        return ('error', 'UnknownRPCError')
+    fun = funs[method]
+    try:
+        if isinstance(fun, _WithConnection):
+            return ('return', fun.function(connection, *args, **kwargs))
+        return ('return', fun(*args, **kwargs))
+    except Exception as e: # pylint: disable=broad-except
+        return ('error', str(e))
+
+def _handle_request(funs, conn, msg, msg_codec=codec.JSON, connection=None):
+    """Serve one 'rpc' or 'batch' request frame received on `conn`."""
+    msg_type = msg[0]
+    if msg_type == 'rpc':
+        [_, req_id, method, args, kwargs] = msg
+        (reply_type, value) = _dispatch(funs, method, args, kwargs, connection)
+        if req_id is not None:
+            msg_send(conn, [reply_type, req_id, value], msg_codec)
+    elif msg_type == 'batch':
+        replies = []
+        for [req_id, method, args, kwargs] in msg[1]:
+            (reply_type, value) = _dispatch(funs, method, args, kwargs, connection)
+            if req_id is not None:
+                replies.append([reply_type, req_id, value])
+        if replies != []:
+            msg_send(conn, ['replies', replies], msg_codec)
+    else:
+        raise AssertionError('unexpected message type %s' % msg_type)
+
 class RPC(object):
-    def __init__(self, sock, method):
-        self.sock = sock
+    def __init__(self, client, method):
+        self.client = client
         self.method = method
 
     def __call__(self, *args, **kwargs):
-        msg_send(self.sock, ['rpc', self.method, args, kwargs])
-        [msg_type, msg] = msg_recv(self.sock)
-        assert msg_type in ['return', 'error']
-        if msg_type == 'error':
-            if msg == 'UnknownRPCError':
-                raise UnknownRPCError
-            raise RPCError(msg)
+        return self.client.call(self.method, *args, **kwargs)
+
+    def call_async(self, *args, **kwargs):
+        """Send the call without waiting. Returns a Reply."""
+        return self.client.call_async(self.method, *args, **kwargs)
 
-        return msg
+    def notify(self, *args, **kwargs):
+        """Send the call without asking for a reply."""
+        self.client.notify(self.method, *args, **kwargs)
 
 
+class Connection(object):
+    """The server side of a client connection
+
+    A function registered with `pass_connection=True` is passed the caller's
+    Connection as its first argument, and may keep it to `push` calls to that
+    client later. Pushed calls wait in a queue until the socket can take
+    them. The queue holds at most `max_queued` calls: when a client reads too
+    slowly, the oldest queued calls are dropped (and counted in `dropped`).
+    """
+    def __init__(self, max_queued=1024):
+        self.queue = collections.deque(maxlen=max_queued)
+        self.dropped = 0
+        self.closed = False
+        self.close_callbacks = []
+
+    def push(self, method, *args, **kwargs):
+        # type: (str, *Any, **Any) -> bool
+        """Queue a notification to the client. Returns False if the
+        connection is closed."""
+        if self.closed:
+            return False
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(['rpc', None, method, list(args), kwargs])
+        self.wakeup()
+        return True
+
+    def on_close(self, callback):
+        """Call `callback` once the client has disconnected."""
+        self.close_callbacks.append(callback)
+
+    def wakeup(self):
+        """Called after a call was queued."""
+        pass
+
+    def closing(self):
+        self.closed = True
+        self.queue.clear()
+        for callback in self.close_callbacks:
+            _run_callback(callback)
+
+class _SelectConnection(Connection):
+    def __init__(self, sock, write_limit, max_queued):
+        super(_SelectConnection, self).__init__(max_queued)
+        self.sock = sock
+        self.reader = FrameReader(sock)
+        self.write_limit = write_limit
+        # what the socket hasn't taken yet, e.g. the rest of a frame
+        self.output = bytearray()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def sendall(self, data):
+        """Send `data` (replies, see msg_send) after the buffered output,
+        as far as the socket takes it without blocking."""
+        self.output += data
+        self.send()
+
+    def send(self):
+        """Send the buffered output until the socket would block."""
+        while self.output:
+            try:
+                sent = self.sock.send(self.output, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.output.clear()
+                raise
+            del self.output[:sent]
+
+    def flush(self):
+        """Buffer queued calls up to `write_limit` bytes, and send what the
+        socket takes; it is writable."""
+        while self.queue and len(self.output) < self.write_limit:
+            for part in _frame(self.queue.popleft(), self.reader.codec):
+                self.output += part
+        self.send()
+
+    def writing(self):
+        return bool(self.queue or self.output)
+
 class Server(object):
-    def __init__(self, path):
+    """A single-threaded select loop server
+
+    Every registered function runs inline in the loop; see AsyncServer for a
+    server that can run blocking functions on a thread pool. Replies and
+    pushed calls are sent without blocking the loop: what a connection's
+    socket doesn't take is buffered, and a connection whose buffer grows
+    past `write_limit` bytes isn't read from again until the peer has caught
+    up.
+    """
+    def __init__(self, path, backlog=1, max_queued=1024, write_limit=1024 * 1024):
         self.path = path
         self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.socket.bind(self.path)
-        self.socket.listen(1)
+        self.socket.listen(backlog)
+        self.max_queued = max_queued
+        self.write_limit = write_limit
         self.funs = {}
+        self.timers = []
+
+    def register(self, name, function, blocking=False, pass_connection=False): # pylint: disable=unused-argument
+        """Register `function` as RPC `name`. `blocking` is ignored: every
+        function runs inline. If `pass_connection` is True, `function` gets
+        the caller's Connection as its first argument."""
+        self.funs[name] = _WithConnection(function) if pass_connection else function
+
+    def call_every(self, interval, function):
+        """Call `function` from the server loop every `interval` seconds."""
+        self.timers.append([time.monotonic() + interval, interval, function])
 
-    def register(self, name, function):
-        self.funs[name] = function
+    def _run_timers(self):
+        now = time.monotonic()
+        for timer in self.timers:
+            if timer[0] <= now:
+                _run_callback(timer[2])
+                timer[0] = max(timer[0] + timer[1], now)
+
+    def _timeout(self):
+        if self.timers == []:
+            return None
+        return max(0, min(timer[0] for timer in self.timers) - time.monotonic())
 
     def start(self):
         try:
-            conns = [self.socket]
+            conns = []
             while True:
-                readable, _, _ = select.select(conns, [], [])
+                reading = [conn for conn in conns if len(conn.output) < self.write_limit]
+                writing = [conn for conn in conns if conn.writing()]
+                readable, writable, _ = select.select(
+                    [self.socket] + reading, writing, [], self._timeout())
+                self._run_timers()
+                for conn in writable:
+                    try:
+                        conn.flush()
+                    except OSError:
+                        pass
                 if self.socket in readable:
-                    conn, _ = self.socket.accept()
-                    conns.append(conn)
+                    sock, _ = self.socket.accept()
+                    conns.append(_SelectConnection(sock, self.write_limit, self.max_queued))
                     readable.remove(self.socket)
                 for conn in readable:
-                    msg = msg_recv(conn)
+                    try:
+                        msg = conn.reader.read()
+                    except ConnectionResetError:
+                        # it closed without reading what was sent to it
+                        msg = None
                     if msg is None:
-                        conn.close()
+                        conn.sock.close()
                         conns.remove(conn)
+                        conn.closing()
                         continue
-                    else:
-                        [msg_type, method, args, kwargs] = msg
-                    assert msg_type == 'rpc'
-                    if method not in self.funs:
-                        msg_send(conn, ['error', 'UnknownRPCError'])
-                    else:
-                        try:
-                            ret = self.funs[method](*args, **kwargs)
-                            msg_send(conn, ['return', ret])
-                        except Exception as e:
-                            try:
-                                msg_send(conn, ['error', str(e)])
-                            except:
-                                pass
+                    try:
+                        _handle_request(self.funs, conn, msg, conn.reader.codec, conn)
+                    except OSError:
+                        pass
         finally:
             try:
                 if os.path.exists(self.path):
@@ -101,34 +364,304 @@ class Server(object):
             except: # pylint: disable=bare-except
                 pass
 
+def _run_callback(function):
+    """Run a timer or close callback; an error must not take the server down."""
+    try:
+        function()
+    except Exception: # pylint: disable=broad-except
+        import traceback # pylint: disable=import-outside-toplevel
+        traceback.print_exc()
+
+def _new_event_loop():
+    """Create an event loop, on epoll where the platform has it."""
+    import asyncio # pylint: disable=import-outside-toplevel
+    if hasattr(selectors, 'EpollSelector'):
+        return asyncio.SelectorEventLoop(selectors.EpollSelector())
+    return asyncio.new_event_loop()
+
+class _AsyncConnection(Connection):
+    def __init__(self, loop, writer, write_limit, max_queued):
+        super(_AsyncConnection, self).__init__(max_queued)
+        self.loop = loop
+        self.writer = writer
+        self.write_limit = write_limit
+        self.codec = codec.JSON
+        self.flushing = False
+
+    def wakeup(self):
+        # pushes may come from worker threads
+        if not self.flushing:
+            self.flushing = True
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        self.flushing = False
+        transport = self.writer.transport
+        while self.queue and not self.writer.is_closing():
+            if transport.get_write_buffer_size() > self.write_limit:
+                # the queue keeps dropping its oldest calls meanwhile
+                self.flushing = True
+                self.loop.create_task(self.__drain())
+                return
+            self.writer.writelines(_frame(self.queue.popleft(), self.codec))
+
+    async def __drain(self):
+        try:
+            await self.writer.drain()
+        except (ConnectionError, OSError):
+            return
+        self.flush()
+
+class AsyncServer(object):
+    """An asyncio server, with the same interface as Server
+
+    Connections are served concurrently. Functions registered with
+    `blocking=True` run on a thread pool of `workers` threads, so a slow call
+    only delays its own reply; replies go out as they become ready, in any
+    order. Each connection's replies are buffered by its transport, and a
+    connection whose buffer grows past `write_limit` bytes isn't read from
+    again until the peer has caught up.
+    """
+    def __init__(self, path, backlog=128, workers=None, write_limit=1024 * 1024, # pylint: disable=too-many-arguments
+                 max_queued=1024):
+        self.path = path
+        self.backlog = backlog
+        self.write_limit = write_limit
+        self.max_queued = max_queued
+        self.funs = {}
+        self.blocking = set()
+        from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.timers = []
+        self.loop = None
+
+    def register(self, name, function, blocking=False, pass_connection=False):
+        """Register `function` as RPC `name`. If `blocking` is True, it is
+        run on the thread pool instead of the event loop. If
+        `pass_connection` is True, it gets the caller's Connection as its
+        first argument."""
+        self.funs[name] = _WithConnection(function) if pass_connection else function
+        if blocking:
+            self.blocking.add(name)
+        else:
+            self.blocking.discard(name)
+
+    def call_every(self, interval, function):
+        """Call `function` from the event loop every `interval` seconds."""
+        self.timers.append((interval, function))
+
+    def __schedule(self, interval, function):
+        def tick():
+            _run_callback(function)
+            self.loop.call_later(interval, tick)
+        self.loop.call_later(interval, tick)
+
+    def start(self):
+        import asyncio # pylint: disable=import-outside-toplevel
+        self.loop = _new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        for (interval, function) in self.timers:
+            self.__schedule(interval, function)
+        try:
+            self.loop.run_until_complete(self.__serve())
+        finally:
+            try:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            except: # pylint: disable=bare-except
+                pass
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+    async def __serve(self):
+        import asyncio # pylint: disable=import-outside-toplevel
+        server = await asyncio.start_unix_server(
+            self.__handle_connection, path=self.path, backlog=self.backlog)
+        async with server:
+            await server.serve_forever()
+
+    async def __handle_connection(self, reader, writer):
+        import asyncio # pylint: disable=import-outside-toplevel
+        writer.transport.set_write_buffer_limits(high=self.write_limit)
+        conn = _AsyncConnection(self.loop, writer, self.write_limit, self.max_queued)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                    (version, codec_id, length) = HEADER.unpack(header)
+                    assert RPC_VERSION == version
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+                msg_codec = codec.CODECS[codec_id]
+                conn.codec = msg_codec
+                self.__handle_request(conn, msg_codec.decode(payload), msg_codec)
+                if writer.transport.get_write_buffer_size() > self.write_limit:
+                    await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.closing()
+            writer.close()
+
+    def __handle_request(self, conn, msg, msg_codec):
+        writer = conn.writer
+        msg_type = msg[0]
+        if msg_type == 'rpc':
+            [_, req_id, method, args, kwargs] = msg
+            if method in self.blocking:
+                self.loop.create_task(
+                    self.__reply_blocking(conn, msg_codec, req_id, method, args, kwargs))
+            else:
+                (reply_type, value) = _dispatch(self.funs, method, args, kwargs, conn)
+                self.__write(writer, msg_codec, req_id, reply_type, value)
+        elif msg_type == 'batch':
+            self.loop.create_task(self.__reply_batch(conn, msg_codec, msg[1]))
+        else:
+            raise AssertionError('unexpected message type %s' % msg_type)
+
+    async def __call(self, conn, method, args, kwargs):
+        if method not in self.blocking:
+            return _dispatch(self.funs, method, args, kwargs, conn)
+        call = functools.partial(_dispatch, self.funs, method, args, kwargs, conn)
+        return await self.loop.run_in_executor(self.executor, call)
+
+    async def __reply_blocking(self, conn, msg_codec, req_id, method, args, kwargs): # pylint: disable=too-many-arguments
+        (reply_type, value) = await self.__call(conn, method, args, kwargs)
+        self.__write(conn.writer, msg_codec, req_id, reply_type, value)
+
+    async def __reply_batch(self, conn, msg_codec, requests):
+        import asyncio # pylint: disable=import-outside-toplevel
+        writer = conn.writer
+        results = await asyncio.gather(*[
+            self.__call(conn, method, args, kwargs)
+            for [_, method, args, kwargs] in requests])
+        replies = [
+            [reply_type, req_id, value]
+            for ([req_id, _, _, _], (reply_type, value)) in zip(requests, results)
+            if req_id is not None]
+        if replies != [] and not writer.is_closing():
+            writer.writelines(_frame(['replies', replies], msg_codec))
+
+    @staticmethod
+    def __write(writer, msg_codec, req_id, reply_type, value): # pylint: disable=too-many-arguments
+        if req_id is not None and not writer.is_closing():
+            writer.writelines(_frame([reply_type, req_id, value], msg_codec))
+
 class Client(object):
-    """A select-able client for Server"""
-    def __init__(self, path, handlers={}):
-        self.handlers = handlers
+    """A select-able client for Server
+
+    Calls can be made synchronously (`client.method(*args)`), asynchronously
+    (`client.method.call_async(*args)` returns a Reply), or several at a
+    time in a single frame with `batch`. Replies to asynchronous calls are
+    read by `handle_message`, so a client used from a select loop should call
+    it whenever its socket is readable.
+
+    `msg_codec` is the codec requests are encoded with (see codec.py).
+    """
+    def __init__(self, path, handlers=None, msg_codec=codec.JSON):
+        self.handlers = handlers if handlers is not None else {}
+        self.codec = msg_codec
         self.__path = path
         self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.__socket.connect(self.__path)
+        self.__reader = FrameReader(self.__socket)
+        self.__ids = itertools.count()
+        self.__pending = {}
 
     def __getattr__(self, method):
-        return RPC(self.__socket, method)
+        return RPC(self, method)
 
     def fileno(self):
         return self.__socket.fileno()
 
+    def call(self, method, *args, **kwargs):
+        """Call `method` and wait for its reply."""
+        future = self.call_async(method, *args, **kwargs)
+        self.wait([future])
+        return future.result()
+
+    def call_async(self, method, *args, **kwargs):
+        # type: (str, *Any, **Any) -> Reply
+        """Send a call without waiting for the reply.
+
+        Returns:
+            A Reply that is resolved once the reply has been read by
+            `handle_message` (or by any later synchronous call).
+        """
+        req_id = next(self.__ids)
+        future = Reply()
+        self.__pending[req_id] = future
+        msg_send(self.__socket, ['rpc', req_id, method, args, kwargs], self.codec)
+        return future
+
+    def notify(self, method, *args, **kwargs):
+        """Send a call for which the server sends no reply."""
+        msg_send(self.__socket, ['rpc', None, method, args, kwargs], self.codec)
+
+    def batch(self, calls):
+        # type: (List[Tuple[str, List[Any], Dict[str, Any]]]) -> List[Reply]
+        """Send several calls in one frame.
+
+        Args:
+            calls: a list of (method, args, kwargs) tuples
+
+        Returns:
+            A list of Replies, one per call, in the order of `calls`
+        """
+        futures = []
+        requests = []
+        for (method, args, kwargs) in calls:
+            req_id = next(self.__ids)
+            future = Reply()
+            self.__pending[req_id] = future
+            futures.append(future)
+            requests.append([req_id, method, list(args), kwargs])
+        msg_send(self.__socket, ['batch', requests], self.codec)
+        return futures
+
+    def wait(self, futures=None):
+        """Read replies until every future in `futures` (default: all
+        outstanding calls) is resolved."""
+        if futures is None:
+            futures = list(self.__pending.values())
+        while not all(future.done() for future in futures):
+            if not self.handle_message():
+                break
+
+    def __resolve(self, msg_type, req_id, value):
+        future = self.__pending.pop(req_id, None)
+        if future is None:
+            return
+        if msg_type == 'return':
+            future.set_result(value)
+        else:
+            future.set_exception(_error(value))
+
     def handle_message(self):
-        [msg_type, method, args, kwargs] = msg_recv(self.__socket)
-        assert msg_type == 'rpc'
-        if method not in self.handlers:
-            msg_send(self.__socket, ['error', 'UnknownRPCError'])
+        # type: () -> bool
+        """Read and handle one message from the server.
+
+        Returns:
+            False if the server closed the connection, True otherwise
+        """
+        msg = self.__reader.read()
+        if msg is None:
+            for future in self.__pending.values():
+                future.set_exception(RPCError('connection closed'))
+            self.__pending.clear()
+            return False
+
+        msg_type = msg[0]
+        if msg_type in ['return', 'error']:
+            [_, req_id, value] = msg
+            self.__resolve(msg_type, req_id, value)
+        elif msg_type == 'replies':
+            for [reply_type, req_id, value] in msg[1]:
+                self.__resolve(reply_type, req_id, value)
         else:
-            try:
-                ret = self.handlers[method](*args, **kwargs)
-                msg_send(self.__socket, ['return', ret])
-            except Exception as e:
-                try:
-                    msg_send(self.__socket, ['error', str(e)])
-                except:
-                    pass
+            _handle_request(self.handlers, self.__socket, msg, self.__reader.codec)
+        return True
 
     def close(self):
         self.__socket.close()
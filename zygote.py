@@ -0,0 +1,158 @@
+"""A pool of warm processes to start experiments from
+
+Starting an experiment with a Spawner forks dlexd, and the runner then
+imports the experiment's definition, and with it whatever frameworks it
+uses, which can take seconds (e.g. torch). A Zygote is a process forked from
+dlexd at startup, before dlexd starts any thread, which imports a `preload`
+list of modules once. Each experiment is then started by forking a zygote, so
+the runner finds those modules already imported, and shares their memory
+with the zygote copy-on-write.
+
+example:
+    pool = ZygotePool('test.db', '/tmp/sock_path', preload=['numpy', 'torch'])
+    pool.start()
+    pool.launch(exp_id, cores)     # instead of Spawner(...).start()
+    pool.close()
+"""
+import gc
+import importlib
+import multiprocessing
+import os
+import threading
+import traceback
+from typing import Any, List, Tuple, Union # pylint: disable=unused-import
+
+import spawner
+
+
+def preload(modules):
+    # type: (List[str]) -> List[str]
+    """Import `modules`, skipping those that can't be imported.
+
+    Returns:
+        The modules that were imported
+    """
+    imported = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            imported.append(name)
+        except Exception: # pylint: disable=broad-except
+            print('zygote: failed to preload %s' % name)
+            traceback.print_exc()
+    return imported
+
+
+class Zygote(multiprocessing.Process):
+    """A process that forks experiments' runners
+
+    It reads (exp_id, cores) requests from `conn` and, for each one, forks a
+    process that starts the experiment (see spawner.start_runner). That
+    process is double-forked, as a Spawner's is, so that it isn't a child of
+    the zygote, and whether it was forked is sent back.
+
+    The zygote isn't a daemonic process, which couldn't start the Runner
+    processes of experiments; it exits when `conn` is closed. `inherited` are
+    the other ends of the connections to zygotes, which it closes so that it
+    (and the experiments it starts) doesn't keep them open.
+    """
+    def __init__(self, db_path, socket_path, conn, modules=None, inherited=()): # pylint: disable=too-many-arguments
+        self.db_path = db_path
+        self.socket_path = socket_path
+        self.conn = conn
+        self.modules = modules if modules is not None else []
+        self.inherited = inherited
+        super(Zygote, self).__init__(name='Zygote')
+
+    def run(self):
+        for conn in self.inherited:
+            conn.close()
+        preload(self.modules)
+        if hasattr(gc, 'freeze'):
+            # keep the collector from touching (and so copying) the preloaded
+            # objects in every experiment
+            gc.collect()
+            gc.freeze()
+        while True:
+            try:
+                request = self.conn.recv()
+            except EOFError:
+                return
+            if request is None:
+                return
+            (exp_id, cores) = request
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.conn.close()
+                    runner_parent = os.fork()
+                    if runner_parent == 0:
+                        spawner.start_runner(self.db_path, self.socket_path, exp_id, cores)
+                except BaseException: # pylint: disable=broad-except
+                    traceback.print_exc()
+                    os._exit(1) # pylint: disable=protected-access
+                os._exit(0) # pylint: disable=protected-access
+            (_, status) = os.waitpid(pid, 0)
+            self.conn.send(status == 0)
+
+
+class ZygotePool(object):
+    """Zygotes to start experiments from, used in turn
+
+    Args:
+        db_path: the path of the DLEXDB
+        socket_path: the path of dlexd's socket
+        preload: the modules the zygotes import once
+        size: the number of zygotes
+    """
+    def __init__(self, db_path, socket_path, preload=None, size=1): # pylint: disable=redefined-outer-name
+        self.db_path = db_path
+        self.socket_path = socket_path
+        self.preload = preload if preload is not None else []
+        self.size = size
+        self.zygotes = [] # type: List[Tuple[Zygote, Any]]
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def _zygote(self):
+        (conn, zygote_conn) = multiprocessing.Pipe()
+        zygote = Zygote(self.db_path, self.socket_path, zygote_conn, self.preload,
+                        [conn] + [other for (_, other) in self.zygotes])
+        zygote.start()
+        zygote_conn.close()
+        return (zygote, conn)
+
+    def start(self):
+        """Start the zygotes. Call it before starting any thread, as threads
+        don't survive a fork and may leave locks held in the zygotes."""
+        for _ in range(self.size):
+            self.zygotes.append(self._zygote())
+
+    def launch(self, exp_id, cores=None):
+        # type: (int, Union[None, List[int]]) -> bool
+        """Start experiment `exp_id` from the next zygote, replacing the
+        zygote if it died
+
+        Returns:
+            Whether the experiment was started
+        """
+        with self.lock:
+            index = self.next
+            self.next = (self.next + 1) % len(self.zygotes)
+            (zygote, conn) = self.zygotes[index]
+            if not zygote.is_alive():
+                conn.close()
+                zygote.join()
+                # slow, and forked from a process with threads, but it only
+                # happens if a zygote was killed
+                (zygote, conn) = self.zygotes[index] = self._zygote()
+            conn.send((exp_id, cores))
+            return conn.recv()
+
+    def close(self):
+        """Stop the zygotes. Experiments started from them keep running."""
+        with self.lock:
+            for (zygote, conn) in self.zygotes:
+                conn.close()
+                zygote.join()
+            self.zygotes = []